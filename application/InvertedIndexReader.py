@@ -0,0 +1,26 @@
+from abc import ABC, abstractmethod
+from typing import List, Dict, Iterator, Tuple
+
+
+class InvertedIndexReader(ABC):
+
+    @abstractmethod
+    def get_index_by_term(self, term: str) -> List[int]:
+        pass
+
+    @abstractmethod
+    def query(self, expr: str) -> List[int]:
+        pass
+
+    @abstractmethod
+    def get_index_stats(self) -> Dict[str, int]:
+        pass
+
+    @abstractmethod
+    def top_terms(self, limit: int, offset: int = 0) -> List[Tuple[str, int]]:
+        pass
+
+    # (término, postings ordenadas) en orden de término, para exportar el índice completo
+    @abstractmethod
+    def iter_postings(self) -> Iterator[Tuple[str, List[int]]]:
+        pass
@@ -1,18 +1,22 @@
-from abc import ABC, abstractmethod
-from domain.book import Book
-from typing import List, Dict
+from abc import abstractmethod
+from application.InvertedIndexReader import InvertedIndexReader
+from typing import Iterable
 
 
-class InvertedIndexRepository(ABC):
+class InvertedIndexRepository(InvertedIndexReader):
 
     @abstractmethod
     def index_book(self, book: int) -> bool:
         pass
 
     @abstractmethod
-    def get_index_by_term(self, term: str) -> List[int]:
+    def index_books(self, book_ids: Iterable[int]) -> int:
         pass
 
     @abstractmethod
-    def get_index_stats(self) -> Dict[str, int]:
-        pass
\ No newline at end of file
+    def delete_book(self, book_id: int) -> bool:
+        pass
+
+    @abstractmethod
+    def reset_index(self) -> None:
+        pass
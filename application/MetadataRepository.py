@@ -1,8 +1,30 @@
 from abc import ABC, abstractmethod
-from domain.book import Book
+from domain.book import Book, BookPage
+from typing import List, Optional
 
 
 class MetadataRepository(ABC):
     @abstractmethod
     def save_metadata(self, book: Book) -> bool:
-        pass
\ No newline at end of file
+        pass
+
+    @abstractmethod
+    def save_metadata_many(self, books: List[Book]) -> List[Optional[str]]:
+        pass
+
+    @abstractmethod
+    def get_metadata(self, book_id: int) -> Optional[Book]:
+        pass
+
+    @abstractmethod
+    def get_metadata_many(self, book_ids: List[int]) -> List[Book]:
+        pass
+
+    @abstractmethod
+    def find_by_author(self, author: str, language: Optional[str] = None,
+                       cursor: Optional[str] = None, page_size: int = 50) -> BookPage:
+        pass
+
+    @abstractmethod
+    def search_title_prefix(self, prefix: str, cursor: Optional[str] = None, page_size: int = 50) -> BookPage:
+        pass
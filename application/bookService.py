@@ -1,21 +1,55 @@
+from __future__ import annotations
+
+import codecs
+import os
 import requests
 from datetime import datetime
 from pathlib import Path
+from typing import Iterable, Optional, TextIO
 import shutil
 
-from numpy.distutils.conv_template import header
-
 from application.MetadataRepository import MetadataRepository
 from utils.DatalakeDetector import detect_datalake_root
+from utils.DatalakeManifest import DatalakeManifest
+from utils.DatalakePack import PACK_NAME, RecordWriter, append_records, read_location
 from utils.GutenbergHeaderSerializer import GutenbergHeaderSerializer
+from utils.Metrics import METRICS
 
 
-def create_datalake(book_id: int, download_path: str):
-    date = datetime.now().strftime("%Y%m%d")
-    hour = datetime.now().strftime("%H")
+DATALAKE_ROOT = Path("../datalake")
+STREAM_CHUNK_SIZE = 64 * 1024
+# DATALAKE_FORMAT=pack guarda cada hora en un books.pack comprimido (ver utils/DatalakePack)
+DATALAKE_FORMAT = os.environ.get("DATALAKE_FORMAT", "files")
+DATALAKE_CODEC = os.environ.get("DATALAKE_CODEC", "zlib")
+
 
-    datalake_dir = Path(f"../datalake/{date}/{hour}")
+def datalake_hour_dir(datalake_root: str | Path = DATALAKE_ROOT) -> Path:
+    now = datetime.now()
+    datalake_dir = Path(datalake_root) / now.strftime("%Y%m%d") / now.strftime("%H")
     datalake_dir.mkdir(parents=True, exist_ok=True)
+    return datalake_dir
+
+
+def pack_into_datalake(book_id: int, header_src: Path, body_src: Path,
+                       datalake_dir: Path, datalake_root: str | Path = DATALAKE_ROOT) -> None:
+    with RecordWriter(book_id, "header", DATALAKE_CODEC) as header, \
+            RecordWriter(book_id, "body", DATALAKE_CODEC) as body:
+        for src, writer in ((header_src, header), (body_src, body)):
+            with open(src, encoding="utf-8", errors="ignore") as f:
+                for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), ""):
+                    writer.write(chunk)
+        _append_to_pack(datalake_dir, datalake_root, header, body)
+
+
+def _append_to_pack(datalake_dir: Path, datalake_root: str | Path, header: RecordWriter, body: RecordWriter) -> None:
+    pack = datalake_dir / PACK_NAME
+    written = append_records(pack, [header, body])
+    DatalakeManifest.open(datalake_root).record_packed((bid, kind, pack, off, n) for bid, kind, off, n in written)
+
+
+@METRICS.timed("ingest.create_datalake")
+def create_datalake(book_id: int, download_path: str):
+    datalake_dir = datalake_hour_dir(DATALAKE_ROOT)
 
     downloads_dir = Path(download_path)
     body_src = downloads_dir / f"{book_id}_body.txt"
@@ -25,32 +59,41 @@ def create_datalake(book_id: int, download_path: str):
         print(f"Archivos no encontrados en {downloads_dir}")
         return False
 
+    if DATALAKE_FORMAT == "pack":
+        pack_into_datalake(book_id, header_src, body_src, datalake_dir)
+        body_src.unlink()
+        header_src.unlink()
+        print(f"Archivos empaquetados en {(datalake_dir / PACK_NAME).resolve()}")
+        return True
+
     body_dst = datalake_dir / f"{book_id}.body.txt"
     header_dst = datalake_dir / f"{book_id}.header.txt"
 
     shutil.move(str(body_src), str(body_dst))
     shutil.move(str(header_src), str(header_dst))
+    DatalakeManifest.open(DATALAKE_ROOT).record(book_id, header_dst, body_dst)
 
     print(f"Archivos movidos a {datalake_dir.resolve()}")
     return True
 
 
-def download_book(book_id: int, output_path: str):
-    START_MARKER = "*** START OF THE PROJECT GUTENBERG EBOOK"
-    END_MARKER = "*** END OF THE PROJECT GUTENBERG EBOOK"
+GUTENBERG_BASE_URL = "https://www.gutenberg.org"
+START_MARKER = "*** START OF THE PROJECT GUTENBERG EBOOK"
+END_MARKER = "*** END OF THE PROJECT GUTENBERG EBOOK"
 
-    output_path = Path(output_path)
-    output_path.mkdir(parents=True, exist_ok=True)
 
-    url = f"https://www.gutenberg.org/cache/epub/{book_id}/pg{book_id}.txt"
-    response = requests.get(url)
-    response.raise_for_status()
-    text = response.text
+def gutenberg_book_url(book_id: int, base_url: str = GUTENBERG_BASE_URL) -> str:
+    return f"{base_url.rstrip('/')}/cache/epub/{book_id}/pg{book_id}.txt"
+
+
+def write_split_book(book_id: int, text: str, output_path: str | Path) -> bool:
     if START_MARKER not in text or END_MARKER not in text:
         return False
     header, body_and_footer = text.split(START_MARKER, 1)
     body, footer = body_and_footer.split(END_MARKER, 1)
 
+    output_path = Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
     body_path = output_path / f"{book_id}_body.txt"
     header_path = output_path / f"{book_id}_header.txt"
     with open(body_path, "w", encoding="utf-8") as f:
@@ -60,21 +103,140 @@ def download_book(book_id: int, output_path: str):
     return True
 
 
+@METRICS.timed("ingest.download_book", mode="buffered")
+def download_book(
+    book_id: int,
+    output_path: str,
+    session: Optional[requests.Session] = None,
+    base_url: str = GUTENBERG_BASE_URL,
+    timeout: Optional[float | tuple] = None,
+):
+    url = gutenberg_book_url(book_id, base_url)
+    response = (session or requests).get(url, timeout=timeout)
+    response.raise_for_status()
+    return write_split_book(book_id, response.text, output_path)
+
+
+class _StrippedWriter:
+    """Escribe en streaming el equivalente a f.write(text.strip()) sin tener el texto entero en memoria."""
+
+    def __init__(self, f: TextIO) -> None:
+        self.f = f
+        self.started = False
+        self.pending = ""
+
+    def write(self, s: str) -> None:
+        if not self.started:
+            s = s.lstrip()
+            if not s:
+                return
+            self.started = True
+        s = self.pending + s
+        kept = s.rstrip()
+        self.pending = s[len(kept):]
+        if kept:
+            self.f.write(kept)
+
+
+def _split_stream(chunks: Iterable[str], header_out, body_out) -> bool:
+    # Busca START/END_MARKER aunque queden partidos entre dos chunks: se retienen
+    # los últimos len(marker) - 1 caracteres hasta ver el siguiente chunk.
+    writers = (_StrippedWriter(header_out), _StrippedWriter(body_out))
+    markers = (START_MARKER, END_MARKER)
+    phase, carry = 0, ""
+    for chunk in chunks:
+        buf = carry + chunk
+        while phase < 2:
+            idx = buf.find(markers[phase])
+            if idx < 0:
+                break
+            writers[phase].write(buf[:idx])
+            buf = buf[idx + len(markers[phase]):]
+            phase += 1
+        if phase == 2:
+            return True
+        keep = len(markers[phase]) - 1
+        writers[phase].write(buf[:-keep] if len(buf) > keep else "")
+        carry = buf[-keep:] if len(buf) > keep else buf
+    return False
+
+
+@METRICS.timed("ingest.stream_to_datalake")
+def split_stream_to_datalake(
+    book_id: int,
+    chunks: Iterable[str],
+    datalake_root: str | Path = DATALAKE_ROOT,
+) -> bool:
+    datalake_dir = datalake_hour_dir(datalake_root)
+    if DATALAKE_FORMAT == "pack":
+        # Se comprime mientras llega el texto; al pack solo se copia el payload ya comprimido
+        with RecordWriter(book_id, "header", DATALAKE_CODEC) as header, \
+                RecordWriter(book_id, "body", DATALAKE_CODEC) as body:
+            if not _split_stream(chunks, header, body):
+                return False
+            _append_to_pack(datalake_dir, datalake_root, header, body)
+        return True
+
+    header_dst = datalake_dir / f"{book_id}.header.txt"
+    body_dst = datalake_dir / f"{book_id}.body.txt"
+    header_tmp = datalake_dir / f".{book_id}.header.txt.tmp"
+    body_tmp = datalake_dir / f".{book_id}.body.txt.tmp"
+    try:
+        with open(header_tmp, "w", encoding="utf-8") as hf, open(body_tmp, "w", encoding="utf-8") as bf:
+            complete = _split_stream(chunks, hf, bf)
+        if not complete:
+            return False
+        os.replace(body_tmp, body_dst)
+        os.replace(header_tmp, header_dst)
+    finally:
+        for tmp in (header_tmp, body_tmp):
+            if tmp.exists():
+                tmp.unlink()
+
+    DatalakeManifest.open(datalake_root).record(book_id, header_dst, body_dst)
+    return True
+
+
+def iter_response_text(response: requests.Response, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterable[str]:
+    decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+    for raw in response.iter_content(chunk_size=chunk_size):
+        if raw:
+            yield decoder.decode(raw)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def stream_book_to_datalake(
+    book_id: int,
+    datalake_root: str | Path = DATALAKE_ROOT,
+    session: Optional[requests.Session] = None,
+    base_url: str = GUTENBERG_BASE_URL,
+    timeout: Optional[float | tuple] = None,
+) -> bool:
+    url = gutenberg_book_url(book_id, base_url)
+    with (session or requests).get(url, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        return split_stream_to_datalake(book_id, iter_response_text(response), datalake_root)
+
+
 class BookService:
     def __init__(self, metadata_repository: MetadataRepository):
         self.metadata_repository = metadata_repository
 
+    @METRICS.timed("ingest.create_metadata")
     def create_metadata(self, book_id: int):
         download_path = self.find_book_in_datalake(book_id)
-        book_header = GutenbergHeaderSerializer.from_file(download_path["header"])
+        book_header = GutenbergHeaderSerializer.from_text(read_location(download_path["header"]))
         self.metadata_repository.save_metadata(book_header)
 
+    def ensure_metadata(self, book_id: int) -> bool:
+        """Como create_metadata, pero no hace nada si ya están guardados (reintentos tras una caída)."""
+        if self.metadata_repository.get_metadata(book_id) is not None:
+            return False
+        self.create_metadata(book_id)
+        return True
+
     def find_book_in_datalake(self, book_id: int, datalake_root: str = "datalake") -> dict:
         datalake_path = detect_datalake_root()
-        matches = {"header": None, "body": None}
-        for path in datalake_path.rglob(f"{book_id}.*.txt"):
-            if path.name.endswith(".header.txt"):
-                matches["header"] = str(path)
-            elif path.name.endswith(".body.txt"):
-                matches["body"] = str(path)
-        return matches
+        return DatalakeManifest.open(datalake_path).lookup(book_id)
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from application.bookService import (
+    DATALAKE_ROOT,
+    GUTENBERG_BASE_URL,
+    gutenberg_book_url,
+    iter_response_text,
+    split_stream_to_datalake,
+    write_split_book,
+)
+from utils.Metrics import METRICS
+
+
+class HostRateLimiter:
+    """Token bucket por host: como máximo `rate` peticiones/s con ráfagas de `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._state: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host: str) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._state.get(host, [float(self.burst), now])
+                tokens = min(self.burst, tokens + (now - last) * self.rate)
+                if tokens >= 1:
+                    self._state[host] = [tokens - 1, now]
+                    return
+                self._state[host] = [tokens, now]
+                wait = (1 - tokens) / self.rate
+            time.sleep(wait)
+
+
+class DownloadService:
+    """
+    Descarga concurrente de libros de Project Gutenberg.
+
+    Usa una única requests.Session con pool de conexiones compartido entre
+    hilos, limita la concurrencia global y la tasa por host, y reintenta con
+    backoff exponencial (más jitter) ante respuestas 5xx/429, timeouts y
+    errores de conexión. base_url permite apuntar a un servidor local que
+    sirva ficheros con el formato de Gutenberg.
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        base_url: str = GUTENBERG_BASE_URL,
+        max_workers: int = 8,
+        requests_per_second_per_host: float = 5.0,
+        max_retries: int = 3,
+        backoff_seconds: float = 0.5,
+        timeout: float | tuple = (5.0, 30.0),
+        session: Optional[requests.Session] = None,
+    ) -> None:
+        self.base_url = base_url
+        self.max_workers = max(1, int(max_workers))
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self.rate_limiter = HostRateLimiter(requests_per_second_per_host, burst=self.max_workers)
+        self.session = session or self._build_session(self.max_workers)
+
+    @staticmethod
+    def _build_session(pool_size: int) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _request(self, book_id: int, stream: bool = False) -> Optional[requests.Response]:
+        # Devuelve None si el libro no existe (404); los reintentos solo cubren
+        # el establecimiento de la respuesta, no un corte a mitad del cuerpo.
+        url = gutenberg_book_url(book_id, self.base_url)
+        host = urlparse(url).netloc
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire(host)
+            try:
+                response = self.session.get(url, timeout=self.timeout, stream=stream)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                if attempt == self.max_retries:
+                    raise
+                METRICS.inc("download.retries", reason=e.__class__.__name__)
+                print(f"[DOWNLOAD][WARN] {book_id}: {e.__class__.__name__}, reintento {attempt + 1}")
+            else:
+                if response.status_code not in self.RETRY_STATUS:
+                    if response.status_code == 404:
+                        response.close()
+                        return None
+                    response.raise_for_status()
+                    return response
+                response.close()
+                if attempt == self.max_retries:
+                    response.raise_for_status()
+                METRICS.inc("download.retries", reason=str(response.status_code))
+                print(f"[DOWNLOAD][WARN] {book_id}: HTTP {response.status_code}, reintento {attempt + 1}")
+            time.sleep(self.backoff_seconds * (2 ** attempt) * (1 + random.random()))
+        return None
+
+    def fetch_text(self, book_id: int) -> Optional[str]:
+        response = self._request(book_id)
+        return response.text if response is not None else None
+
+    @METRICS.timed("ingest.download_book", mode="buffered")
+    def download_book(self, book_id: int, output_path: str | Path) -> bool:
+        text = self.fetch_text(book_id)
+        if text is None:
+            return False
+        return write_split_book(book_id, text, output_path)
+
+    def open_stream(self, book_id: int) -> Optional[requests.Response]:
+        # Respuesta abierta en modo stream; quien la consuma debe cerrarla.
+        return self._request(book_id, stream=True)
+
+    @METRICS.timed("ingest.download_book", mode="stream")
+    def stream_book(self, book_id: int, datalake_root: str | Path = DATALAKE_ROOT) -> bool:
+        response = self.open_stream(book_id)
+        if response is None:
+            return False
+        with response:
+            return split_stream_to_datalake(book_id, iter_response_text(response), datalake_root)
+
+    def download_many(self, book_ids: Iterable[int], output_path: str | Path) -> Dict[int, bool]:
+        return self._run_many(book_ids, lambda bid: self.download_book(bid, output_path))
+
+    def stream_many(self, book_ids: Iterable[int], datalake_root: str | Path = DATALAKE_ROOT) -> Dict[int, bool]:
+        return self._run_many(book_ids, lambda bid: self.stream_book(bid, datalake_root))
+
+    def _run_many(self, book_ids: Iterable[int], fn: Callable[[int], bool]) -> Dict[int, bool]:
+        results: Dict[int, bool] = {}
+
+        def _task(book_id: int) -> None:
+            try:
+                results[book_id] = fn(book_id)
+            except Exception as e:
+                print(f"[DOWNLOAD][ERROR] Descarga {book_id} falló: {e}")
+                results[book_id] = False
+            METRICS.inc("download.books", result="ok" if results[book_id] else "failed")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            list(pool.map(_task, book_ids))
+        return results
+
+    def close(self) -> None:
+        self.session.close()
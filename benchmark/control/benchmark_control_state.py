@@ -0,0 +1,68 @@
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Tuple
+
+from control.ControlStateStore import ControlStateStore, DOWNLOADED, INDEXING, METADATA_SAVED
+
+DATASET_SIZES = [100, 1000, 5000, 10000, 30000, 50000, 70000]
+TICKS = 200
+CANDIDATES_PER_TICK = 8
+TOTAL_BOOKS = 70000
+
+
+def summarize(elapsed_s: float, n_ops: int) -> Tuple[float, float, float]:
+    total_ms = elapsed_s * 1000.0
+    ops_sec = (n_ops / elapsed_s) if elapsed_s > 0 else float("inf")
+    avg_ms = total_ms / n_ops if n_ops > 0 else 0.0
+    return total_ms, ops_sec, avg_ms
+
+
+def bench_legacy_tick(workdir: Path, n_books: int) -> float:
+    # Tick original: releer ambos .txt, reconstruir los sets y hacer la diferencia
+    downloads = workdir / "downloaded_books.txt"
+    indexings = workdir / "indexed_books.txt"
+    downloads.write_text("".join(f"{i}\n" for i in range(1, n_books + 1)), encoding="utf-8")
+    indexings.write_text("".join(f"{i}\n" for i in range(1, n_books)), encoding="utf-8")
+
+    t0 = time.perf_counter()
+    for _ in range(TICKS):
+        downloaded = set(downloads.read_text(encoding="utf-8").splitlines())
+        indexed = set(indexings.read_text(encoding="utf-8").splitlines())
+        ready_to_index = downloaded - indexed
+        if ready_to_index:
+            ready_to_index.pop()
+        for _ in range(CANDIDATES_PER_TICK):
+            _ = str(random.randint(1, TOTAL_BOOKS)) in downloaded
+    t1 = time.perf_counter()
+    return summarize(t1 - t0, TICKS)[2]
+
+
+def bench_store_tick(workdir: Path, n_books: int) -> float:
+    store = ControlStateStore(workdir / "control_state.sqlite")
+    store.import_many(range(1, n_books), METADATA_SAVED)
+    store.import_many([n_books], DOWNLOADED)
+
+    t0 = time.perf_counter()
+    for _ in range(TICKS):
+        book_id = store.claim_next_to_index()
+        if book_id is not None:
+            store.transition(book_id, INDEXING, DOWNLOADED)
+        for _ in range(CANDIDATES_PER_TICK):
+            store.is_known(random.randint(1, TOTAL_BOOKS))
+    t1 = time.perf_counter()
+    store.close()
+    return summarize(t1 - t0, TICKS)[2]
+
+
+if __name__ == "__main__":
+    print("=" * 52)
+    print(f"{'N_BOOKS':>10} | {'TXT TICK (ms)':>16} | {'STORE TICK (ms)':>16}")
+    print("=" * 52)
+    for n in DATASET_SIZES:
+        with tempfile.TemporaryDirectory() as tmp:
+            legacy_avg = bench_legacy_tick(Path(tmp), n)
+            store_avg = bench_store_tick(Path(tmp), n)
+        print(f"{n:>10} | {legacy_avg:>16.3f} | {store_avg:>16.3f}")
+    print("=" * 52)
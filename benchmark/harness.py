@@ -0,0 +1,346 @@
+"""
+Arnés común de benchmarks para cualquier MetadataRepository o
+InvertedIndexRepository.
+
+Cada operación se calienta (warmup) y después se mide en varias rondas
+(trials), cronometrando cada llamada por separado. El resultado es un JSON
+con p50/p95/p99/max por operación que `compare` contrasta con una línea
+base guardada.
+
+    python -m benchmark.harness run --target metadata --backend sqlite --out results/metadata_sqlite.json
+    python -m benchmark.harness run --target inverted --backend file --out results/inverted_file.json
+    python -m benchmark.harness run --target inverted --backend snapshot --out results/inverted_snapshot.json
+    python -m benchmark.harness run --target metadata --factory mi_paquete.bench:make_repo
+    python -m benchmark.harness compare results/baseline.json results/metadata_sqlite.json --threshold 0.15
+
+--factory acepta `modulo:funcion`; la función se llama con (workdir, datalake_root)
+y devuelve el repositorio a medir.
+"""
+from __future__ import annotations
+
+import argparse
+import importlib
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from application.InvertedIndexReader import InvertedIndexReader
+from application.InvertedIndexRepository import InvertedIndexRepository
+from application.MetadataRepository import MetadataRepository
+from domain.book import Book
+
+RESULTS_VERSION = 1
+MONGO_URI = "mongodb://localhost:27017"
+BENCH_DB = "bench_harness"
+TARGETS = ["metadata", "inverted"]
+BACKENDS = {
+    "metadata": ["mongodb", "sqlite"],
+    "inverted": ["mongodb", "file", "sqlite", "snapshot"],
+}
+N_AUTHORS = 500
+LANGUAGES = ["English", "French", "German", "Spanish"]
+# Métrica usada por compare y diferencia mínima para no marcar ruido de microsegundos
+COMPARE_METRIC = "p95_ms"
+MIN_DELTA_MS = 0.05
+
+
+@dataclass
+class Operation:
+    name: str
+    fn: Callable[[], Any]
+    iterations: int
+
+
+def percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, int(round(p / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def measure(op: Operation, warmup: int, trials: int) -> Dict[str, Any]:
+    for _ in range(warmup):
+        op.fn()
+    samples: List[float] = []
+    trial_ops: List[float] = []
+    for _ in range(trials):
+        t_trial = time.perf_counter()
+        for _ in range(op.iterations):
+            t0 = time.perf_counter()
+            op.fn()
+            samples.append((time.perf_counter() - t0) * 1000.0)
+        elapsed = time.perf_counter() - t_trial
+        trial_ops.append(op.iterations / elapsed if elapsed > 0 else float("inf"))
+    return {
+        "count": len(samples),
+        "mean_ms": sum(samples) / len(samples) if samples else 0.0,
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "p99_ms": percentile(samples, 99),
+        "max_ms": max(samples) if samples else 0.0,
+        "ops_s": percentile(trial_ops, 50),
+        "trial_ops_s": trial_ops,
+    }
+
+
+def gen_books(start_id: int, n: int) -> List[Book]:
+    return [
+        Book(
+            book_id=start_id + i,
+            title=f"Sample Book {start_id + i}",
+            author=f"Author X{(start_id + i) % N_AUTHORS}",
+            language=LANGUAGES[(start_id + i) % len(LANGUAGES)],
+        )
+        for i in range(n)
+    ]
+
+
+def metadata_operations(repo: MetadataRepository, n_books: int, iterations: int) -> List[Operation]:
+    repo.save_metadata_many(gen_books(1, n_books))
+    next_id = itertools.count(n_books + 1)
+    next_batch = itertools.count((n_books + 1) * 1000, 100)
+    ids = list(range(1, n_books + 1))
+    return [
+        Operation("save_metadata", lambda: repo.save_metadata(gen_books(next(next_id), 1)[0]), iterations),
+        Operation("save_metadata_many_100",
+                  lambda: repo.save_metadata_many(gen_books(next(next_batch), 100)), max(1, iterations // 10)),
+        Operation("get_metadata", lambda: repo.get_metadata(random.choice(ids)), iterations),
+        Operation("get_metadata_many_50", lambda: repo.get_metadata_many(random.sample(ids, min(50, n_books))),
+                  iterations),
+        Operation("find_by_author",
+                  lambda: repo.find_by_author(f"Author X{random.randrange(N_AUTHORS)}", random.choice(LANGUAGES)),
+                  iterations),
+        Operation("search_title_prefix",
+                  lambda: repo.search_title_prefix(f"Sample Book {random.randint(1, 9)}"), iterations),
+    ]
+
+
+def inverted_operations(repo: InvertedIndexRepository, book_ids: List[int], iterations: int) -> List[Operation]:
+    repo.reset_index()
+    repo.index_books(book_ids)
+
+    def reindex() -> None:
+        bid = random.choice(book_ids)
+        repo.delete_book(bid)
+        repo.index_book(bid)
+
+    return inverted_read_operations(repo, iterations) + [Operation("reindex_book", reindex, max(1, iterations // 10))]
+
+
+def inverted_read_operations(repo: InvertedIndexReader, iterations: int) -> List[Operation]:
+    n_terms = repo.get_index_stats()["terms"]
+    if n_terms == 0:
+        raise RuntimeError("El índice quedó vacío: no hay cuerpos de libros en el datalake.")
+    band = max(1, min(200, n_terms // 10))
+    common = [t for t, _ in repo.top_terms(band)]
+    rare = [t for t, _ in repo.top_terms(band, offset=max(0, n_terms - band))] or common
+
+    return [
+        Operation("get_index_by_term_common", lambda: repo.get_index_by_term(random.choice(common)), iterations),
+        Operation("get_index_by_term_rare", lambda: repo.get_index_by_term(random.choice(rare)), iterations),
+        Operation("query_and2",
+                  lambda: repo.query(f"{random.choice(common)} AND {random.choice(rare)}"), iterations),
+        Operation("query_or2",
+                  lambda: repo.query(f"{random.choice(common)} OR {random.choice(common)}"), iterations),
+        Operation("get_index_stats", repo.get_index_stats, iterations),
+        Operation("top_terms_10", lambda: repo.top_terms(10), iterations),
+    ]
+
+
+def snapshot_repo(workdir: Path, datalake_root: Path, book_ids: List[int]):
+    # El snapshot es de solo lectura: se indexa con el backend file y se exporta
+    from infrastructure.InvertedIndexFileRepository import InvertedIndexFileRepository
+    from infrastructure.InvertedIndexSnapshotRepository import InvertedIndexSnapshotRepository
+    source = InvertedIndexFileRepository(index_dir=str(workdir / "index"), datalake_root=str(datalake_root),
+                                         stopwords_path=None, use_stemming=True)
+    try:
+        source.reset_index()
+        source.index_books(book_ids)
+        return InvertedIndexSnapshotRepository.export(source, str(workdir / "snapshot"),
+                                                      stopwords_path=None, use_stemming=True)
+    finally:
+        source.close()
+
+
+def make_repo(target: str, backend: str, workdir: Path, datalake_root: Optional[Path]):
+    if target == "metadata":
+        if backend == "sqlite":
+            from infrastructure.MetadataSQLiteRepository import MetadataSQLiteRepository
+            return MetadataSQLiteRepository(str(workdir / "metadata.sqlite"))
+        from infrastructure.MetadataMongoDBRepository import MetadataMongoDBRepository
+        client = _mongo_client()
+        client[BENCH_DB]["metadata"].delete_many({})
+        return MetadataMongoDBRepository(client, BENCH_DB, "metadata")
+
+    if backend == "snapshot":
+        raise ValueError("El backend snapshot es de solo lectura: constrúyelo con snapshot_repo")
+    common = dict(datalake_root=str(datalake_root), stopwords_path=None, use_stemming=True)
+    if backend == "file":
+        from infrastructure.InvertedIndexFileRepository import InvertedIndexFileRepository
+        return InvertedIndexFileRepository(index_dir=str(workdir / "index"), **common)
+    if backend == "sqlite":
+        from infrastructure.InvertedIndexSQLiteRepository import InvertedIndexSQLiteRepository
+        return InvertedIndexSQLiteRepository(db_path=str(workdir / "index.sqlite"), **common)
+    from infrastructure.InvertedIndexMongoDBRepository import InvertedIndexMongoDBRepository
+    return InvertedIndexMongoDBRepository(uri=MONGO_URI, db_name=BENCH_DB, index_collection="inverted_index",
+                                          client=_mongo_client(), **common)
+
+
+def load_factory(spec: str) -> Callable[..., Any]:
+    module_name, _, attr = spec.partition(":")
+    if not attr:
+        raise ValueError(f"--factory debe tener la forma modulo:funcion, no {spec!r}")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    random.seed(args.seed)
+    datalake_root = None
+    book_ids: List[int] = []
+    if args.target == "inverted":
+        from utils.DatalakeDetector import detect_datalake_root
+        from utils.DatalakeManifest import DatalakeManifest
+        datalake_root = Path(args.datalake) if args.datalake else detect_datalake_root()
+        book_ids = DatalakeManifest.open(datalake_root).book_ids("body")[:args.books]
+        if not book_ids:
+            raise RuntimeError(f"No hay libros en el datalake: {datalake_root}")
+
+    with tempfile.TemporaryDirectory(prefix="bench_") as tmp:
+        workdir = Path(args.workdir) if args.workdir else Path(tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        if args.factory:
+            repo = load_factory(args.factory)(workdir, datalake_root)
+            backend = args.factory
+        elif args.target == "inverted" and args.backend == "snapshot":
+            repo = snapshot_repo(workdir, datalake_root, book_ids)
+            backend = args.backend
+        else:
+            repo = make_repo(args.target, args.backend, workdir, datalake_root)
+            backend = args.backend
+        try:
+            if args.target == "metadata":
+                ops = metadata_operations(repo, args.books, args.iterations)
+            elif not isinstance(repo, InvertedIndexRepository):
+                ops = inverted_read_operations(repo, args.iterations)
+            else:
+                ops = inverted_operations(repo, book_ids, args.iterations)
+            results: Dict[str, Any] = {}
+            for op in ops:
+                if args.only and op.name not in args.only:
+                    continue
+                results[op.name] = measure(op, args.warmup, args.trials)
+                print(_format_row(op.name, results[op.name]))
+        finally:
+            close = getattr(repo, "close", None)
+            if callable(close):
+                close()
+
+    return {
+        "version": RESULTS_VERSION,
+        "target": args.target,
+        "backend": backend,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {
+            "books": len(book_ids) if book_ids else args.books,
+            "warmup": args.warmup,
+            "trials": args.trials,
+            "iterations": args.iterations,
+            "seed": args.seed,
+        },
+        "operations": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float,
+            metric: str = COMPARE_METRIC) -> List[str]:
+    """Imprime la comparación y devuelve las operaciones que empeoran más que threshold (relativo)."""
+    regressions = []
+    base_ops, cur_ops = baseline.get("operations", {}), current.get("operations", {})
+    print(f"{'OPERATION':<28} | {'BASE ' + metric:>14} | {'CURR ' + metric:>14} | {'CHANGE':>9} |")
+    print("=" * 76)
+    for name in sorted(set(base_ops) | set(cur_ops)):
+        if name not in base_ops or name not in cur_ops:
+            print(f"{name:<28} | {'-':>14} | {'-':>14} | {'-':>9} | solo en {'actual' if name in cur_ops else 'base'}")
+            continue
+        base, cur = float(base_ops[name][metric]), float(cur_ops[name][metric])
+        change = (cur - base) / base if base > 0 else 0.0
+        flag = ""
+        if change > threshold and cur - base > MIN_DELTA_MS:
+            regressions.append(name)
+            flag = "REGRESIÓN"
+        print(f"{name:<28} | {base:>14.4f} | {cur:>14.4f} | {change:>+9.1%} | {flag}")
+    return regressions
+
+
+def _mongo_client():
+    from pymongo import MongoClient
+    return MongoClient(MONGO_URI)
+
+
+def _format_row(name: str, r: Dict[str, Any]) -> str:
+    return (f"{name:<28} | p50 {r['p50_ms']:>9.4f} | p95 {r['p95_ms']:>9.4f} | p99 {r['p99_ms']:>9.4f} | "
+            f"max {r['max_ms']:>9.3f} | {r['ops_s']:>10.0f} ops/s")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Arnés de benchmarks de la capa de datos.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="Mide un repositorio y escribe los resultados en JSON.")
+    p_run.add_argument("--target", choices=TARGETS, required=True)
+    p_run.add_argument("--backend", default="sqlite")
+    p_run.add_argument("--factory", help="modulo:funcion que construye el repositorio a medir.")
+    p_run.add_argument("--books", type=int, default=1000)
+    p_run.add_argument("--warmup", type=int, default=20)
+    p_run.add_argument("--trials", type=int, default=5)
+    p_run.add_argument("--iterations", type=int, default=200, help="Llamadas medidas por ronda.")
+    p_run.add_argument("--only", nargs="*", help="Limita la medición a estas operaciones.")
+    p_run.add_argument("--seed", type=int, default=42)
+    p_run.add_argument("--datalake", help="Raíz del datalake (por defecto, autodetectada).")
+    p_run.add_argument("--workdir", help="Directorio para los ficheros del backend (por defecto, temporal).")
+    p_run.add_argument("--out", help="Fichero JSON de salida.")
+
+    p_cmp = sub.add_parser("compare", help="Compara unos resultados con una línea base.")
+    p_cmp.add_argument("baseline")
+    p_cmp.add_argument("current")
+    p_cmp.add_argument("--threshold", type=float, default=0.10)
+    p_cmp.add_argument("--metric", default=COMPARE_METRIC)
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        current = json.loads(Path(args.current).read_text(encoding="utf-8"))
+        regressions = compare(baseline, current, args.threshold, args.metric)
+        if regressions:
+            print(f"[BENCH][WARN] {len(regressions)} regresiones: {', '.join(regressions)}")
+            return 1
+        return 0
+
+    if not args.factory and args.backend not in BACKENDS[args.target]:
+        parser.error(f"--backend debe ser uno de {BACKENDS[args.target]} para {args.target}")
+    results = run(args)
+    if args.out:
+        out = Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"[BENCH] Resultados guardados en {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
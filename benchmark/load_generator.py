@@ -0,0 +1,246 @@
+"""
+Generador de carga concurrente sobre un InvertedIndexRepository compartido.
+
+Los términos se eligen con una distribución Zipf ajustada al ranking de df
+del propio índice (top_terms), de modo que los términos frecuentes se
+consultan mucho más que la cola. Dos modos:
+
+- closed: N hilos lanzan consultas una tras otra durante --duration segundos.
+- open: llegadas de Poisson a --rate consultas/s repartidas entre N hilos. La
+  latencia se mide desde la llegada programada, así que incluye la espera en
+  cola cuando el repositorio no da abasto.
+
+    python -m benchmark.load_generator --backend sqlite --mode closed --concurrency 1 2 4 8 16
+    python -m benchmark.load_generator --backend file --mode open --rate 2000 --concurrency 4 8 --out load.json
+"""
+from __future__ import annotations
+
+import argparse
+import bisect
+import itertools
+import json
+import math
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from application.InvertedIndexReader import InvertedIndexReader
+from application.InvertedIndexRepository import InvertedIndexRepository
+from benchmark.harness import BACKENDS, load_factory, make_repo, percentile, snapshot_repo
+
+MODES = ["closed", "open"]
+VOCABULARY_SIZE = 5000
+AND_RATIO = 0.2
+
+
+def fit_zipf_exponent(dfs: Sequence[int]) -> float:
+    """Pendiente de log(df) frente a log(rango) por mínimos cuadrados (df ordenado de mayor a menor)."""
+    points = [(math.log(rank), math.log(df)) for rank, df in enumerate(dfs, start=1) if df > 0]
+    if len(points) < 2:
+        return 1.0
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if var_x == 0:
+        return 1.0
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+    return max(0.0, -slope)
+
+
+class ZipfTermSampler:
+    """Muestrea términos con probabilidad proporcional a 1 / rango^s."""
+
+    def __init__(self, ranked_terms: List[Tuple[str, int]], exponent: Optional[float] = None) -> None:
+        if not ranked_terms:
+            raise ValueError("No hay términos para generar carga: el índice está vacío.")
+        self.terms = [t for t, _ in ranked_terms]
+        self.exponent = fit_zipf_exponent([df for _, df in ranked_terms]) if exponent is None else exponent
+        self._cum = list(itertools.accumulate(1.0 / (rank ** self.exponent)
+                                             for rank in range(1, len(self.terms) + 1)))
+
+    def sample(self, rng: random.Random) -> str:
+        return self.terms[bisect.bisect_left(self._cum, rng.random() * self._cum[-1])]
+
+    def query(self, rng: random.Random, and_ratio: float) -> str:
+        if rng.random() < and_ratio:
+            return f"{self.sample(rng)} AND {self.sample(rng)}"
+        return self.sample(rng)
+
+
+def run_closed_loop(repo: InvertedIndexReader, sampler: ZipfTermSampler, concurrency: int,
+                    duration_s: float, and_ratio: float, seed: int) -> Dict[str, Any]:
+    latencies: List[List[float]] = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    start = threading.Barrier(concurrency + 1)
+    stop_at = [0.0]
+
+    def worker(i: int) -> None:
+        rng = random.Random(seed + i)
+        out = latencies[i]
+        start.wait()
+        while time.perf_counter() < stop_at[0]:
+            q = sampler.query(rng, and_ratio)
+            t0 = time.perf_counter()
+            try:
+                repo.query(q)
+            except Exception:
+                errors[i] += 1
+                continue
+            out.append((time.perf_counter() - t0) * 1000.0)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    stop_at[0] = time.perf_counter() + duration_s
+    t_start = time.perf_counter()
+    start.wait()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t_start
+    return _summary("closed", concurrency, [x for lat in latencies for x in lat], sum(errors), elapsed)
+
+
+def run_open_loop(repo: InvertedIndexReader, sampler: ZipfTermSampler, concurrency: int,
+                  duration_s: float, rate: float, and_ratio: float, seed: int) -> Dict[str, Any]:
+    arrivals: "queue.Queue[Optional[Tuple[float, str]]]" = queue.Queue()
+    latencies: List[List[float]] = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+
+    def worker(i: int) -> None:
+        out = latencies[i]
+        while True:
+            item = arrivals.get()
+            if item is None:
+                return
+            scheduled, q = item
+            try:
+                repo.query(q)
+            except Exception:
+                errors[i] += 1
+                continue
+            out.append((time.perf_counter() - scheduled) * 1000.0)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+
+    # El despachador no espera a los workers: si se atrasan, las llegadas se acumulan en la cola
+    rng = random.Random(seed)
+    t_start = time.perf_counter()
+    next_at = t_start
+    end = t_start + duration_s
+    offered = 0
+    while True:
+        next_at += rng.expovariate(rate)
+        if next_at >= end:
+            break
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        arrivals.put((next_at, sampler.query(rng, and_ratio)))
+        offered += 1
+    backlog = arrivals.qsize()
+    for _ in threads:
+        arrivals.put(None)
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t_start
+    result = _summary("open", concurrency, [x for lat in latencies for x in lat], sum(errors), elapsed)
+    result.update({"offered_rate": rate, "offered": offered, "backlog_at_end": backlog})
+    return result
+
+
+def _summary(mode: str, concurrency: int, samples: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "completed": len(samples),
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_s": len(samples) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "p99_ms": percentile(samples, 99),
+        "max_ms": max(samples) if samples else 0.0,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Carga concurrente con términos Zipf sobre el índice invertido.")
+    parser.add_argument("--backend", choices=BACKENDS["inverted"], default="sqlite")
+    parser.add_argument("--factory", help="modulo:funcion que construye el repositorio (ver benchmark.harness).")
+    parser.add_argument("--mode", choices=MODES, default="closed")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--duration", type=float, default=10.0, help="Segundos por nivel de concurrencia.")
+    parser.add_argument("--rate", type=float, default=1000.0, help="Llegadas/s en modo open.")
+    parser.add_argument("--zipf-s", type=float, help="Exponente Zipf (por defecto, ajustado al ranking de df).")
+    parser.add_argument("--and-ratio", type=float, default=AND_RATIO)
+    parser.add_argument("--vocabulary", type=int, default=VOCABULARY_SIZE)
+    parser.add_argument("--books", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--datalake", help="Raíz del datalake (por defecto, autodetectada).")
+    parser.add_argument("--workdir", help="Directorio para los ficheros del backend (por defecto, temporal).")
+    parser.add_argument("--out", help="Fichero JSON de salida.")
+    args = parser.parse_args(argv)
+
+    from utils.DatalakeDetector import detect_datalake_root
+    from utils.DatalakeManifest import DatalakeManifest
+    datalake_root = Path(args.datalake) if args.datalake else detect_datalake_root()
+    book_ids = DatalakeManifest.open(datalake_root).book_ids("body")[:args.books]
+    if not book_ids:
+        raise RuntimeError(f"No hay libros en el datalake: {datalake_root}")
+
+    rows: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory(prefix="load_") as tmp:
+        workdir = Path(args.workdir) if args.workdir else Path(tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        if args.factory:
+            repo = load_factory(args.factory)(workdir, datalake_root)
+        elif args.backend == "snapshot":
+            repo = snapshot_repo(workdir, datalake_root, book_ids)
+        else:
+            repo = make_repo("inverted", args.backend, workdir, datalake_root)
+        try:
+            # El snapshot solo implementa el puerto de lectura y llega ya indexado desde su origen
+            if isinstance(repo, InvertedIndexRepository):
+                repo.reset_index()
+                repo.index_books(book_ids)
+            sampler = ZipfTermSampler(repo.top_terms(args.vocabulary), args.zipf_s)
+            print(f"[LOAD] {len(sampler.terms)} términos, exponente Zipf {sampler.exponent:.3f}")
+            print(f"{'MODE':>6} | {'CONC':>5} | {'OPS/s':>10} | {'P50 (ms)':>9} | {'P95 (ms)':>9} | "
+                  f"{'P99 (ms)':>9} | {'MAX (ms)':>9} | {'ERR':>5}")
+            print("=" * 84)
+            for n in args.concurrency:
+                if args.mode == "closed":
+                    row = run_closed_loop(repo, sampler, n, args.duration, args.and_ratio, args.seed)
+                else:
+                    row = run_open_loop(repo, sampler, n, args.duration, args.rate, args.and_ratio, args.seed)
+                rows.append(row)
+                print(f"{row['mode']:>6} | {n:>5} | {row['throughput_s']:>10.0f} | {row['p50_ms']:>9.3f} | "
+                      f"{row['p95_ms']:>9.3f} | {row['p99_ms']:>9.3f} | {row['max_ms']:>9.3f} | {row['errors']:>5}")
+            print("=" * 84)
+        finally:
+            close = getattr(repo, "close", None)
+            if callable(close):
+                close()
+
+    if args.out:
+        out = Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps({
+            "backend": args.factory or args.backend,
+            "zipf_exponent": sampler.exponent,
+            "and_ratio": args.and_ratio,
+            "rows": rows,
+        }, indent=2), encoding="utf-8")
+        print(f"[LOAD] Resultados guardados en {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
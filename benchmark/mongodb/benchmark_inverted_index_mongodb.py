@@ -1,7 +1,11 @@
 from __future__ import annotations
 
+import argparse
+import os
+import re
 import time
 import random
+import unicodedata
 from typing import List, Tuple
 from pathlib import Path
 
@@ -9,13 +13,29 @@ import matplotlib.pyplot as plt
 from pymongo import MongoClient
 
 from utils.DatalakeDetector import detect_datalake_root
+from utils.DatalakeManifest import DatalakeManifest
+from utils.TextPipeline import TextPipeline
+from application.InvertedIndexRepository import InvertedIndexRepository
+from infrastructure.InvertedIndexFileRepository import InvertedIndexFileRepository
 from infrastructure.InvertedIndexMongoDBRepository import InvertedIndexMongoDBRepository
+from infrastructure.InvertedIndexSQLiteRepository import InvertedIndexSQLiteRepository
 
 MONGO_URI = "mongodb://localhost:27017"
 DB_NAME = "bench_inverted"
 INDEX_COLLECTION = "inverted_index"
 USE_STEMMING = True
 DATASET_SIZES = [20, 40, 60, 80, 100, 120, 150, 200, 250, 300]
+BATCH_SIZES = [1, 10, 100, 1000]
+POSTINGS_LAYOUTS = ["array", "chunked"]
+PARALLEL_WORKERS = sorted({1, 2, 4, os.cpu_count() or 1})
+PARALLEL_CHUNKSIZE = 4
+TOKENIZER_SAMPLE_BOOKS = 50
+CONJUNCTIVE_TERM_COUNTS = [2, 3, 5]
+QUERY_CACHE_SIZE = 10_000
+INGEST_WINDOW = 25
+BACKENDS = ["mongodb", "file", "sqlite"]
+BACKEND = "mongodb"
+FILE_INDEX_ROOT = Path("bench_inverted_index")
 
 PLOTS_DIR = Path("inverted_bench_plots")
 PLOTS_DIR.mkdir(parents=True, exist_ok=True)
@@ -29,10 +49,6 @@ def ensure_nltk_stopwords_ready():
         nltk.download("stopwords", quiet=True)
 
 
-def ensure_clean_collection(client: MongoClient, db_name: str, coll_name: str):
-    client[db_name][coll_name].delete_many({})
-
-
 def summarize(elapsed_s: float, n_ops: int) -> Tuple[float, float, float]:
     total_ms = elapsed_s * 1000.0
     ops_sec = (n_ops / elapsed_s) if elapsed_s > 0 else float("inf")
@@ -41,31 +57,63 @@ def summarize(elapsed_s: float, n_ops: int) -> Tuple[float, float, float]:
 
 
 def list_book_ids_from_datalake(datalake_root: str | Path) -> List[int]:
-    root = Path(datalake_root)
-    ids = set()
-    for p in root.rglob("*.body.txt"):
-        try:
-            bid = int(p.name.split(".")[0])
-            ids.add(bid)
-        except ValueError:
-            continue
-    return sorted(ids)
-
-
-def sample_terms_from_index(client: MongoClient, db_name: str, coll_name: str, limit: int) -> List[str]:
-    col = client[db_name][coll_name]
-    docs = list(col.aggregate([
-        {"$project": {"term": 1, "df": {"$size": {"$ifNull": ["$postings", []]}}}},
-        {"$match": {"df": {"$gt": 0}}},
-        {"$sort": {"df": -1}},
-        {"$limit": 5000}
-    ]))
-    if not docs:
+    return DatalakeManifest.open(datalake_root).book_ids("body")
+
+
+def make_repo(datalake_root: Path, index_name: str = INDEX_COLLECTION, clean: bool = False,
+              **options) -> InvertedIndexRepository:
+    if BACKEND == "file":
+        repo = InvertedIndexFileRepository(
+            index_dir=str(FILE_INDEX_ROOT / index_name),
+            datalake_root=str(datalake_root),
+            stopwords_path=None,
+            use_stemming=USE_STEMMING,
+            **options,
+        )
+    elif BACKEND == "sqlite":
+        repo = InvertedIndexSQLiteRepository(
+            db_path=str(FILE_INDEX_ROOT / f"{index_name}.sqlite"),
+            datalake_root=str(datalake_root),
+            stopwords_path=None,
+            use_stemming=USE_STEMMING,
+            **options,
+        )
+    else:
+        repo = InvertedIndexMongoDBRepository(
+            uri=MONGO_URI,
+            db_name=DB_NAME,
+            datalake_root=str(datalake_root),
+            index_collection=index_name,
+            stopwords_path=None,
+            use_stemming=USE_STEMMING,
+            **options,
+        )
+    if clean:
+        repo.reset_index()
+    return repo
+
+
+def flush_repo(repo: InvertedIndexRepository) -> None:
+    # El backend de ficheros acumula en memoria lo indexado con index_book
+    if isinstance(repo, InvertedIndexFileRepository):
+        repo.flush()
+
+
+def close_repo(repo: InvertedIndexRepository) -> None:
+    # Fuera de la medición: espera a que terminen las fusiones en segundo plano
+    if isinstance(repo, (InvertedIndexFileRepository, InvertedIndexSQLiteRepository)):
+        repo.close()
+
+
+def sample_terms_from_index(repo: InvertedIndexRepository, limit: int) -> List[str]:
+    # Bandas por percentil de df leídas con consultas indexadas (offset sobre el ranking)
+    n_terms = repo.get_index_stats()["terms"]
+    if n_terms == 0:
         return []
-    docs.sort(key=lambda d: d["df"], reverse=True)
-    top = [d["term"] for d in docs[:max(1, len(docs)//10)]]
-    mid = [d["term"] for d in docs[len(docs)//3: 2*len(docs)//3]]
-    rare = [d["term"] for d in docs[-max(1, len(docs)//10):]]
+    band = max(1, min(500, n_terms // 10))
+    top = [t for t, _ in repo.top_terms(band)]
+    mid = [t for t, _ in repo.top_terms(band, offset=n_terms // 3)] or top
+    rare = [t for t, _ in repo.top_terms(band, offset=max(0, n_terms - band))] or top
     out = []
     each = max(1, limit // 3)
     for bucket in (top, mid, rare):
@@ -78,34 +126,147 @@ def sample_terms_from_index(client: MongoClient, db_name: str, coll_name: str, l
 
 
 def bench_build_inverted_index(book_ids: List[int], datalake_root: Path) -> Tuple[float, float, float]:
-    client = MongoClient(MONGO_URI)
-    ensure_clean_collection(client, DB_NAME, INDEX_COLLECTION)
-    repo = InvertedIndexMongoDBRepository(
-        uri=MONGO_URI,
-        db_name=DB_NAME,
-        datalake_root=str(datalake_root),
-        index_collection=INDEX_COLLECTION,
-        stopwords_path=None,
-        use_stemming=USE_STEMMING,
-    )
+    repo = make_repo(datalake_root, clean=True)
     t0 = time.perf_counter()
     for bid in book_ids:
         repo.index_book(bid)
+    flush_repo(repo)
     t1 = time.perf_counter()
+    close_repo(repo)
     return summarize(t1 - t0, len(book_ids))
 
 
-def bench_query_performance(n_queries: int, datalake_root: Path) -> Tuple[float, float, float]:
-    repo = InvertedIndexMongoDBRepository(
-        uri=MONGO_URI,
-        db_name=DB_NAME,
-        datalake_root=str(datalake_root),
-        index_collection=INDEX_COLLECTION,
-        stopwords_path=None,
-        use_stemming=USE_STEMMING,
-    )
+def bench_batch_indexing(book_ids: List[int], datalake_root: Path, batch_size: int) -> float:
+    repo = make_repo(datalake_root, clean=True, batch_max_books=batch_size)
+    t0 = time.perf_counter()
+    repo.index_books(book_ids)
+    t1 = time.perf_counter()
+    close_repo(repo)
+    _, books_sec, _ = summarize(t1 - t0, len(book_ids))
+    return books_sec
+
+
+def bench_sustained_ingest(book_ids: List[int], datalake_root: Path, window: int) -> List[float]:
+    # Throughput por ventanas consecutivas sobre un índice que no se vacía entre ventanas
+    repo = make_repo(datalake_root, clean=True, batch_max_books=window)
+    rates = []
+    for start in range(0, len(book_ids), window):
+        chunk = book_ids[start:start + window]
+        t0 = time.perf_counter()
+        repo.index_books(chunk)
+        t1 = time.perf_counter()
+        rates.append(summarize(t1 - t0, len(chunk))[1])
+    close_repo(repo)
+    return rates
+
+
+def bench_parallel_indexing(book_ids: List[int], datalake_root: Path, workers: int) -> float:
+    repo = make_repo(datalake_root, clean=True, parallel_workers=workers, parallel_chunksize=PARALLEL_CHUNKSIZE)
+    t0 = time.perf_counter()
+    repo.index_books(book_ids)
+    t1 = time.perf_counter()
+    close_repo(repo)
+    total_ms, _, _ = summarize(t1 - t0, len(book_ids))
+    return total_ms
+
+
+def legacy_pipeline_tokens(pipeline: TextPipeline, raw: str) -> List[str]:
+    # Pipeline original (normalizador de varias pasadas + stem por token), como referencia.
+    s = raw.lower()
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    s = re.sub(r"[^\w\s]", " ", s)
+    s = re.sub(r"\d+", " ", s)
+    s = re.sub(r"_", " ", s)
+    s = re.sub(r"\s+", " ", s).strip()
+    toks = [t for t in s.split(" ") if t.isalpha()]
+    toks = [t for t in toks if len(t) >= 3 and t not in pipeline.stopwords]
+    if pipeline.stemmer:
+        toks = [pipeline.stemmer.stem(t) for t in toks]
+    toks = [t for t in toks if len(t) >= 3 and t not in pipeline.stopwords]
+    return list(dict.fromkeys(toks))
+
+
+def bench_tokenizer(book_ids: List[int], datalake_root: Path) -> Tuple[float, float]:
+    pipeline = TextPipeline(TextPipeline.load_stopwords(None), USE_STEMMING)
+    manifest = DatalakeManifest.open(datalake_root)
+    bodies = []
+    for bid in book_ids:
+        text = manifest.read_text(bid, "body")
+        if text is not None:
+            bodies.append(text)
+    if not bodies:
+        return 0.0, 0.0
+
+    t0 = time.perf_counter()
+    legacy = [legacy_pipeline_tokens(pipeline, text) for text in bodies]
+    t1 = time.perf_counter()
+    current = [pipeline.pipeline_tokens(text) for text in bodies]
+    t2 = time.perf_counter()
+
+    if legacy != current:
+        raise AssertionError("El tokenizador nuevo no produce la misma salida que el original.")
+    _, _, legacy_avg = summarize(t1 - t0, len(bodies))
+    _, _, current_avg = summarize(t2 - t1, len(bodies))
+    return legacy_avg, current_avg
+
+
+def collection_storage_bytes(client: MongoClient, db_name: str, coll_name: str) -> Tuple[int, int]:
+    data_bytes, storage_bytes = 0, 0
+    for name in (coll_name, f"{coll_name}_chunks"):
+        if name not in client[db_name].list_collection_names():
+            continue
+        stats = client[db_name].command("collStats", name)
+        data_bytes += int(stats.get("size", 0))
+        storage_bytes += int(stats.get("storageSize", 0))
+    return data_bytes, storage_bytes
+
+
+def bench_postings_layout(book_ids: List[int], datalake_root: Path, layout: str,
+                          n_queries: int) -> Tuple[int, int, float]:
+    coll_name = f"{INDEX_COLLECTION}_{layout}"
     client = MongoClient(MONGO_URI)
-    terms = sample_terms_from_index(client, DB_NAME, INDEX_COLLECTION, n_queries)
+    repo = make_repo(datalake_root, index_name=coll_name, clean=True, postings_layout=layout)
+    repo.index_books(book_ids)
+    data_bytes, storage_bytes = collection_storage_bytes(client, DB_NAME, coll_name)
+
+    terms = sample_terms_from_index(repo, n_queries)
+    if not terms:
+        return data_bytes, storage_bytes, 0.0
+    for q in terms[:10]:
+        repo.get_index_by_term(q)
+    t0 = time.perf_counter()
+    for q in terms:
+        repo.get_index_by_term(q)
+    t1 = time.perf_counter()
+    _, _, avg_ms = summarize(t1 - t0, len(terms))
+    return data_bytes, storage_bytes, avg_ms
+
+
+def bench_local_storage(book_ids: List[int], datalake_root: Path, n_queries: int) -> Tuple[int, int, float]:
+    # Backends embebidos (ficheros, SQLite): tamaño en disco y latencia de lectura
+    repo = make_repo(datalake_root, index_name=f"{INDEX_COLLECTION}_{BACKEND}", clean=True)
+    repo.index_books(book_ids)
+    storage_bytes = repo.storage_bytes()
+
+    terms = sample_terms_from_index(repo, n_queries)
+    if not terms:
+        close_repo(repo)
+        return storage_bytes, storage_bytes, 0.0
+    for q in terms[:10]:
+        repo.get_index_by_term(q)
+    t0 = time.perf_counter()
+    for q in terms:
+        repo.get_index_by_term(q)
+    t1 = time.perf_counter()
+    close_repo(repo)
+    _, _, avg_ms = summarize(t1 - t0, len(terms))
+    return storage_bytes, storage_bytes, avg_ms
+
+
+def bench_query_performance(n_queries: int, datalake_root: Path) -> Tuple[float, float, float]:
+    repo = make_repo(datalake_root)
+    terms = sample_terms_from_index(repo, n_queries)
     if not terms:
         return 0.0, 0.0, 0.0
 
@@ -119,7 +280,51 @@ def bench_query_performance(n_queries: int, datalake_root: Path) -> Tuple[float,
     return summarize(t1 - t0, len(terms))
 
 
+def bench_query_cache(n_queries: int, datalake_root: Path) -> Tuple[float, float, float]:
+    repo = make_repo(datalake_root, cache_size=QUERY_CACHE_SIZE)
+    terms = list(dict.fromkeys(sample_terms_from_index(repo, n_queries)))
+    if not terms:
+        return 0.0, 0.0, 0.0
+
+    t0 = time.perf_counter()
+    for q in terms:
+        repo.get_index_by_term(q)
+    t1 = time.perf_counter()
+    for q in terms:
+        repo.get_index_by_term(q)
+    t2 = time.perf_counter()
+
+    _, _, cold_avg = summarize(t1 - t0, len(terms))
+    _, _, warm_avg = summarize(t2 - t1, len(terms))
+    stats = repo.cache_stats()["postings"]
+    lookups = stats["hits"] + stats["misses"]
+    hit_ratio = stats["hits"] / lookups if lookups else 0.0
+    return cold_avg, warm_avg, hit_ratio
+
+
+def bench_conjunctive_queries(n_queries: int, n_terms: int, datalake_root: Path) -> Tuple[float, float, float]:
+    repo = make_repo(datalake_root)
+    terms = sample_terms_from_index(repo, n_queries * n_terms)
+    if not terms:
+        return 0.0, 0.0, 0.0
+    queries = [" AND ".join(terms[i:i + n_terms]) for i in range(0, len(terms) - n_terms + 1, n_terms)]
+
+    for q in queries[:5]:
+        repo.query(q)
+
+    t0 = time.perf_counter()
+    for q in queries:
+        repo.query(q)
+    t1 = time.perf_counter()
+    return summarize(t1 - t0, len(queries))
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del índice invertido.")
+    parser.add_argument("--backend", choices=BACKENDS, default=BACKEND)
+    BACKEND = parser.parse_args().backend
+    is_mongo = BACKEND == "mongodb"
+
     ensure_nltk_stopwords_ready()
     DATALAKE_ROOT = detect_datalake_root()
     all_ids = list_book_ids_from_datalake(DATALAKE_ROOT)
@@ -135,6 +340,8 @@ if __name__ == "__main__":
 
     idx_total_list, idx_ops_list, idx_avg_list = [], [], []
     qry_total_list, qry_ops_list, qry_avg_list = [], [], []
+    and_avg_lists = {k: [] for k in CONJUNCTIVE_TERM_COUNTS}
+    cache_rows = []
 
     for n in dataset_sizes:
         subset = all_ids[:n]
@@ -142,6 +349,11 @@ if __name__ == "__main__":
         idx_total, idx_ops, idx_avg = bench_build_inverted_index(subset, DATALAKE_ROOT)
         n_queries = max(50, n // 2)
         qry_total, qry_ops, qry_avg = bench_query_performance(n_queries, DATALAKE_ROOT)
+        for k in CONJUNCTIVE_TERM_COUNTS:
+            _, _, and_avg = bench_conjunctive_queries(n_queries, k, DATALAKE_ROOT)
+            and_avg_lists[k].append(and_avg)
+        if is_mongo:
+            cache_rows.append(bench_query_cache(n_queries, DATALAKE_ROOT))
 
         idx_total_list.append(idx_total)
         idx_ops_list.append(idx_ops)
@@ -155,6 +367,74 @@ if __name__ == "__main__":
 
     print("=" * 108)
 
+    header = " | ".join(f"{f'AND{k} AVG (ms)':>14}" for k in CONJUNCTIVE_TERM_COUNTS)
+    print(f"{'N_BOOKS':>10} | {header}")
+    print("=" * (13 + 17 * len(CONJUNCTIVE_TERM_COUNTS)))
+    for i, n in enumerate(dataset_sizes):
+        row = " | ".join(f"{and_avg_lists[k][i]:>14.3f}" for k in CONJUNCTIVE_TERM_COUNTS)
+        print(f"{n:>10} | {row}")
+    print("=" * (13 + 17 * len(CONJUNCTIVE_TERM_COUNTS)))
+
+    if cache_rows:
+        print(f"{'N_BOOKS':>10} | {'COLD AVG (ms)':>14} | {'WARM AVG (ms)':>14} | {'HIT RATIO':>10}")
+        print("=" * 58)
+        for n, (cold_avg, warm_avg, hit_ratio) in zip(dataset_sizes, cache_rows):
+            print(f"{n:>10} | {cold_avg:>14.3f} | {warm_avg:>14.4f} | {hit_ratio:>10.2%}")
+        print("=" * 58)
+
+    batch_ids = all_ids[:max(dataset_sizes)] if dataset_sizes else all_ids
+
+    tok_ids = batch_ids[:TOKENIZER_SAMPLE_BOOKS]
+    legacy_avg, current_avg = bench_tokenizer(tok_ids, DATALAKE_ROOT)
+    print(f"{'TOKENIZER':>10} | {'N_BOOKS':>10} | {'AVG (ms/book)':>14}")
+    print("=" * 40)
+    print(f"{'before':>10} | {len(tok_ids):>10} | {legacy_avg:>14.3f}")
+    print(f"{'after':>10} | {len(tok_ids):>10} | {current_avg:>14.3f}")
+    print("=" * 40)
+    batch_books_sec = []
+
+    print(f"{'BATCH SIZE':>10} | {'N_BOOKS':>10} | {'BOOKS/s':>12}")
+    print("=" * 40)
+    for batch_size in BATCH_SIZES:
+        books_sec = bench_batch_indexing(batch_ids, DATALAKE_ROOT, batch_size)
+        batch_books_sec.append(books_sec)
+        print(f"{batch_size:>10} | {len(batch_ids):>10} | {books_sec:>12.2f}")
+    print("=" * 40)
+
+    print(f"{'LAYOUT':>10} | {'N_BOOKS':>10} | {'DATA (KB)':>12} | {'STORAGE (KB)':>12} | {'QRY AVG (ms)':>12}")
+    print("=" * 68)
+    for layout in (POSTINGS_LAYOUTS if is_mongo else [BACKEND]):
+        if is_mongo:
+            data_bytes, storage_bytes, lookup_avg = bench_postings_layout(
+                batch_ids, DATALAKE_ROOT, layout, max(50, len(batch_ids) // 2)
+            )
+        else:
+            data_bytes, storage_bytes, lookup_avg = bench_local_storage(
+                batch_ids, DATALAKE_ROOT, max(50, len(batch_ids) // 2)
+            )
+        print(f"{layout:>10} | {len(batch_ids):>10} | {data_bytes / 1024:>12.1f} | "
+              f"{storage_bytes / 1024:>12.1f} | {lookup_avg:>12.3f}")
+    print("=" * 68)
+
+    serial_total, _, _ = bench_build_inverted_index(batch_ids, DATALAKE_ROOT)
+    print(f"{'WORKERS':>10} | {'N_BOOKS':>10} | {'TOTAL (ms)':>12} | {'SPEEDUP':>10}")
+    print("=" * 52)
+    print(f"{'serial':>10} | {len(batch_ids):>10} | {serial_total:>12.2f} | {1.0:>9.2f}x")
+    for workers in PARALLEL_WORKERS:
+        par_total = bench_parallel_indexing(batch_ids, DATALAKE_ROOT, workers)
+        speedup = serial_total / par_total if par_total > 0 else float("inf")
+        print(f"{workers:>10} | {len(batch_ids):>10} | {par_total:>12.2f} | {speedup:>9.2f}x")
+    print("=" * 52)
+
+    ingest_rates = bench_sustained_ingest(batch_ids, DATALAKE_ROOT, INGEST_WINDOW)
+    print(f"{'WINDOW':>10} | {'BOOKS':>12} | {'BOOKS/s':>12}")
+    print("=" * 40)
+    for i, rate in enumerate(ingest_rates):
+        first = i * INGEST_WINDOW + 1
+        last = min(len(batch_ids), (i + 1) * INGEST_WINDOW)
+        print(f"{i + 1:>10} | {f'{first}-{last}':>12} | {rate:>12.2f}")
+    print("=" * 40)
+
     # Indexing-only plots
     plt.figure(figsize=(9, 5))
     plt.plot(dataset_sizes, idx_total_list, marker="o", label="Index Total Time (ms)")
@@ -186,6 +466,17 @@ if __name__ == "__main__":
     plt.savefig(PLOTS_DIR / "index_avg_latency.png", dpi=140)
     plt.close()
 
+    plt.figure(figsize=(9, 5))
+    plt.plot(BATCH_SIZES, batch_books_sec, marker="o", label="Batch Index Throughput (books/s)")
+    plt.xscale("log")
+    plt.xlabel("Books per Flush (batch size)")
+    plt.ylabel("Throughput (books/s)")
+    plt.title(f"Batched Indexing: Throughput by Batch Size ({len(batch_ids)} books)")
+    plt.grid(True, linestyle="--", alpha=0.4)
+    plt.tight_layout()
+    plt.savefig(PLOTS_DIR / "index_batch_throughput.png", dpi=140)
+    plt.close()
+
     # Query-only plots
     plt.figure(figsize=(9, 5))
     plt.plot(dataset_sizes, qry_total_list, marker="o", label="Query Total Time (ms)")
@@ -217,4 +508,16 @@ if __name__ == "__main__":
     plt.savefig(PLOTS_DIR / "query_avg_latency.png", dpi=140)
     plt.close()
 
+    plt.figure(figsize=(9, 5))
+    for k in CONJUNCTIVE_TERM_COUNTS:
+        plt.plot(dataset_sizes, and_avg_lists[k], marker="o", label=f"{k}-term AND")
+    plt.xlabel("Number of Books")
+    plt.ylabel("Avg Latency (ms/query)")
+    plt.title("Conjunctive Queries: Average Latency by Dataset Size")
+    plt.legend()
+    plt.grid(True, linestyle="--", alpha=0.4)
+    plt.tight_layout()
+    plt.savefig(PLOTS_DIR / "query_and_avg_latency.png", dpi=140)
+    plt.close()
+
     print(f"Line graphs saved in: {PLOTS_DIR.resolve()}")
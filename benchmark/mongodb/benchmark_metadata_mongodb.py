@@ -1,32 +1,62 @@
+import argparse
 import time
 import random
 from typing import List
 from pymongo import MongoClient
 from domain.book import Book
+from application.MetadataRepository import MetadataRepository
 from infrastructure.MetadataMongoDBRepository import MetadataMongoDBRepository
+from infrastructure.MetadataSQLiteRepository import MetadataSQLiteRepository
 import matplotlib.pyplot as plt
 from pathlib import Path
 
 MONGO_URI = "mongodb://localhost:27017"
 db_name = "books"
 collection = "metadata_test"
+BULK_BATCH_SIZE = 1000
+N_AUTHORS = 500
+LANGUAGES = ["English", "French", "German", "Spanish"]
+QUERY_SAMPLES = 1000
+GET_MANY_SIZE = 50
+PAGE_SIZE = 50
+BACKENDS = ["mongodb", "sqlite"]
+BACKEND = "mongodb"
+SQLITE_PATH = Path("bench_metadata.sqlite")
 
 def gen_books(start_id: int, n: int) -> List[Book]:
     return [
         Book(
             book_id=start_id + i,
             title=f"Sample Book {start_id + i}",
-            author=f"Author X{start_id + i}",
-            language="English",
+            author=f"Author X{(start_id + i) % N_AUTHORS}",
+            language=LANGUAGES[(start_id + i) % len(LANGUAGES)],
         )
         for i in range(n)
     ]
 
+def percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, int(round(p / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
 def ensure_collection(client: MongoClient, db_name: str, coll_name: str):
     col = client[db_name][coll_name]
     col.delete_many({})
     return col
 
+def make_repo(clean: bool = False) -> MetadataRepository:
+    if BACKEND == "sqlite":
+        if clean:
+            for suffix in ("", "-wal", "-shm"):
+                Path(f"{SQLITE_PATH}{suffix}").unlink(missing_ok=True)
+        return MetadataSQLiteRepository(str(SQLITE_PATH), table=collection)
+    mongo_client = MongoClient(MONGO_URI)
+    if clean:
+        ensure_collection(mongo_client, db_name, collection)
+    return MetadataMongoDBRepository(mongo_client, db_name, collection)
+
 def summarize(elapsed_s: float, n_ops: int):
     total_ms = elapsed_s * 1000.0
     ops_sec = n_ops / elapsed_s if elapsed_s > 0 else float("inf")
@@ -34,9 +64,7 @@ def summarize(elapsed_s: float, n_ops: int):
     return total_ms, ops_sec, avg_ms
 
 def bench_insert_metadata(n_docs: int):
-    mongo_client = MongoClient(MONGO_URI)
-    ensure_collection(mongo_client, db_name, collection)
-    metadata_repository = MetadataMongoDBRepository(mongo_client, db_name, collection)
+    metadata_repository = make_repo(clean=True)
     mocked_books = gen_books(1, n_docs)
     t0 = time.perf_counter()
     for book in mocked_books:
@@ -46,22 +74,59 @@ def bench_insert_metadata(n_docs: int):
     total_ms, ops_sec, avg_ms = summarize(duration, n_docs)
     return mocked_books, total_ms, ops_sec, avg_ms
 
+def bench_insert_metadata_bulk(n_docs: int):
+    metadata_repository = make_repo(clean=True)
+    mocked_books = gen_books(1, n_docs)
+    t0 = time.perf_counter()
+    metadata_repository.save_metadata_many(mocked_books, batch_size=BULK_BATCH_SIZE)
+    t1 = time.perf_counter()
+    return summarize(t1 - t0, n_docs)
+
 def bench_get_metadata(mocked_books: List[Book]):
     n_queries = len(mocked_books)
-    mongo_client = MongoClient(MONGO_URI)
-    metadata_repository = MetadataMongoDBRepository(mongo_client, db_name, collection)
+    metadata_repository = make_repo()
+    if isinstance(metadata_repository, MetadataMongoDBRepository):
+        get_one = lambda bid: metadata_repository.collection.find_one({"book_id": bid})
+    else:
+        get_one = metadata_repository.get_metadata
     book_ids = [b.book_id for b in mocked_books]
     t0 = time.perf_counter()
     for _ in range(n_queries):
         random_id = random.choice(book_ids)
-        metadata_repository.collection.find_one({"book_id": random_id})
+        get_one(random_id)
     t1 = time.perf_counter()
     duration = t1 - t0
     total_ms, ops_sec, avg_ms = summarize(duration, n_queries)
     return total_ms, ops_sec, avg_ms
 
+def bench_query_shapes(mocked_books: List[Book]):
+    metadata_repository = make_repo()
+    book_ids = [b.book_id for b in mocked_books]
+    shapes = {
+        "get_by_id": lambda: metadata_repository.get_metadata(random.choice(book_ids)),
+        "get_many": lambda: metadata_repository.get_metadata_many(
+            random.sample(book_ids, min(GET_MANY_SIZE, len(book_ids)))),
+        "author+lang": lambda: metadata_repository.find_by_author(
+            f"Author X{random.randrange(N_AUTHORS)}", random.choice(LANGUAGES), page_size=PAGE_SIZE),
+        "title_prefix": lambda: metadata_repository.search_title_prefix(
+            f"Sample Book {random.choice(book_ids)}"[:-1], page_size=PAGE_SIZE),
+    }
+    results = {}
+    for name, op in shapes.items():
+        latencies = []
+        for _ in range(QUERY_SAMPLES):
+            t0 = time.perf_counter()
+            op()
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+        results[name] = (percentile(latencies, 50), percentile(latencies, 99))
+    return results
+
 if __name__ == "__main__":
-    plots_dir = Path("mongo_plots")
+    parser = argparse.ArgumentParser(description="Benchmark del repositorio de metadatos.")
+    parser.add_argument("--backend", choices=BACKENDS, default=BACKEND)
+    BACKEND = parser.parse_args().backend
+
+    plots_dir = Path("mongo_plots" if BACKEND == "mongodb" else f"{BACKEND}_plots")
     plots_dir.mkdir(parents=True, exist_ok=True)
 
     dataset_sizes = [50, 500, 1000, 5000, 8000, 10000, 15000, 20000, 30000, 40000, 50000, 70000]
@@ -69,15 +134,22 @@ if __name__ == "__main__":
     insert_times, get_times = [], []
     insert_ops, get_ops = [], []
     insert_avg, get_avg = [], []
+    bulk_times, bulk_ops = [], []
+    shape_rows = []
 
-    print("=" * 102)
+    print("=" * 150)
     print(f"{'N_BOOKS':>10} | {'INS TOTAL (ms)':>15} | {'INS OPS/s':>12} | {'INS AVG (ms)':>12} | "
+          f"{'BULK TOTAL (ms)':>15} | {'BULK OPS/s':>12} | {'SPEEDUP':>8} | "
           f"{'GET TOTAL (ms)':>15} | {'GET OPS/s':>12} | {'GET AVG (ms)':>12}")
-    print("=" * 102)
+    print("=" * 150)
 
     for n_docs in dataset_sizes:
+        bulk_total, bulk_ops_val, _ = bench_insert_metadata_bulk(n_docs)
         books, ins_total, ins_ops, ins_avg = bench_insert_metadata(n_docs)
         get_total, get_ops_val, get_avg_val = bench_get_metadata(books)
+        shape_rows.append(bench_query_shapes(books))
+        bulk_times.append(bulk_total)
+        bulk_ops.append(bulk_ops_val)
 
         insert_times.append(ins_total)
         get_times.append(get_total)
@@ -87,12 +159,22 @@ if __name__ == "__main__":
         get_avg.append(get_avg_val)
 
         print(f"{n_docs:>10} | {ins_total:>15.2f} | {ins_ops:>12.0f} | {ins_avg:>12.3f} | "
+              f"{bulk_total:>15.2f} | {bulk_ops_val:>12.0f} | {ins_total / bulk_total:>7.1f}x | "
               f"{get_total:>15.2f} | {get_ops_val:>12.0f} | {get_avg_val:>12.3f}")
 
-    print("=" * 102)
+    print("=" * 150)
+
+    shape_names = list(shape_rows[0]) if shape_rows else []
+    print(f"{'N_BOOKS':>10} | " + " | ".join(f"{name + ' p50/p99 (ms)':>26}" for name in shape_names))
+    print("=" * (13 + 29 * len(shape_names)))
+    for n_docs, row in zip(dataset_sizes, shape_rows):
+        cells = " | ".join(f"{f'{row[name][0]:.3f} / {row[name][1]:.3f}':>26}" for name in shape_names)
+        print(f"{n_docs:>10} | {cells}")
+    print("=" * (13 + 29 * len(shape_names)))
 
     plt.figure(figsize=(9, 5))
     plt.plot(dataset_sizes, insert_times, marker="o", label="Insert Total Time")
+    plt.plot(dataset_sizes, bulk_times, marker="o", label="Bulk Insert Total Time")
     plt.plot(dataset_sizes, get_times, marker="o", label="GET Total Time")
     for x, y in zip(dataset_sizes, insert_times):
         plt.text(x, y, f"{y:.0f} ms", ha="center", va="bottom", fontsize=8, rotation=0)
@@ -109,6 +191,7 @@ if __name__ == "__main__":
 
     plt.figure(figsize=(9, 5))
     plt.plot(dataset_sizes, insert_ops, marker="o", label="Insert Ops/s")
+    plt.plot(dataset_sizes, bulk_ops, marker="o", label="Bulk Insert Ops/s")
     plt.plot(dataset_sizes, get_ops, marker="o", label="GET Ops/s")
     for x, y in zip(dataset_sizes, insert_ops):
         plt.text(x, y, f"{y:,.0f}", ha="center", va="bottom", fontsize=8)
@@ -0,0 +1,267 @@
+"""
+Generador de un corpus sintético con forma de Project Gutenberg para
+benchmarks de escala sin red.
+
+Escribe `{id}.header.txt` y `{id}.body.txt` en datalake/YYYYMMDD/HH (el
+mismo formato que deja split_stream_to_datalake) y los registra en el
+manifiesto. Las cabeceras llevan Title/Author/Release date/Language/Credits
+tal y como las lee GutenbergHeaderSerializer.
+
+- Longitud de los libros: lognormal (mediana y sigma configurables), acotada.
+- Vocabulario: palabras inventadas con frecuencia Zipf; las más frecuentes
+  son palabras funcionales reales y las más cortas, como en un texto real.
+- Determinista: cada libro se genera con una semilla derivada de (seed,
+  book_id), así que el resultado no depende del número de procesos.
+
+Para ser rápido, el cuerpo se compone de párrafos tomados de un pool común
+(muestreado una vez con la distribución Zipf) más un párrafo propio de cada
+libro con palabras de la cola, que aporta el vocabulario raro.
+
+    python -m benchmark.synthetic_corpus --books 70000 --datalake synthetic_datalake --workers 4
+"""
+from __future__ import annotations
+
+import argparse
+import bisect
+import itertools
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from utils.DatalakeManifest import DatalakeManifest
+
+FUNCTION_WORDS = [
+    "the", "of", "and", "to", "a", "in", "that", "he", "was", "it", "his", "her", "with", "as", "had",
+    "for", "she", "not", "you", "but", "at", "on", "him", "is", "be", "they", "by", "said", "which", "all",
+]
+SYLLABLES = [
+    "ba", "be", "bi", "bo", "ca", "ce", "co", "da", "de", "di", "do", "fa", "fe", "fi", "ga", "ge", "go",
+    "ha", "he", "hi", "la", "le", "li", "lo", "lu", "ma", "me", "mi", "mo", "na", "ne", "ni", "no", "pa",
+    "pe", "pi", "po", "ra", "re", "ri", "ro", "sa", "se", "si", "so", "ta", "te", "ti", "to", "va", "ve",
+    "vi", "wa", "we", "ar", "er", "or", "an", "en", "on", "st", "th", "ch", "sh", "ght", "nd", "rt", "ll",
+]
+FIRST_NAMES = ["John", "Mary", "Charles", "Jane", "William", "Louisa", "Henry", "Emily", "George", "Anne",
+               "Thomas", "Edith", "Arthur", "Virginia", "Robert", "Charlotte", "Walter", "Margaret"]
+LANGUAGES = [("English", 0.80), ("French", 0.06), ("German", 0.05), ("Spanish", 0.04),
+             ("Italian", 0.03), ("Portuguese", 0.02)]
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August", "September",
+          "October", "November", "December"]
+LICENSE_BLURB = (
+    "This ebook is for the use of anyone anywhere in the United States and\n"
+    "most other parts of the world at no cost and with almost no restrictions\n"
+    "whatsoever. You may copy it, give it away or re-use it under the terms\n"
+    "of the Project Gutenberg License included with this ebook or online\n"
+    "at www.gutenberg.org."
+)
+
+
+@dataclass
+class CorpusConfig:
+    seed: int = 42
+    vocabulary_size: int = 100_000
+    zipf_s: float = 1.07
+    median_words: int = 20_000
+    sigma: float = 0.8
+    min_words: int = 500
+    max_words: int = 400_000
+    paragraph_words: int = 120
+    paragraph_pool: int = 4096
+    # Fracción de palabras de cada libro tomadas de la cola del vocabulario
+    tail_ratio: float = 0.02
+    tail_start_rank: int = 2000
+    n_authors: int = 5000
+    start_date: str = "20250101"
+    books_per_hour: int = 2500
+
+
+class CorpusGenerator:
+    """Genera libros sintéticos de forma determinista a partir de CorpusConfig."""
+
+    def __init__(self, config: CorpusConfig) -> None:
+        self.config = config
+        rng = random.Random(config.seed)
+        self.vocabulary = self._build_vocabulary(rng, config.vocabulary_size)
+        weights = [1.0 / (rank ** config.zipf_s) for rank in range(1, len(self.vocabulary) + 1)]
+        self._cum = list(itertools.accumulate(weights))
+        tail_from = min(config.tail_start_rank, len(self.vocabulary) - 1)
+        self._tail = self.vocabulary[tail_from:]
+        self._tail_cum = list(itertools.accumulate(weights[tail_from:]))
+        self.authors = self._build_authors(rng, config.n_authors)
+        self._author_cum = list(itertools.accumulate(1.0 / rank for rank in range(1, len(self.authors) + 1)))
+        self._language_cum = list(itertools.accumulate(w for _, w in LANGUAGES))
+        self.paragraphs = [self._paragraph(rng, self._sample_words(rng, config.paragraph_words))
+                           for _ in range(config.paragraph_pool)]
+
+    def book(self, book_id: int) -> Tuple[str, str]:
+        """Devuelve (cabecera, cuerpo) del libro book_id."""
+        cfg = self.config
+        rng = random.Random(f"{cfg.seed}:{book_id}")
+        n_words = int(min(cfg.max_words, max(cfg.min_words, rng.lognormvariate(math.log(cfg.median_words),
+                                                                               cfg.sigma))))
+        n_tail = max(1, int(n_words * cfg.tail_ratio))
+        n_paragraphs = max(1, (n_words - n_tail) // cfg.paragraph_words)
+        body = [self.paragraphs[i] for i in rng.choices(range(len(self.paragraphs)), k=n_paragraphs)]
+        own = rng.choices(self._tail, cum_weights=self._tail_cum, k=n_tail)
+        for start in range(0, n_tail, cfg.paragraph_words):
+            body.insert(rng.randrange(len(body) + 1), self._paragraph(rng, own[start:start + cfg.paragraph_words]))
+        return self._header(rng, book_id), "\n\n".join(body)
+
+    def datalake_dir(self, root: Path, index: int) -> Path:
+        start = datetime.strptime(self.config.start_date, "%Y%m%d")
+        at = start + timedelta(hours=index // max(1, self.config.books_per_hour))
+        return root / at.strftime("%Y%m%d") / at.strftime("%H")
+
+    def _header(self, rng: random.Random, book_id: int) -> str:
+        n_title = rng.randint(1, 5)
+        title = " ".join(w.capitalize() for w in self._sample_words(rng, n_title, skip_function_words=True))
+        author = self.authors[_pick(rng, self._author_cum)]
+        language = LANGUAGES[_pick(rng, self._language_cum)][0]
+        released = date(1971, 1, 1) + timedelta(days=rng.randrange(54 * 365))
+        release = f"{MONTHS[released.month - 1]} {released.day}, {released.year}"
+        return (
+            f"The Project Gutenberg eBook of {title}\n\n"
+            f"{LICENSE_BLURB}\n\n"
+            f"Title: {title}\n\n"
+            f"Author: {author}\n\n"
+            f"Release date: {release} [eBook #{book_id}]\n\n"
+            f"Language: {language}\n\n"
+            f"Credits: Synthetic corpus (seed {self.config.seed})"
+        )
+
+    def _sample_words(self, rng: random.Random, k: int, skip_function_words: bool = False) -> List[str]:
+        words = rng.choices(self.vocabulary, cum_weights=self._cum, k=k)
+        if skip_function_words:
+            words = [w if w not in FUNCTION_WORDS else rng.choice(self._tail) for w in words]
+        return words
+
+    @staticmethod
+    def _paragraph(rng: random.Random, words: List[str]) -> str:
+        sentences, i = [], 0
+        while i < len(words):
+            n = rng.randint(8, 20)
+            chunk = words[i:i + n]
+            sentences.append(chunk[0].capitalize() + (" " + " ".join(chunk[1:]) if len(chunk) > 1 else "") + ".")
+            i += n
+        return " ".join(sentences)
+
+    @staticmethod
+    def _build_vocabulary(rng: random.Random, size: int) -> List[str]:
+        words = dict.fromkeys(FUNCTION_WORDS)
+        while len(words) < size:
+            words.setdefault("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 5))))
+        invented = sorted(list(words)[len(FUNCTION_WORDS):], key=len)
+        return FUNCTION_WORDS + invented
+
+    @staticmethod
+    def _build_authors(rng: random.Random, n: int) -> List[str]:
+        names = set()
+        while len(names) < n:
+            last = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+            names.add(f"{rng.choice(FIRST_NAMES)} {last}")
+        return sorted(names)
+
+
+def _pick(rng: random.Random, cum: List[float]) -> int:
+    return bisect.bisect_left(cum, rng.random() * cum[-1])
+
+
+_worker_generator: Optional[CorpusGenerator] = None
+
+
+def _init_worker(config: CorpusConfig) -> None:
+    global _worker_generator
+    _worker_generator = CorpusGenerator(config)
+
+
+def _write_books(args: Tuple[Path, List[Tuple[int, int]]]) -> List[Tuple[int, str, str, int]]:
+    root, items = args
+    out = []
+    for index, book_id in items:
+        header, body = _worker_generator.book(book_id)
+        target = _worker_generator.datalake_dir(root, index)
+        target.mkdir(parents=True, exist_ok=True)
+        header_path = target / f"{book_id}.header.txt"
+        body_path = target / f"{book_id}.body.txt"
+        header_path.write_text(header, encoding="utf-8")
+        body_path.write_text(body, encoding="utf-8")
+        out.append((book_id, str(header_path), str(body_path), len(body)))
+    return out
+
+
+def generate_corpus(datalake_root: str | Path, n_books: int, config: Optional[CorpusConfig] = None,
+                    start_id: int = 1, workers: int = 0, batch_size: int = 200) -> Tuple[int, int]:
+    """Genera n_books libros a partir de start_id. Devuelve (libros, bytes de cuerpo escritos)."""
+    config = config or CorpusConfig()
+    root = Path(datalake_root)
+    root.mkdir(parents=True, exist_ok=True)
+    manifest = DatalakeManifest.open(root)
+    items = list(enumerate(range(start_id, start_id + n_books)))
+    batches = [(root, items[i:i + batch_size]) for i in range(0, len(items), batch_size)]
+
+    written = body_bytes = 0
+    workers = (os.cpu_count() or 1) if workers < 0 else workers
+    if workers > 0:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config,)) as pool:
+            results = pool.map(_write_books, batches)
+            for rows in results:
+                manifest.record_many((bid, h, b) for bid, h, b, _ in rows)
+                written += len(rows)
+                body_bytes += sum(n for *_, n in rows)
+    else:
+        _init_worker(config)
+        for batch in batches:
+            rows = _write_books(batch)
+            manifest.record_many((bid, h, b) for bid, h, b, _ in rows)
+            written += len(rows)
+            body_bytes += sum(n for *_, n in rows)
+    return written, body_bytes
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    defaults = CorpusConfig()
+    parser = argparse.ArgumentParser(description="Genera un datalake sintético con formato Gutenberg.")
+    parser.add_argument("--datalake", default="synthetic_datalake")
+    parser.add_argument("--books", type=int, default=1000)
+    parser.add_argument("--start-id", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=0, help="Procesos (0 = en este proceso, -1 = nº de CPUs).")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--vocabulary", type=int, default=defaults.vocabulary_size)
+    parser.add_argument("--zipf-s", type=float, default=defaults.zipf_s)
+    parser.add_argument("--median-words", type=int, default=defaults.median_words)
+    parser.add_argument("--sigma", type=float, default=defaults.sigma)
+    parser.add_argument("--min-words", type=int, default=defaults.min_words)
+    parser.add_argument("--max-words", type=int, default=defaults.max_words)
+    parser.add_argument("--tail-ratio", type=float, default=defaults.tail_ratio)
+    parser.add_argument("--start-date", default=defaults.start_date, help="Primera carpeta YYYYMMDD.")
+    parser.add_argument("--books-per-hour", type=int, default=defaults.books_per_hour)
+    args = parser.parse_args(argv)
+
+    config = CorpusConfig(
+        seed=args.seed,
+        vocabulary_size=args.vocabulary,
+        zipf_s=args.zipf_s,
+        median_words=args.median_words,
+        sigma=args.sigma,
+        min_words=args.min_words,
+        max_words=args.max_words,
+        tail_ratio=args.tail_ratio,
+        start_date=args.start_date,
+        books_per_hour=args.books_per_hour,
+    )
+    t0 = time.perf_counter()
+    n, body_bytes = generate_corpus(args.datalake, args.books, config, args.start_id, args.workers)
+    elapsed = time.perf_counter() - t0
+    print(f"[CORPUS] {n} libros ({body_bytes / 1e6:,.1f} MB de cuerpo) en {Path(args.datalake).resolve()} "
+          f"en {elapsed:.1f}s ({n / elapsed if elapsed > 0 else 0:,.0f} libros/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
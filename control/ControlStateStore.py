@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+DOWNLOADED = "downloaded"
+INDEXING = "indexing"
+INDEXED = "indexed"
+METADATA_SAVED = "metadata_saved"
+FAILED = "failed"
+# Veces que se reclama un libro para indexar antes de darlo por perdido
+MAX_ATTEMPTS = 3
+
+
+class ControlStateStore:
+    """
+    Estado persistente del pipeline de control: un registro por libro con su
+    estado (downloaded -> indexing -> indexed -> metadata_saved, o failed).
+
+    SQLite en modo WAL: cada transición es una transacción que solo se aplica
+    si el libro sigue en el estado esperado, así que un corte a mitad de tick
+    no deja estados incoherentes. Al abrir el store, los libros que quedaron
+    en "indexing" tras una caída vuelven a "downloaded", igual que los
+    "failed" a los que les quedan intentos; los que están en "indexed" solo
+    necesitan el paso de metadatos (next_with_status). Buscar el siguiente
+    libro a indexar usa el índice (status, book_id) y no depende del tamaño
+    del corpus.
+    """
+
+    def __init__(self, path: str | Path, legacy_downloads: Optional[Path] = None,
+                 legacy_indexings: Optional[Path] = None) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        is_new = not self.path.exists()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS books ("
+            " book_id INTEGER PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT,"
+            " updated_at REAL NOT NULL"
+            ")"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS books_status ON books (status, book_id)")
+        if is_new:
+            self._import_legacy(legacy_downloads, legacy_indexings)
+        self.recover()
+
+    def is_known(self, book_id: int) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM books WHERE book_id = ?", (int(book_id),)).fetchone()
+        return row is not None
+
+    def status(self, book_id: int) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM books WHERE book_id = ?", (int(book_id),)).fetchone()
+        return row[0] if row else None
+
+    def mark_downloaded(self, book_id: int) -> bool:
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO books (book_id, status, updated_at) VALUES (?, ?, ?)",
+                (int(book_id), DOWNLOADED, time.time()),
+            )
+        return cur.rowcount == 1
+
+    def import_many(self, book_ids: Iterable[int], status: str = DOWNLOADED) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO books (book_id, status, updated_at) VALUES (?, ?, ?)",
+                ((int(b), status, now) for b in book_ids),
+            )
+            self._conn.execute("COMMIT")
+
+    def claim_next_to_index(self) -> Optional[int]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT book_id FROM books WHERE status = ? ORDER BY book_id LIMIT 1", (DOWNLOADED,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE books SET status = ?, attempts = attempts + 1, updated_at = ? WHERE book_id = ?",
+                    (INDEXING, time.time(), row[0]),
+                )
+                self._conn.execute("COMMIT")
+                return int(row[0])
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def next_with_status(self, status: str) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT book_id FROM books WHERE status = ? ORDER BY book_id LIMIT 1", (status,)
+            ).fetchone()
+        return int(row[0]) if row else None
+
+    def transition(self, book_id: int, from_status: str, to_status: str, error: Optional[str] = None) -> bool:
+        # attempts cuenta las veces que el libro se reclamó para indexar
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE books SET status = ?, error = ?, attempts = attempts + ?, updated_at = ?"
+                " WHERE book_id = ? AND status = ?",
+                (to_status, error, int(to_status == INDEXING), time.time(), int(book_id), from_status),
+            )
+        return cur.rowcount == 1
+
+    def mark_failed(self, book_id: int, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO books (book_id, status, error, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(book_id) DO UPDATE SET status = excluded.status, error = excluded.error, "
+                "updated_at = excluded.updated_at",
+                (int(book_id), FAILED, error[:500], time.time()),
+            )
+
+    def recover(self, max_attempts: int = MAX_ATTEMPTS) -> int:
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE books SET status = ?, updated_at = ? WHERE status = ?",
+                (DOWNLOADED, time.time(), INDEXING),
+            )
+        return cur.rowcount + self.retry_failed(max_attempts)
+
+    def retry_failed(self, max_attempts: int = MAX_ATTEMPTS) -> int:
+        """
+        Devuelve a "downloaded" los libros fallidos que llegaron a reclamarse para
+        indexar (attempts > 0) y aún no agotaron sus intentos. Los que fallaron
+        antes, al descargarse o guardarse en el datalake, no se reintentan.
+        """
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE books SET status = ?, updated_at = ? WHERE status = ? AND attempts > 0 AND attempts < ?",
+                (DOWNLOADED, time.time(), FAILED, int(max_attempts)),
+            )
+        return cur.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM books GROUP BY status").fetchall()
+        return {status: int(n) for status, n in rows}
+
+    def book_ids(self, status: str) -> List[int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT book_id FROM books WHERE status = ? ORDER BY book_id", (status,)
+            ).fetchall()
+        return [int(r[0]) for r in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _import_legacy(self, downloads: Optional[Path], indexings: Optional[Path]) -> None:
+        # Migración única desde downloaded_books.txt / indexed_books.txt
+        def _ids(path: Optional[Path]) -> List[int]:
+            if not path or not path.exists():
+                return []
+            return [int(x) for x in path.read_text(encoding="utf-8").split() if x.strip().isdigit()]
+
+        indexed = set(_ids(indexings))
+        self.import_many(indexed, METADATA_SAVED)
+        self.import_many((b for b in _ids(downloads) if b not in indexed), DOWNLOADED)
@@ -1,4 +1,3 @@
-from typing import Union
 from pathlib import Path
 import random
 import time
@@ -6,90 +5,115 @@ import time
 from apscheduler.schedulers.background import BackgroundScheduler
 from pymongo import MongoClient
 
-from application.bookService import download_book, create_datalake, BookService
+from application.InvertedIndexRepository import InvertedIndexRepository
+from application.bookService import BookService, DATALAKE_ROOT, GUTENBERG_BASE_URL
+from application.downloadService import DownloadService
+from control.ControlStateStore import ControlStateStore, INDEXING, INDEXED, METADATA_SAVED
 from infrastructure.InvertedIndexMongoDBRepository import InvertedIndexMongoDBRepository
+from infrastructure.MetadataMongoDBRepository import MetadataMongoDBRepository
 from utils.DatalakeDetector import detect_datalake_root
+from utils.Metrics import METRICS
 
+MONGO_URI = "mongodb://localhost:27017"
 CONTROL_PATH = Path("../control")
 DOWNLOADS = CONTROL_PATH / "downloaded_books.txt"
 INDEXINGS = CONTROL_PATH / "indexed_books.txt"
-STAGING_DIR = Path("../staging/downloads")
+STATE_DB = CONTROL_PATH / "control_state.sqlite"
+# Con METRICS=1 cada ciclo añade una línea a metrics.jsonl y reescribe metrics.prom
+METRICS_JSONL = CONTROL_PATH / "metrics.jsonl"
+METRICS_PROM = CONTROL_PATH / "metrics.prom"
 TOTAL_BOOKS = 70000
 MAX_RETRIES_NEW_BOOK = 10
 SLEEP_SECONDS_BETWEEN_RUNS = 0
+DOWNLOAD_BATCH_SIZE = 8
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_REQUESTS_PER_SECOND = 4.0
 
-def _read_ids(path: Path) -> set[str]:
-    if path.exists():
-        return set(path.read_text(encoding="utf-8").splitlines())
-    return set()
 
-def _append_id(path: Path, book_id: int) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(f"{book_id}\n")
+def control_pipeline_step(state: ControlStateStore, downloader: DownloadService,
+                          inverted_index: InvertedIndexRepository, book_service: BookService) -> None:
+    with METRICS.timer("control.step"):
+        _control_pipeline_step(state, downloader, inverted_index, book_service)
+    if METRICS.enabled:
+        METRICS.append_jsonl(METRICS_JSONL)
+        METRICS.write_prometheus(METRICS_PROM)
 
-def _safe_int(s: Union[str, int]) -> int:
-    return int(s) if not isinstance(s, int) else s
 
-def control_pipeline_step() -> None:
-    CONTROL_PATH.mkdir(parents=True, exist_ok=True)
-    STAGING_DIR.mkdir(parents=True, exist_ok=True)
-    downloaded = _read_ids(DOWNLOADS)
-    indexed = _read_ids(INDEXINGS)
-    ready_to_index = downloaded - indexed
-    from infrastructure.MetadataMongoDBRepository import MetadataMongoDBRepository
-    from application.bookService import BookService
-
-
-    mongo_client = MongoClient("mongodb://localhost:27017")
-
-    metadata_repo = MetadataMongoDBRepository(
-        client=mongo_client,
-        db_name="inverted_db",
-        collection="metadata"
-    )
+def _control_pipeline_step(state: ControlStateStore, downloader: DownloadService,
+                           inverted_index: InvertedIndexRepository, book_service: BookService) -> None:
+    book_id = state.next_with_status(INDEXED)
+    if book_id is not None:
+        # Indexado en un tick que se cortó antes de guardar los metadatos
+        print(f"[CONTROL] Resuming metadata for book {book_id}...")
+        try:
+            book_service.ensure_metadata(book_id)
+            state.transition(book_id, INDEXED, METADATA_SAVED)
+        except Exception as e:
+            state.mark_failed(book_id, str(e))
+            print(f"[CONTROL][ERROR] Fallaron los metadatos de {book_id}: {e}")
+        return
 
-    if ready_to_index:
-        book_id = _safe_int(ready_to_index.pop())
+    book_id = state.claim_next_to_index()
+    if book_id is None and state.retry_failed():
+        book_id = state.claim_next_to_index()
+    if book_id is not None:
         print(f"[CONTROL] Scheduling book {book_id} for indexing...")
         try:
-            datalake_root = str(detect_datalake_root())
-            inverted_index = InvertedIndexMongoDBRepository(
-                uri="mongodb://localhost:27017",
-                db_name="inverted_db",
-                datalake_root=datalake_root,
-                index_collection="inverted_index"
-            )
             inverted_index.index_book(book_id)
-            BookService(metadata_repo).create_metadata(book_id)
-            _append_id(INDEXINGS, book_id)
+            state.transition(book_id, INDEXING, INDEXED)
+            book_service.ensure_metadata(book_id)
+            state.transition(book_id, INDEXED, METADATA_SAVED)
             print(f"[CONTROL] Book {book_id} successfully indexed.")
         except Exception as e:
+            state.mark_failed(book_id, str(e))
             print(f"[CONTROL][ERROR] Falló el indexado de {book_id}: {e}")
         return
 
-    for _ in range(MAX_RETRIES_NEW_BOOK):
+    candidates = set()
+    for _ in range(MAX_RETRIES_NEW_BOOK * DOWNLOAD_BATCH_SIZE):
         candidate_id = random.randint(1, TOTAL_BOOKS)
-        if str(candidate_id) in downloaded:
-            continue
-        print(f"[CONTROL] Downloading new book with ID {candidate_id}...")
-        try:
-            download_book(candidate_id, str(STAGING_DIR))
-            ok = create_datalake(candidate_id, str(STAGING_DIR))
-            if ok:
-                _append_id(DOWNLOADS, candidate_id)
-                print(f"[CONTROL] Book {candidate_id} downloaded and registered.")
-                return
-            else:
-                print(f"[CONTROL][WARN] Libro {candidate_id} no válido.")
-        except Exception as e:
-            print(f"[CONTROL][ERROR] Descarga {candidate_id} falló: {e}")
+        if not state.is_known(candidate_id):
+            candidates.add(candidate_id)
+        if len(candidates) >= DOWNLOAD_BATCH_SIZE:
+            break
+
+    print(f"[CONTROL] Downloading {len(candidates)} new books: {sorted(candidates)}...")
+    results = downloader.stream_many(candidates, DATALAKE_ROOT)
+    registered = 0
+    for candidate_id, ok in results.items():
+        if ok:
+            state.mark_downloaded(candidate_id)
+            registered += 1
+            print(f"[CONTROL] Book {candidate_id} downloaded and registered.")
+        else:
+            print(f"[CONTROL][WARN] Libro {candidate_id} no válido.")
+
+    if not registered:
+        print("[CONTROL] No se encontró un libro nuevo para descargar en este ciclo.")
 
-    print("[CONTROL] No se encontró un libro nuevo para descargar en este ciclo.")
 
 if __name__ == "__main__":
+    # Un único cliente (con su pool de conexiones) y repositorios para todos los ciclos
+    mongo_client = MongoClient(MONGO_URI)
+    inverted_index = InvertedIndexMongoDBRepository(
+        uri=MONGO_URI,
+        db_name="inverted_db",
+        datalake_root=str(detect_datalake_root()),
+        index_collection="inverted_index",
+        client=mongo_client,
+    )
+    inverted_index.ensure_stats()
+    book_service = BookService(MetadataMongoDBRepository(client=mongo_client, db_name="inverted_db",
+                                                         collection="metadata"))
+    downloader = DownloadService(
+        base_url=GUTENBERG_BASE_URL,
+        max_workers=DOWNLOAD_WORKERS,
+        requests_per_second_per_host=DOWNLOAD_REQUESTS_PER_SECOND,
+    )
+    # Los ficheros .txt antiguos solo se leen una vez para migrarlos al store
+    state = ControlStateStore(STATE_DB, legacy_downloads=DOWNLOADS, legacy_indexings=INDEXINGS)
     scheduler = BackgroundScheduler()
-    scheduler.add_job(control_pipeline_step, "interval", seconds=4)
+    scheduler.add_job(control_pipeline_step, "interval", seconds=4, args=(state, downloader, inverted_index, book_service))
     scheduler.start()
     print("[CONTROL] Starting...")
     try:
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from application.MetadataRepository import MetadataRepository
+from domain.book import Book
+from utils.DatalakeManifest import DatalakeManifest
+from utils.DatalakePack import read_location
+from utils.GutenbergHeaderSerializer import GutenbergHeaderSerializer
+
+
+def parse_header_worker(item: Tuple[int, str]) -> Optional[Book]:
+    """Parsea una cabecera del datalake en un proceso del pool; None si no se puede leer."""
+    book_id, location = item
+    try:
+        book = GutenbergHeaderSerializer.from_text(read_location(location))
+    except (OSError, ValueError):
+        return None
+    # El id del manifiesto manda: es el que usan el índice y la comprobación de pendientes
+    book.book_id = book_id
+    return book
+
+
+def backfill_metadata(
+    repo: MetadataRepository,
+    datalake_root: str | Path,
+    workers: int = 0,
+    batch_size: int = 1000,
+    chunksize: int = 64,
+    report_every: int = 5000,
+) -> Dict[str, float]:
+    """
+    Rellena los metadatos de todas las cabeceras del datalake que aún no estén
+    en el repositorio. Las cabeceras se parsean en un ProcessPoolExecutor
+    (workers=0 usa os.cpu_count()) y se guardan con save_metadata_many en
+    lotes de batch_size, a medida que llegan.
+    """
+    # Instancia compartida del proceso: no se cierra aquí
+    locations = DatalakeManifest.open(datalake_root).locations("header")
+
+    pending = _pending(repo, locations, batch_size)
+    workers = workers or os.cpu_count() or 1
+    stats = {"headers": len(locations), "skipped": len(locations) - len(pending), "saved": 0, "failed": 0}
+    print(f"[BACKFILL] {len(pending)} cabeceras pendientes de {len(locations)} ({workers} procesos)")
+
+    start = time.perf_counter()
+    parsed = 0
+    batch: List[Book] = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for book in pool.map(parse_header_worker, pending, chunksize=chunksize):
+            parsed += 1
+            if book is None:
+                stats["failed"] += 1
+            else:
+                batch.append(book)
+            if len(batch) >= batch_size:
+                _flush(repo, batch, stats)
+            if report_every and parsed % report_every == 0:
+                rate = parsed / max(time.perf_counter() - start, 1e-9)
+                print(f"[BACKFILL] {parsed}/{len(pending)} ({rate:,.0f} cabeceras/s)")
+    _flush(repo, batch, stats)
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["headers_per_s"] = parsed / stats["seconds"] if stats["seconds"] > 0 else 0.0
+    return stats
+
+
+def _pending(repo: MetadataRepository, locations: List[Tuple[int, str]],
+             batch_size: int) -> List[Tuple[int, str]]:
+    pending = []
+    for start in range(0, len(locations), batch_size):
+        chunk = locations[start:start + batch_size]
+        stored = {b.book_id for b in repo.get_metadata_many([bid for bid, _ in chunk])}
+        pending.extend(item for item in chunk if item[0] not in stored)
+    return pending
+
+
+def _flush(repo: MetadataRepository, batch: List[Book], stats: Dict[str, float]) -> None:
+    if not batch:
+        return
+    ids = repo.save_metadata_many(batch)
+    saved = sum(1 for i in ids if i is not None)
+    stats["saved"] += saved
+    stats["failed"] += len(batch) - saved
+    batch.clear()
+
+
+if __name__ == "__main__":
+    from utils.DatalakeDetector import detect_datalake_root
+
+    parser = argparse.ArgumentParser(description="Rellena los metadatos a partir de las cabeceras del datalake.")
+    parser.add_argument("--backend", choices=("mongodb", "sqlite"), default="mongodb")
+    parser.add_argument("--sqlite-path", default="metadata.sqlite")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--datalake", default=None, help="Raíz del datalake (por defecto, la detectada).")
+    parser.add_argument("--workers", type=int, default=0, help="Procesos de parseo (0 = os.cpu_count()).")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.backend == "sqlite":
+        from infrastructure.MetadataSQLiteRepository import MetadataSQLiteRepository
+
+        repository: MetadataRepository = MetadataSQLiteRepository(args.sqlite_path)
+    else:
+        from pymongo import MongoClient
+
+        from infrastructure.MetadataMongoDBRepository import MetadataMongoDBRepository
+
+        repository = MetadataMongoDBRepository(MongoClient(args.mongo_uri), "inverted_db", "metadata")
+
+    root = Path(args.datalake) if args.datalake else detect_datalake_root()
+    summary = backfill_metadata(repository, root, workers=args.workers, batch_size=args.batch_size)
+    print("=" * 60)
+    for key, value in summary.items():
+        print(f"{key:>15}: {value:,.2f}" if isinstance(value, float) else f"{key:>15}: {value}")
+    print("=" * 60)
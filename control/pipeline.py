@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import argparse
+import queue
+import random
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from application.bookService import BookService, DATALAKE_ROOT, iter_response_text, split_stream_to_datalake
+from application.downloadService import DownloadService
+from application.InvertedIndexRepository import InvertedIndexRepository
+from control.ControlStateStore import ControlStateStore, DOWNLOADED, INDEXING, INDEXED, METADATA_SAVED
+from utils.Metrics import METRICS
+
+_STOP = object()
+
+
+@dataclass
+class PipelineConfig:
+    target_books: int = 100
+    total_books: int = 70000
+    download_workers: int = 8
+    metadata_workers: int = 2
+    queue_size: int = 32
+    index_batch_size: int = 50
+    index_batch_wait_seconds: float = 2.0
+    report_every_seconds: float = 10.0
+    # Con las métricas activas, se exportan en cada informe periódico y al terminar
+    metrics_prom_path: Optional[str] = None
+    metrics_jsonl_path: Optional[str] = None
+
+
+class _StageStats:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.ok = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, ok: bool, elapsed: float, n: int = 1) -> None:
+        with self._lock:
+            if ok:
+                self.ok += n
+            else:
+                self.failed += n
+            self.busy_seconds += elapsed
+
+
+class IngestionPipeline:
+    """
+    Pipeline de ingesta de larga duración: download -> index -> metadata.
+
+    Cada etapa tiene su propio número de hilos y se comunica con la siguiente
+    mediante colas acotadas, de modo que una etapa lenta frena a las anteriores
+    (backpressure) en lugar de acumular trabajo en memoria. Los repositorios y
+    la sesión HTTP se crean una sola vez y se comparten entre ticks.
+
+    La etapa de descarga lee cada respuesta hasta el final mientras la trocea
+    hacia el datalake: ninguna conexión abierta espera en una cola, y
+    download_workers es el número real de transferencias simultáneas.
+
+    La etapa de índice usa un único hilo escritor y agrupa libros para
+    index_books; el paralelismo de tokenización se configura en el propio
+    repositorio (parallel_workers).
+    """
+
+    def __init__(
+        self,
+        config: PipelineConfig,
+        downloader: DownloadService,
+        inverted_index: InvertedIndexRepository,
+        book_service: BookService,
+        state: ControlStateStore,
+        datalake_root: str | Path = DATALAKE_ROOT,
+    ) -> None:
+        self.config = config
+        self.downloader = downloader
+        self.inverted_index = inverted_index
+        self.book_service = book_service
+        self.state = state
+        self.datalake_root = datalake_root
+
+        self.download_q: queue.Queue = queue.Queue(maxsize=config.queue_size)
+        self.index_q: queue.Queue = queue.Queue(maxsize=config.queue_size)
+        self.metadata_q: queue.Queue = queue.Queue(maxsize=config.queue_size)
+
+        self.stats = {name: _StageStats(name) for name in ("download", "index", "metadata")}
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run(self) -> Dict[str, float]:
+        t0 = time.perf_counter()
+        stages = [
+            (self._spawn("download", self.config.download_workers, self._download_worker), self.index_q),
+            (self._spawn("index", 1, self._index_worker), self.metadata_q),
+            (self._spawn("metadata", self.config.metadata_workers, self._metadata_worker), None),
+        ]
+        reporter = threading.Thread(target=self._report_loop, args=(t0,), daemon=True)
+        reporter.start()
+
+        self._resume_backlog()
+        self._produce_candidates()
+        self._put_stops(self.download_q, self.config.download_workers)
+
+        for i, (threads, downstream) in enumerate(stages):
+            for t in threads:
+                t.join()
+            if downstream is not None:
+                self._put_stops(downstream, len(stages[i + 1][0]))
+
+        self._stop.set()
+        self._export_metrics()
+        return self._summary(time.perf_counter() - t0)
+
+    # --- etapas ---------------------------------------------------------
+
+    def _resume_backlog(self) -> None:
+        # Libros que quedaron a medias en una ejecución anterior
+        for book_id in self.state.book_ids(INDEXED):
+            self.metadata_q.put(book_id)
+        for book_id in self.state.book_ids(DOWNLOADED):
+            self.index_q.put(book_id)
+
+    def _produce_candidates(self) -> None:
+        ids = list(range(1, self.config.total_books + 1))
+        random.shuffle(ids)
+        for candidate_id in ids:
+            if self._stop.is_set() or self.stats["download"].ok >= self.config.target_books:
+                break
+            if self.state.is_known(candidate_id):
+                continue
+            self.download_q.put(candidate_id)
+
+    def _download_worker(self) -> None:
+        self._run_stage(self.download_q, self.stats["download"], self._download_one, self.index_q)
+
+    def _download_one(self, book_id: int) -> Optional[int]:
+        response = self.downloader.open_stream(book_id)
+        if response is None:
+            return None
+        with response:
+            ok = split_stream_to_datalake(book_id, iter_response_text(response), self.datalake_root)
+        if not ok:
+            self.state.mark_failed(book_id, "Faltan los marcadores START/END de Gutenberg")
+            return None
+        self.state.mark_downloaded(book_id)
+        return book_id
+
+    def _index_worker(self) -> None:
+        stats = self.stats["index"]
+        batch: List[int] = []
+        deadline = None
+        stopped = False
+        while not stopped:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.index_q.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                stopped = True
+            elif item is not None:
+                if self.state.transition(item, DOWNLOADED, INDEXING):
+                    batch.append(item)
+                    deadline = deadline or time.monotonic() + self.config.index_batch_wait_seconds
+            expired = deadline is not None and time.monotonic() >= deadline
+            if batch and (stopped or expired or len(batch) >= self.config.index_batch_size):
+                self._index_batch(batch, stats)
+                batch, deadline = [], None
+
+    def _index_batch(self, batch: List[int], stats: _StageStats) -> None:
+        t0 = time.perf_counter()
+        try:
+            self.inverted_index.index_books(batch)
+        except Exception as e:
+            print(f"[PIPELINE][ERROR] Falló el indexado del lote {batch[0]}..{batch[-1]}: {e}")
+            for book_id in batch:
+                self.state.mark_failed(book_id, str(e))
+            stats.record(False, time.perf_counter() - t0, len(batch))
+            return
+        stats.record(True, time.perf_counter() - t0, len(batch))
+        for book_id in batch:
+            self.state.transition(book_id, INDEXING, INDEXED)
+            self.metadata_q.put(book_id)
+
+    def _metadata_worker(self) -> None:
+        self._run_stage(self.metadata_q, self.stats["metadata"], self._metadata_one, None)
+
+    def _metadata_one(self, book_id: int) -> Optional[int]:
+        self.book_service.ensure_metadata(book_id)
+        self.state.transition(book_id, INDEXED, METADATA_SAVED)
+        return book_id
+
+    # --- utilidades -----------------------------------------------------
+
+    def _spawn(self, name: str, n: int, target: Callable[[], None]) -> List[threading.Thread]:
+        threads = [threading.Thread(target=target, name=f"{name}-{i}", daemon=True) for i in range(max(1, n))]
+        for t in threads:
+            t.start()
+        return threads
+
+    @staticmethod
+    def _put_stops(q: queue.Queue, n: int) -> None:
+        for _ in range(n):
+            q.put(_STOP)
+
+    def _run_stage(self, in_q: queue.Queue, stats: _StageStats, fn: Callable, out_q: Optional[queue.Queue]) -> None:
+        while True:
+            item = in_q.get()
+            if item is _STOP:
+                return
+            t0 = time.perf_counter()
+            try:
+                result = fn(item)
+            except Exception as e:
+                print(f"[PIPELINE][ERROR] Etapa {stats.name}, libro {item}: {e}")
+                if stats.name != "download":
+                    self.state.mark_failed(item, str(e))
+                result = None
+            stats.record(result is not None, time.perf_counter() - t0)
+            if result is not None and out_q is not None:
+                out_q.put(result)
+
+    def _summary(self, elapsed: float) -> Dict[str, float]:
+        done = self.stats["metadata"].ok
+        out = {"elapsed_seconds": elapsed, "books_completed": done,
+               "books_per_min": done / elapsed * 60 if elapsed > 0 else 0.0}
+        for name, st in self.stats.items():
+            out[f"{name}_ok"] = st.ok
+            out[f"{name}_failed"] = st.failed
+        return out
+
+    def _report_loop(self, t0: float) -> None:
+        while not self._stop.wait(self.config.report_every_seconds):
+            elapsed = time.perf_counter() - t0
+            stages = " ".join(f"{st.name}={st.ok}/{st.failed}" for st in self.stats.values())
+            queues = f"q[dl={self.download_q.qsize()} idx={self.index_q.qsize()} meta={self.metadata_q.qsize()}]"
+            rate = self.stats["metadata"].ok / elapsed * 60 if elapsed > 0 else 0.0
+            print(f"[PIPELINE] {elapsed:7.1f}s {stages} {queues} {rate:.1f} books/min")
+            self._export_metrics()
+
+    def _export_metrics(self) -> None:
+        if not METRICS.enabled:
+            return
+        if self.config.metrics_prom_path:
+            METRICS.write_prometheus(self.config.metrics_prom_path)
+        if self.config.metrics_jsonl_path:
+            METRICS.append_jsonl(self.config.metrics_jsonl_path)
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+
+    from infrastructure.InvertedIndexMongoDBRepository import InvertedIndexMongoDBRepository
+    from infrastructure.MetadataMongoDBRepository import MetadataMongoDBRepository
+    from utils.DatalakeDetector import detect_datalake_root
+
+    parser = argparse.ArgumentParser(description="Pipeline de ingesta por etapas con colas acotadas.")
+    parser.add_argument("--books", type=int, default=PipelineConfig.target_books)
+    parser.add_argument("--download-workers", type=int, default=PipelineConfig.download_workers)
+    parser.add_argument("--metadata-workers", type=int, default=PipelineConfig.metadata_workers)
+    parser.add_argument("--tokenizer-workers", type=int, default=0)
+    parser.add_argument("--queue-size", type=int, default=PipelineConfig.queue_size)
+    parser.add_argument("--index-batch", type=int, default=PipelineConfig.index_batch_size)
+    parser.add_argument("--requests-per-second", type=float, default=4.0)
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--metrics", action="store_true", help="Activa temporizadores y contadores por etapa.")
+    parser.add_argument("--trace-memory", action="store_true", help="Añade picos de memoria con tracemalloc.")
+    args = parser.parse_args()
+
+    control_path = Path("../control")
+    if args.metrics or args.trace_memory:
+        METRICS.enable(trace_memory=args.trace_memory)
+    DATALAKE_ROOT.mkdir(parents=True, exist_ok=True)
+    mongo_client = MongoClient(args.mongo_uri)
+    inverted_index = InvertedIndexMongoDBRepository(
+        uri=args.mongo_uri,
+        db_name="inverted_db",
+        datalake_root=str(detect_datalake_root()),
+        index_collection="inverted_index",
+        parallel_workers=args.tokenizer_workers,
+        client=mongo_client,
+    )
+    # Migración de estadísticas de versiones anteriores, una vez antes de arrancar las etapas
+    inverted_index.ensure_stats()
+    pipeline = IngestionPipeline(
+        config=PipelineConfig(
+            target_books=args.books,
+            download_workers=args.download_workers,
+            metadata_workers=args.metadata_workers,
+            queue_size=args.queue_size,
+            index_batch_size=args.index_batch,
+            metrics_prom_path=str(control_path / "metrics.prom"),
+            metrics_jsonl_path=str(control_path / "metrics.jsonl"),
+        ),
+        downloader=DownloadService(max_workers=args.download_workers,
+                                   requests_per_second_per_host=args.requests_per_second),
+        inverted_index=inverted_index,
+        book_service=BookService(MetadataMongoDBRepository(mongo_client, "inverted_db", "metadata")),
+        state=ControlStateStore(control_path / "control_state.sqlite",
+                                legacy_downloads=control_path / "downloaded_books.txt",
+                                legacy_indexings=control_path / "indexed_books.txt"),
+    )
+    print("[PIPELINE] Starting...")
+    try:
+        summary = pipeline.run()
+    except KeyboardInterrupt:
+        pipeline.stop()
+        raise
+    print("=" * 60)
+    for key, value in summary.items():
+        print(f"{key:>20}: {value:,.2f}" if isinstance(value, float) else f"{key:>20}: {value}")
+    print("=" * 60)
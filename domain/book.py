@@ -1,6 +1,6 @@
 from __future__ import annotations
 from dataclasses import dataclass, asdict
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 @dataclass
 class Book:
@@ -8,6 +8,14 @@ class Book:
     title: Optional[str]
     author: Optional[str]
     language: Optional[str]
+    release_date: Optional[str] = None
+    credits: Optional[str] = None
 
     def to_dict(self) -> Dict[str, Any]:
         return asdict(self)
+
+
+@dataclass
+class BookPage:
+    items: List[Book]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,692 @@
+from __future__ import annotations
+
+import heapq
+import json
+import math
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+from itertools import groupby
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from application.InvertedIndexRepository import InvertedIndexRepository
+from utils.BooleanQuery import BooleanQuery, union_many
+from utils.DatalakeManifest import DatalakeManifest
+from utils.DatalakePack import read_location
+from utils.Metrics import METRICS
+from utils.PostingsCodec import PostingsCodec
+from utils.TextPipeline import TextPipeline, content_hash, tokenize_books_parallel
+
+_MAGIC = b"IIDX"
+_VERSION = 1
+_HEADER = struct.Struct("<4sIQ")        # magic, versión, n_terms
+_OFFSET = struct.Struct("<Q")           # offset de cada entrada dentro de la zona de entradas
+_ENTRY_TAIL = struct.Struct("<QII")     # offset en .post, longitud en bytes, df
+_TERM_LEN = struct.Struct("<H")
+
+_TERM_OVERHEAD_BYTES = 160
+_POSTING_BYTES = 36
+
+
+def write_segment(prefix: Path, postings_by_term: Dict[str, List[int]]) -> int:
+    """
+    Escribe un segmento inmutable: `<prefix>.dict` (diccionario de términos
+    ordenado por bytes UTF-8, con tabla de offsets para búsqueda binaria) y
+    `<prefix>.post` (postings ordenados, delta + varint). Devuelve n_terms.
+    """
+    items = sorted((t.encode("utf-8"), sorted(set(ids))) for t, ids in postings_by_term.items())
+    return write_sorted_segment(prefix, items)
+
+
+def write_sorted_segment(prefix: Path, items: Iterable[Tuple[bytes, List[int]]]) -> int:
+    """Como write_segment, pero consume (término UTF-8, ids ordenados) ya ordenados por término."""
+    entries = bytearray()
+    offsets = []
+    with open(f"{prefix}.post.tmp", "wb") as post:
+        pos = 0
+        for tb, ids in items:
+            blob = PostingsCodec.encode_varint_deltas(ids, -1)
+            post.write(blob)
+            offsets.append(len(entries))
+            entries += _TERM_LEN.pack(len(tb)) + tb + _ENTRY_TAIL.pack(pos, len(blob), len(ids))
+            pos += len(blob)
+    n_terms = len(offsets)
+    offsets.append(len(entries))
+    with open(f"{prefix}.dict.tmp", "wb") as d:
+        d.write(_HEADER.pack(_MAGIC, _VERSION, n_terms))
+        d.write(b"".join(_OFFSET.pack(o) for o in offsets))
+        d.write(entries)
+    os.replace(f"{prefix}.post.tmp", f"{prefix}.post")
+    os.replace(f"{prefix}.dict.tmp", f"{prefix}.dict")
+    return n_terms
+
+
+def merge_segments(prefix: Path, segments: List["SegmentReader"], dead: Optional[List[set]] = None) -> int:
+    """
+    Fusiona segmentos en uno nuevo recorriendo sus diccionarios en orden
+    (k-way merge). dead[i] son los book_ids a descartar del segmento i.
+    """
+    return write_sorted_segment(prefix, iter_merged(segments, dead))
+
+
+def iter_merged(segments: List["SegmentReader"], dead: Optional[List[set]] = None) -> Iterator[Tuple[bytes, List[int]]]:
+    """(término UTF-8, ids ordenados) de la unión de los segmentos, en orden de término."""
+    def _tagged(i: int) -> Iterator[Tuple[bytes, int, int, int]]:
+        for tb, pos, length, _ in segments[i].iter_entries():
+            yield tb, i, pos, length
+
+    streams = [_tagged(i) for i in range(len(segments))]
+    for tb, group in groupby(heapq.merge(*streams), key=lambda e: e[0]):
+        lists = []
+        for _, i, pos, length in group:
+            ids = segments[i].decode_at(pos, length)
+            if dead and dead[i]:
+                ids = [b for b in ids if b not in dead[i]]
+            if ids:
+                lists.append(ids)
+        if lists:
+            yield tb, lists[0] if len(lists) == 1 else union_many(lists)
+
+
+class SegmentReader:
+    """Lectura de un segmento vía mmap: búsqueda binaria en el diccionario y decodificación sin copia."""
+
+    def __init__(self, prefix: Path) -> None:
+        self.prefix = Path(prefix)
+        self.name = self.prefix.name
+        self.seq = int(self.name.split("_")[1])
+        self._dict_f = open(f"{prefix}.dict", "rb")
+        self._post_f = open(f"{prefix}.post", "rb")
+        self._dict = mmap.mmap(self._dict_f.fileno(), 0, access=mmap.ACCESS_READ)
+        size = os.fstat(self._post_f.fileno()).st_size
+        self._post = mmap.mmap(self._post_f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        magic, version, self.n_terms = _HEADER.unpack_from(self._dict, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"Segmento no válido: {prefix}")
+        self._offsets_at = _HEADER.size
+        self._entries_at = self._offsets_at + (self.n_terms + 1) * _OFFSET.size
+        self.size_bytes = len(self._dict) + size
+
+    def _entry(self, i: int) -> Tuple[bytes, int, int, int]:
+        (off,) = _OFFSET.unpack_from(self._dict, self._offsets_at + i * _OFFSET.size)
+        at = self._entries_at + off
+        (tlen,) = _TERM_LEN.unpack_from(self._dict, at)
+        term = self._dict[at + 2:at + 2 + tlen]
+        pos, length, df = _ENTRY_TAIL.unpack_from(self._dict, at + 2 + tlen)
+        return term, pos, length, df
+
+    def _find(self, term: str) -> Optional[Tuple[int, int, int]]:
+        key = term.encode("utf-8")
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            t, pos, length, df = self._entry(mid)
+            if t < key:
+                lo = mid + 1
+            elif t > key:
+                hi = mid
+            else:
+                return pos, length, df
+        return None
+
+    def postings(self, term: str) -> List[int]:
+        hit = self._find(term)
+        if hit is None or self._post is None:
+            return []
+        pos, length, _ = hit
+        return PostingsCodec.decode_varint_deltas(memoryview(self._post)[pos:pos + length], -1)
+
+    def df(self, term: str) -> int:
+        hit = self._find(term)
+        return hit[2] if hit else 0
+
+    def iter_entries(self) -> Iterator[Tuple[bytes, int, int, int]]:
+        for i in range(self.n_terms):
+            yield self._entry(i)
+
+    def iter_terms(self) -> Iterator[Tuple[str, int, int, int]]:
+        for t, pos, length, df in self.iter_entries():
+            yield t.decode("utf-8"), pos, length, df
+
+    def decode_at(self, pos: int, length: int) -> List[int]:
+        if self._post is None:
+            return []
+        return PostingsCodec.decode_varint_deltas(memoryview(self._post)[pos:pos + length], -1)
+
+    def close(self) -> None:
+        self._dict.close()
+        if self._post is not None:
+            self._post.close()
+        self._dict_f.close()
+        self._post_f.close()
+
+    def unlink(self) -> None:
+        for suffix in (".dict", ".post"):
+            Path(f"{self.prefix}{suffix}").unlink(missing_ok=True)
+
+
+class InvertedIndexFileRepository(InvertedIndexRepository):
+    """
+    Índice invertido local, sin servidor, organizado como un LSM: segmentos
+    inmutables en index_dir.
+
+    Los libros se acumulan en memoria y se vuelcan como un segmento nuevo al
+    superar los umbrales (o al llamar a flush()/close()); nunca se reescribe
+    un segmento existente. Un hilo en segundo plano compacta los segmentos
+    por niveles de tamaño: cuando hay merge_factor segmentos contiguos en el
+    mismo nivel se fusionan en uno del nivel siguiente. La lista de segmentos
+    activos vive en SEGMENTS (JSON, reemplazo atómico). Las búsquedas
+    consultan todos los segmentos vivos más el buffer en memoria y unen los
+    resultados; los segmentos sustituidos se cierran cuando ninguna lectura
+    los está usando.
+
+    Cada segmento lleva un número de secuencia (el de su volcado; una fusión
+    conserva el mayor de los fusionados). Reindexar o borrar un libro deja
+    una lápida "book_id muerto hasta la secuencia N" que oculta sus postings
+    en los segmentos anteriores; las fusiones los eliminan físicamente. El
+    hash del texto de cada libro y las lápidas se guardan en books.sqlite,
+    así que los libros sin cambios no se vuelven a tokenizar.
+    """
+
+    SEGMENTS_FILE = "SEGMENTS"
+    BOOKS_FILE = "books.sqlite"
+
+    def __init__(
+        self,
+        index_dir: str,
+        datalake_root: str,
+        stopwords_path: Optional[str] = "stopwords.txt",
+        use_stemming: bool = True,
+        batch_max_books: int = 1000,
+        batch_max_memory_mb: float = 256.0,
+        parallel_workers: int = 0,
+        parallel_chunksize: int = 4,
+        stem_cache_path: Optional[str] = None,
+        merge_factor: int = 4,
+        merge_base_mb: float = 1.0,
+        background_merge: bool = True,
+    ) -> None:
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.datalake_root = Path(datalake_root)
+        if not self.datalake_root.exists():
+            raise FileNotFoundError(f"No existe el datalake: {self.datalake_root}")
+        self.manifest = DatalakeManifest.open(self.datalake_root)
+
+        stopwords = TextPipeline.load_stopwords(stopwords_path) if stopwords_path else set()
+        self.pipeline = TextPipeline(stopwords, use_stemming, stem_cache_path)
+
+        self.batch_max_books = max(1, int(batch_max_books))
+        self.batch_max_bytes = int(batch_max_memory_mb * 1024 * 1024)
+        self.parallel_workers = (os.cpu_count() or 1) if parallel_workers < 0 else int(parallel_workers)
+        self.parallel_chunksize = max(1, int(parallel_chunksize))
+
+        # merge_factor <= 1 desactiva la compactación
+        self.merge_factor = int(merge_factor)
+        self.merge_base_bytes = max(1, int(merge_base_mb * 1024 * 1024))
+
+        # _lock protege segmentos, buffers, lápidas, contadores de referencias y
+        # books.sqlite; _merge_lock serializa fusiones y reset_index.
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._buffer: Dict[str, List[int]] = {}
+        self._buffer_hashes: Dict[int, str] = {}
+        # Buffers ya congelados que se están escribiendo: (secuencia, postings, hashes)
+        self._frozen: List[Tuple[int, Dict[str, List[int]], Dict[int, str]]] = []
+        self._buffered_bytes = 0
+        self._refs: Dict[str, int] = {}
+        self._retired: Dict[str, SegmentReader] = {}
+        self._dead_cache: Dict[str, set] = {}
+        # Términos ordenados por df y total de postings; se invalidan al escribir o borrar
+        self._ranked: Optional[List[Tuple[str, int]]] = None
+        self._ranked_total = 0
+        self._stats_generation = 0
+
+        self._books = sqlite3.connect(str(self.index_dir / self.BOOKS_FILE), check_same_thread=False,
+                                      isolation_level=None)
+        self._books.execute("PRAGMA journal_mode=WAL")
+        self._books.execute("PRAGMA synchronous=NORMAL")
+        self._books.execute(
+            "CREATE TABLE IF NOT EXISTS books ("
+            " book_id INTEGER PRIMARY KEY,"
+            " hash TEXT,"
+            " deleted_through INTEGER NOT NULL DEFAULT 0"
+            ")"
+        )
+        self._tombstones: Dict[int, int] = dict(
+            self._books.execute("SELECT book_id, deleted_through FROM books WHERE deleted_through > 0")
+        )
+
+        self.segments: List[SegmentReader] = []
+        for name, seq in self._load_segment_names():
+            seg = SegmentReader(self.index_dir / name)
+            seg.seq = seq
+            self.segments.append(seg)
+        self._next_seq = 1 + max((int(s.name.split("_")[1]) for s in self.segments), default=0)
+        self._collect_tombstones()
+        # Un único escritor por directorio: lo que no figure en SEGMENTS son
+        # restos de un volcado o una fusión interrumpidos.
+        live = {seg.name for seg in self.segments}
+        for p in self.index_dir.glob("seg_*"):
+            if p.name.split(".")[0] not in live:
+                p.unlink()
+
+        self._stop = False
+        self._merge_wakeup = threading.Event()
+        self._merger: Optional[threading.Thread] = None
+        if background_merge and self.merge_factor > 1:
+            self._merger = threading.Thread(target=self._merge_loop, name="segment-merger", daemon=True)
+            self._merger.start()
+
+    # --- escritura ------------------------------------------------------
+
+    def index_book(self, book_id: int) -> bool:
+        if book_id is None:
+            return False
+        self.index_books([book_id])
+        return True
+
+    def index_books(self, book_ids: Iterable[int]) -> int:
+        ids = (int(b) for b in book_ids if b is not None)
+        indexed = 0
+        if self.parallel_workers > 0:
+            items = ((bid, self._latest_body_path(bid), self._known_hash(bid)) for bid in ids)
+            for bid, terms, digest in tokenize_books_parallel(
+                self.pipeline, items, self.parallel_workers, self.parallel_chunksize
+            ):
+                self._add_book(bid, terms, digest)
+                indexed += 1
+        else:
+            for bid in ids:
+                body_path = self._latest_body_path(bid)
+                if body_path:
+                    with METRICS.timer("index.read_body", backend="file"):
+                        text = read_location(body_path)
+                    digest = content_hash(text)
+                    if digest == self._known_hash(bid):
+                        self._add_book(bid, None, digest)
+                    else:
+                        self._add_book(bid, self.pipeline.pipeline_tokens(text) if text else [], digest)
+                indexed += 1
+        self.flush()
+        self.pipeline.save_stem_cache()
+        return indexed
+
+    def delete_book(self, book_id: int) -> bool:
+        bid = int(book_id)
+        if bid in self._buffer_hashes:
+            self.flush()
+        with self._lock:
+            row = self._books.execute("SELECT hash FROM books WHERE book_id = ?", (bid,)).fetchone()
+            self._tombstone(bid, clear_hash=True)
+        return bool(row and row[0])
+
+    @METRICS.timed("index.flush", backend="file")
+    def flush(self) -> None:
+        with self._lock:
+            frozen, hashes = self._buffer, self._buffer_hashes
+            self._buffer, self._buffer_hashes, self._buffered_bytes = {}, {}, 0
+            if not frozen and not hashes:
+                return
+            name = self._new_segment_name()
+            seq = int(name.split("_")[1])
+            # Sigue visible para las lecturas mientras se escribe el segmento
+            entry = (seq, frozen, hashes)
+            self._frozen.append(entry)
+        segment = None
+        if frozen:
+            write_segment(self.index_dir / name, frozen)
+            segment = SegmentReader(self.index_dir / name)
+            segment.seq = seq
+        with self._lock:
+            if segment is not None:
+                self.segments.append(segment)
+                self._save_segment_names()
+            self._frozen.remove(entry)
+            self._books.executemany(
+                "INSERT INTO books (book_id, hash) VALUES (?, ?) "
+                "ON CONFLICT(book_id) DO UPDATE SET hash = excluded.hash",
+                hashes.items(),
+            )
+        self._request_merge()
+
+    def merge(self) -> int:
+        """Compacta hasta que ningún nivel tenga merge_factor segmentos contiguos. Devuelve nº de fusiones."""
+        merges = 0
+        while self._merge_once():
+            merges += 1
+        return merges
+
+    def reset_index(self) -> None:
+        with self._merge_lock, self._lock:
+            self._buffer, self._buffer_hashes, self._frozen = {}, {}, []
+            self._buffered_bytes = 0
+            old, self.segments = self.segments, []
+            self._save_segment_names()
+            for seg in old:
+                self._retire(seg)
+            for p in self.index_dir.glob("seg_*"):
+                if p.name.split(".")[0] not in self._retired:
+                    p.unlink()
+            self._books.execute("DELETE FROM books")
+            self._tombstones, self._dead_cache = {}, {}
+            self._invalidate_stats()
+
+    def close(self) -> None:
+        self.flush()
+        self._stop = True
+        self._merge_wakeup.set()
+        if self._merger is not None:
+            self._merger.join()
+        with self._lock:
+            for seg in self.segments + list(self._retired.values()):
+                seg.close()
+            self.segments, self._retired = [], {}
+            self._books.close()
+
+    # --- lectura --------------------------------------------------------
+
+    def get_index_by_term(self, term: str) -> List[int]:
+        t = self.pipeline.pipeline_single_token(term)
+        if not t:
+            return []
+        return self._postings(t)
+
+    def query(self, expr: str) -> List[int]:
+        q = BooleanQuery(expr, self.pipeline.pipeline_single_token)
+        return q.evaluate(self._postings, self._document_frequencies)
+
+    def get_index_stats(self) -> Dict[str, int]:
+        ranked, total = self._ranked_terms()
+        return {"terms": len(ranked), "total_postings": total}
+
+    def top_terms(self, limit: int, offset: int = 0) -> List[Tuple[str, int]]:
+        ranked, _ = self._ranked_terms()
+        return ranked[offset:offset + limit]
+
+    def iter_postings(self) -> Iterator[Tuple[str, List[int]]]:
+        # Vuelca el buffer para que todo esté en segmentos y recorre su fusión
+        self.flush()
+        segments, _ = self._snapshot()
+        try:
+            for tb, ids in iter_merged([seg for seg, _ in segments], [dead for _, dead in segments]):
+                yield tb.decode("utf-8"), ids
+        finally:
+            self._release([seg for seg, _ in segments])
+
+    def storage_bytes(self) -> int:
+        with self._lock:
+            return sum(seg.size_bytes for seg in self.segments)
+
+    # --- internos -------------------------------------------------------
+
+    def _add_book(self, bid: int, terms: Optional[List[str]], digest: Optional[str]) -> None:
+        if terms is None:
+            METRICS.inc("index.books", backend="file", result="skipped")
+            return
+        METRICS.inc("index.books", backend="file", result="changed")
+        if bid in self._buffer_hashes:
+            # El mismo libro dos veces en el buffer: la lápida debe cubrir la versión anterior
+            self.flush()
+        with self._lock:
+            if self._known_hash_locked(bid) is not None:
+                self._tombstone(bid)
+            for term in set(terms):
+                postings = self._buffer.get(term)
+                if postings is None:
+                    self._buffer[term] = [bid]
+                    self._buffered_bytes += _TERM_OVERHEAD_BYTES + len(term)
+                else:
+                    postings.append(bid)
+                self._buffered_bytes += _POSTING_BYTES
+            self._buffer_hashes[bid] = digest
+            self._invalidate_stats()
+            full = len(self._buffer_hashes) >= self.batch_max_books or self._buffered_bytes >= self.batch_max_bytes
+        if full:
+            self.flush()
+
+    def _tombstone(self, bid: int, clear_hash: bool = False) -> None:
+        # Llamar con _lock tomado: oculta el libro en todo lo volcado o congelado hasta ahora
+        through = self._next_seq - 1
+        self._tombstones[bid] = through
+        self._dead_cache = {}
+        self._invalidate_stats()
+        self._books.execute(
+            "INSERT INTO books (book_id, deleted_through) VALUES (?, ?) "
+            "ON CONFLICT(book_id) DO UPDATE SET deleted_through = excluded.deleted_through"
+            + (", hash = NULL" if clear_hash else ""),
+            (bid, through),
+        )
+
+    def _known_hash(self, bid: int) -> Optional[str]:
+        with self._lock:
+            return self._known_hash_locked(bid)
+
+    def _known_hash_locked(self, bid: int) -> Optional[str]:
+        if bid in self._buffer_hashes:
+            return self._buffer_hashes[bid]
+        for _, _, hashes in reversed(self._frozen):
+            if bid in hashes:
+                return hashes[bid]
+        row = self._books.execute("SELECT hash FROM books WHERE book_id = ?", (bid,)).fetchone()
+        return row[0] if row else None
+
+    def _dead_for(self, seq: int, name: str) -> set:
+        # Llamar con _lock tomado: libros con lápida que cubre esta secuencia
+        if not self._tombstones:
+            return set()
+        dead = self._dead_cache.get(name)
+        if dead is None:
+            dead = {b for b, through in self._tombstones.items() if through >= seq}
+            self._dead_cache[name] = dead
+        return dead
+
+    def _snapshot(self, term: Optional[str] = None) -> Tuple[List[Tuple[SegmentReader, set]], List[int]]:
+        # Fija los segmentos vivos (contador de referencias) y copia lo que hay en memoria
+        with self._lock:
+            segments = [(seg, self._dead_for(seg.seq, seg.name)) for seg in self.segments]
+            for seg, _ in segments:
+                self._refs[seg.name] = self._refs.get(seg.name, 0) + 1
+            pending: List[int] = []
+            if term is not None:
+                for seq, buf, _ in self._frozen:
+                    dead = self._dead_for(seq, f"frozen_{seq}")
+                    pending.extend(b for b in buf.get(term, ()) if b not in dead)
+                pending.extend(self._buffer.get(term, ()))
+        return segments, pending
+
+    def _release(self, segments: List[SegmentReader]) -> None:
+        with self._lock:
+            for seg in segments:
+                self._refs[seg.name] -= 1
+                if not self._refs[seg.name]:
+                    del self._refs[seg.name]
+                    if seg.name in self._retired:
+                        self._drop(self._retired.pop(seg.name))
+
+    def _postings(self, term: str) -> List[int]:
+        segments, pending = self._snapshot(term)
+        try:
+            lists = []
+            for seg, dead in segments:
+                postings = seg.postings(term)
+                lists.append([b for b in postings if b not in dead] if dead else postings)
+        finally:
+            self._release([seg for seg, _ in segments])
+        if pending:
+            lists.append(sorted(set(pending)))
+        lists = [p for p in lists if p]
+        if len(lists) == 1:
+            return lists[0]
+        return union_many(lists)
+
+    def _document_frequencies(self, terms: List[str]) -> Dict[str, int]:
+        # Suma por segmento sin descontar lápidas: cota superior suficiente para ordenar la intersección
+        segments, _ = self._snapshot()
+        try:
+            df = {t: sum(seg.df(t) for seg, _ in segments) for t in terms}
+        finally:
+            self._release([seg for seg, _ in segments])
+        with self._lock:
+            for buf in [b for _, b, _ in self._frozen] + [self._buffer]:
+                for t in terms:
+                    df[t] += len(buf.get(t, ()))
+        return df
+
+    def _invalidate_stats(self) -> None:
+        # Llamar con _lock tomado
+        self._ranked = None
+        self._stats_generation += 1
+
+    def _ranked_terms(self) -> Tuple[List[Tuple[str, int]], int]:
+        # Los segmentos son inmutables: se recalcula solo tras una escritura, no en cada consulta.
+        # Una fusión no cambia el contenido lógico, así que no invalida.
+        with self._lock:
+            if self._ranked is not None:
+                return self._ranked, self._ranked_total
+            generation = self._stats_generation
+        dfs = self._all_dfs()
+        ranked = sorted(dfs.items(), key=lambda kv: (-kv[1], kv[0]))
+        total = sum(dfs.values())
+        with self._lock:
+            if generation == self._stats_generation:
+                self._ranked, self._ranked_total = ranked, total
+        return ranked, total
+
+    def _all_dfs(self) -> Dict[str, int]:
+        segments, _ = self._snapshot()
+        try:
+            with self._lock:
+                pending = [
+                    {t: [b for b in ids if b not in self._dead_for(seq, f"frozen_{seq}")] for t, ids in buf.items()}
+                    for seq, buf, _ in self._frozen
+                ]
+                if self._buffer:
+                    pending.append(dict(self._buffer))
+            if len(segments) == 1 and not segments[0][1] and not pending:
+                return {t: df for t, _, _, df in segments[0][0].iter_terms()}
+            merged: Dict[str, set] = {}
+            for seg, dead in segments:
+                for t, pos, length, _ in seg.iter_terms():
+                    ids = seg.decode_at(pos, length)
+                    merged.setdefault(t, set()).update(b for b in ids if b not in dead)
+        finally:
+            self._release([seg for seg, _ in segments])
+        for buf in pending:
+            for t, ids in buf.items():
+                merged.setdefault(t, set()).update(ids)
+        return {t: len(ids) for t, ids in merged.items() if ids}
+
+    def _tier(self, segment: SegmentReader) -> int:
+        if segment.size_bytes < self.merge_base_bytes:
+            return 0
+        return 1 + int(math.log(segment.size_bytes / self.merge_base_bytes, self.merge_factor))
+
+    def _pick_merge(self) -> List[SegmentReader]:
+        # Primer tramo de merge_factor segmentos contiguos del mismo nivel
+        run: List[SegmentReader] = []
+        for seg in self.segments:
+            if run and self._tier(run[-1]) != self._tier(seg):
+                run = []
+            run.append(seg)
+            if len(run) == self.merge_factor:
+                return run
+        return []
+
+    def _merge_once(self) -> bool:
+        if self.merge_factor <= 1:
+            return False
+        with self._merge_lock:
+            with self._lock:
+                victims = self._pick_merge()
+                if not victims:
+                    return False
+                dead = [self._dead_for(seg.seq, seg.name) for seg in victims]
+                for seg in victims:
+                    self._refs[seg.name] = self._refs.get(seg.name, 0) + 1
+                name = self._new_segment_name()
+            try:
+                with METRICS.timer("file.merge", segments=str(len(victims))):
+                    merge_segments(self.index_dir / name, victims, dead)
+                # Conserva la secuencia de su nombre, reservada junto con las lápidas ya aplicadas:
+                # solo le afectan las posteriores al inicio de la fusión
+                merged = SegmentReader(self.index_dir / name)
+            finally:
+                self._release(victims)
+            with self._lock:
+                at = self.segments.index(victims[0])
+                self.segments[at:at + len(victims)] = [merged]
+                self._save_segment_names()
+                for seg in victims:
+                    self._retire(seg)
+                self._collect_tombstones()
+        return True
+
+    def _collect_tombstones(self) -> None:
+        # Llamar con _lock tomado: una lápida que ya no cubre ningún segmento ni buffer congelado
+        # (todos los anteriores a ella se han reescrito) no oculta nada y se descarta
+        if not self._tombstones:
+            return
+        floor = min([seg.seq for seg in self.segments] + [seq for seq, _, _ in self._frozen], default=None)
+        done = [b for b, through in self._tombstones.items() if floor is None or through < floor]
+        if not done:
+            return
+        for bid in done:
+            del self._tombstones[bid]
+        self._dead_cache = {}
+        self._books.executemany("UPDATE books SET deleted_through = 0 WHERE book_id = ?", [(b,) for b in done])
+
+    def _merge_loop(self) -> None:
+        while True:
+            self._merge_wakeup.wait()
+            self._merge_wakeup.clear()
+            if self._stop:
+                return
+            try:
+                self.merge()
+            except Exception as e:
+                print(f"[MERGE][ERROR] La compactación de segmentos falló: {e}")
+
+    def _request_merge(self) -> None:
+        if self._merger is not None:
+            self._merge_wakeup.set()
+        elif self.merge_factor > 1:
+            self.merge()
+
+    def _retire(self, segment: SegmentReader) -> None:
+        # Llamar con _lock tomado: se cierra ya o cuando la suelte la última lectura
+        self._dead_cache.pop(segment.name, None)
+        if self._refs.get(segment.name):
+            self._retired[segment.name] = segment
+        else:
+            self._drop(segment)
+
+    @staticmethod
+    def _drop(segment: SegmentReader) -> None:
+        segment.close()
+        segment.unlink()
+
+    def _new_segment_name(self) -> str:
+        name = f"seg_{self._next_seq:06d}"
+        self._next_seq += 1
+        return name
+
+    def _load_segment_names(self) -> List[Tuple[str, int]]:
+        path = self.index_dir / self.SEGMENTS_FILE
+        if not path.exists():
+            return []
+        entries = json.loads(path.read_text(encoding="utf-8"))
+        # Formato anterior: solo nombres, la secuencia es la del propio nombre
+        return [(e, int(e.split("_")[1])) if isinstance(e, str) else (e["name"], int(e["seq"])) for e in entries]
+
+    def _save_segment_names(self) -> None:
+        path = self.index_dir / self.SEGMENTS_FILE
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps([{"name": seg.name, "seq": seg.seq} for seg in self.segments]), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def _latest_body_path(self, book_id: int) -> Optional[str]:
+        return self.manifest.latest_location(book_id, "body")
@@ -1,15 +1,33 @@
 from __future__ import annotations
 
-import re
-import unicodedata
+import itertools
+import os
 from pathlib import Path
-from typing import List, Dict, Optional, Iterable, Tuple
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple
 
-from nltk.stem import PorterStemmer
-from pymongo import MongoClient, ASCENDING, UpdateOne
+from bson.binary import Binary
+from pymongo import MongoClient, ASCENDING, DESCENDING, DeleteOne, UpdateOne
 from pymongo.collection import Collection
 
 from application.InvertedIndexRepository import InvertedIndexRepository
+from utils.BooleanQuery import BooleanQuery
+from utils.DatalakeManifest import DatalakeManifest
+from utils.DatalakePack import read_location
+from utils.Metrics import METRICS
+from utils.PostingsCodec import PostingsCodec
+from utils.QueryCache import QueryCache, MISS
+from utils.TextPipeline import TextPipeline, content_hash, tokenize_books_parallel
+
+# Estimación aproximada del coste en memoria del buffer de postings (CPython 64 bits)
+_POSTING_BYTES = 36
+
+LAYOUT_ARRAY = "array"
+LAYOUT_CHUNKED = "chunked"
+# Máximo de términos por consulta $in al leer buckets existentes
+_CHUNK_FETCH_BATCH = 500
+_STATS_ID = "global"
+# Sube cuando cambia cómo se mantienen df y los contadores: los índices con otra versión se recalculan al abrirse
+_STATS_VERSION = 2
 
 
 class InvertedIndexMongoDBRepository(InvertedIndexRepository):
@@ -21,135 +39,538 @@ class InvertedIndexMongoDBRepository(InvertedIndexRepository):
         index_collection: str = "inverted_index",
         stopwords_path: Optional[str] = "stopwords.txt",
         use_stemming: bool = True,
+        batch_max_books: int = 100,
+        batch_max_memory_mb: float = 256.0,
+        postings_layout: Optional[str] = None,
+        parallel_workers: int = 0,
+        parallel_chunksize: int = 4,
+        stem_cache_path: Optional[str] = None,
+        stem_cache_size: int = 200_000,
+        cache_size: int = 0,
+        cache_ttl_seconds: Optional[float] = 300.0,
+        client: Optional[MongoClient] = None,
     ) -> None:
-        self.col: Collection = MongoClient(uri)[db_name][index_collection]
+        if postings_layout not in (None, LAYOUT_ARRAY, LAYOUT_CHUNKED):
+            raise ValueError(f"Layout de postings desconocido: {postings_layout}")
+        # client permite reutilizar un cliente existente (o un sustituto en memoria como mongomock)
+        db = (client if client is not None else MongoClient(uri))[db_name]
+        self.col: Collection = db[index_collection]
+        self.chunks: Collection = db[f"{index_collection}_chunks"]
+        # Índice directo: book_id -> términos indexados y hash del texto
+        self.forward: Collection = db[f"{index_collection}_forward"]
+        # Contadores globales (términos, postings) mantenidos en cada escritura
+        self.stats: Collection = db[f"{index_collection}_stats"]
+        # Sin layout explícito se respeta el de los datos existentes (chunked si el índice está vacío)
+        detected = self._detect_layout()
+        if postings_layout is None:
+            postings_layout = detected or LAYOUT_CHUNKED
+        elif detected and detected != postings_layout:
+            raise ValueError(
+                f"La colección '{index_collection}' ya usa el layout '{detected}', no '{postings_layout}': "
+                f"ábrela sin postings_layout o indexa en otra colección."
+            )
+        self.postings_layout = postings_layout
         self.datalake_root = Path(datalake_root)
         if not self.datalake_root.exists():
             raise FileNotFoundError(f"No existe el datalake: {self.datalake_root}")
+        self.manifest = DatalakeManifest.open(self.datalake_root)
 
         self.col.create_index([("term", ASCENDING)], unique=True, name="term_unique")
+        self.forward.create_index([("book_id", ASCENDING)], unique=True, name="book_id_unique")
+        self.col.create_index([("df", DESCENDING), ("term", ASCENDING)], name="df_rank")
+        # Recalcular recorre todo el índice: aquí solo se detecta, y la migración es un paso
+        # explícito (ensure_stats() al arrancar el pipeline o `python -m` sobre este módulo)
+        stats = self.stats.find_one({"_id": _STATS_ID})
+        self.stats_outdated = stats is None or stats.get("version") != _STATS_VERSION
+        if self.stats_outdated and self.col.find_one({}, {"_id": 1}) is None:
+            self.rebuild_stats()
+        elif self.stats_outdated:
+            print(f"[WARN] Las estadísticas de '{index_collection}' son de una versión anterior: "
+                  f"ejecuta python -m infrastructure.InvertedIndexMongoDBRepository para recalcularlas.")
+        if postings_layout == LAYOUT_CHUNKED:
+            self.chunks.create_index(
+                [("term", ASCENDING), ("chunk", ASCENDING)], unique=True, name="term_chunk_unique"
+            )
+
+        stopwords = TextPipeline.load_stopwords(stopwords_path) if stopwords_path else set()
+        self.pipeline = TextPipeline(stopwords, use_stemming, stem_cache_path, stem_cache_size)
+        self.stopwords = self.pipeline.stopwords
+        self.stemmer = self.pipeline.stemmer
+
+        # parallel_workers = 0 mantiene la tokenización en el proceso actual;
+        # un valor negativo usa tantos workers como CPUs.
+        self.parallel_workers = (os.cpu_count() or 1) if parallel_workers < 0 else int(parallel_workers)
+        self.parallel_chunksize = max(1, int(parallel_chunksize))
 
-        self.stopwords = self._load_stopwords(stopwords_path) if stopwords_path else set()
-        self.stemmer = PorterStemmer() if use_stemming else None
+        self.batch_max_books = max(1, int(batch_max_books))
+        self.batch_max_bytes = int(batch_max_memory_mb * 1024 * 1024)
+
+        # cache_size = 0 desactiva la caché. La normalización de términos no depende
+        # del contenido del índice, así que solo la caché de postings sigue la generación.
+        self.generation = 0
+        self.term_cache = QueryCache(cache_size, None) if cache_size > 0 else None
+        self.postings_cache = QueryCache(cache_size, cache_ttl_seconds) if cache_size > 0 else None
 
     def index_book(self, book_id: int) -> bool:
         if book_id is None:
             return False
+        self.index_books([book_id])
+        return True
 
-        text = self._read_book_body_latest(int(book_id))
-        if not text:
-            return True
-
-        doc_terms = set(self._pipeline_tokens(text))
-        if not doc_terms:
-            return True
+    def index_books(self, book_ids: Iterable[int]) -> int:
+        ids = (int(b) for b in book_ids if b is not None)
+        if self.parallel_workers > 0:
+            indexed = self._index_parallel(ids)
+        else:
+            indexed = self._index_term_sets(self._serial_term_sets(ids))
+        self.pipeline.save_stem_cache()
+        return indexed
 
+    def delete_book(self, book_id: int) -> bool:
         bid = int(book_id)
-        ops = [
-            UpdateOne({"term": term}, {"$addToSet": {"postings": bid}}, upsert=True)
-            for term in doc_terms
-        ]
-        self.col.bulk_write(ops, ordered=False)
+        fwd = self.forward.find_one({"book_id": bid}, {"terms": 1, "pending": 1})
+        if fwd is None:
+            return self._delete_unknown_book(bid)
+        terms = set(fwd.get("terms", [])) | set(fwd.get("pending", []))
+        self._apply_changes({}, {term: [bid] for term in terms})
+        self.forward.delete_one({"book_id": bid})
         return True
 
+    def _serial_term_sets(self, book_ids: Iterator[int]) -> Iterator[Tuple[int, Optional[List[str]], Optional[str]]]:
+        for group in self._with_known_hashes(book_ids):
+            for bid, known in group:
+                body_path = self._latest_body_path(bid)
+                if not body_path:
+                    yield bid, None, None
+                    continue
+                with METRICS.timer("index.read_body", backend="mongodb"):
+                    text = read_location(body_path)
+                digest = content_hash(text)
+                if digest == known:
+                    yield bid, None, digest
+                else:
+                    yield bid, self._pipeline_tokens(text) if text else [], digest
+
+    def _with_known_hashes(self, book_ids: Iterable[int]) -> Iterator[List[Tuple[int, Optional[str]]]]:
+        # Hash del contenido ya indexado, consultado por grupos en el índice directo
+        it = iter(book_ids)
+        while True:
+            group = list(itertools.islice(it, _CHUNK_FETCH_BATCH))
+            if not group:
+                return
+            with METRICS.timer("mongo.call", op="forward_hashes"):
+                known = {
+                    d["book_id"]: d.get("hash")
+                    for d in self.forward.find({"book_id": {"$in": group}}, {"book_id": 1, "hash": 1})
+                }
+            yield [(b, known.get(b)) for b in group]
+
+    def _index_parallel(self, book_ids: Iterable[int]) -> int:
+        # Los workers leen y tokenizan; este proceso es el único escritor en MongoDB.
+        items = (
+            (bid, self._latest_body_path(bid), known)
+            for group in self._with_known_hashes(book_ids)
+            for bid, known in group
+        )
+        return self._index_term_sets(
+            tokenize_books_parallel(self.pipeline, items, self.parallel_workers, self.parallel_chunksize)
+        )
+
+    def _index_term_sets(self, term_sets: Iterator[Tuple[int, Optional[List[str]], Optional[str]]]) -> int:
+        # SPIMI: se acumulan los términos de varios libros en memoria y se vuelcan
+        # juntos al superar algún umbral. terms = None indica libro sin cambios.
+        buffer: Dict[int, Tuple[set, str]] = {}
+        buffered_bytes = 0
+        indexed = 0
+
+        for bid, terms, digest in term_sets:
+            indexed += 1
+            if terms is None:
+                METRICS.inc("index.books", backend="mongodb", result="skipped")
+                continue
+            METRICS.inc("index.books", backend="mongodb", result="changed")
+            doc_terms = set(terms)
+            buffer[bid] = (doc_terms, digest)
+            buffered_bytes += sum(_POSTING_BYTES + len(t) for t in doc_terms)
+
+            if len(buffer) >= self.batch_max_books or buffered_bytes >= self.batch_max_bytes:
+                self._flush_books(buffer)
+                buffer, buffered_bytes = {}, 0
+
+        if buffer:
+            self._flush_books(buffer)
+        return indexed
+
+    @METRICS.timed("index.flush", backend="mongodb")
+    def _flush_books(self, books: Dict[int, Tuple[set, str]]) -> None:
+        # Diff contra el índice directo: solo se añaden términos nuevos y se quitan los que ya no están
+        with METRICS.timer("mongo.call", op="forward_terms"):
+            previous = {
+                d["book_id"]: d
+                for d in self.forward.find({"book_id": {"$in": list(books)}}, {"book_id": 1, "terms": 1, "pending": 1})
+            }
+        additions: Dict[str, List[int]] = {}
+        removals: Dict[str, List[int]] = {}
+        for bid, (terms, _) in books.items():
+            doc = previous.get(bid, {})
+            old = set(doc.get("terms", []))
+            if "pending" in doc:
+                # Una escritura anterior quedó a medias y sus postings pueden estar en cualquier estado
+                # intermedio: se revisan todos los términos, ya que solo se aplica la diferencia real
+                added, removed = terms, (old | set(doc["pending"])) - terms
+            else:
+                added, removed = terms - old, old - terms
+            for term in added:
+                additions.setdefault(term, []).append(bid)
+            for term in removed:
+                removals.setdefault(term, []).append(bid)
+        # Se marca el libro antes de tocar las postings y se quita el hash para que, si el proceso
+        # cae entre ambas escrituras, la siguiente indexación lo reprocese en vez de saltarlo
+        with METRICS.timer("mongo.call", op="forward_pending"):
+            self.forward.bulk_write([
+                UpdateOne({"book_id": bid}, {"$set": {"pending": sorted(terms)}, "$unset": {"hash": ""}}, upsert=True)
+                for bid, (terms, _) in books.items()
+            ], ordered=False)
+        self._apply_changes(additions, removals)
+        with METRICS.timer("mongo.call", op="forward_upsert"):
+            self.forward.bulk_write([
+                UpdateOne(
+                    {"book_id": bid},
+                    {"$set": {"hash": digest, "terms": sorted(terms)}, "$unset": {"pending": ""}},
+                    upsert=True,
+                )
+                for bid, (terms, digest) in books.items()
+            ], ordered=False)
+
     def get_index_by_term(self, term: str) -> List[int]:
-        t = self._pipeline_single_token(term)
+        t = self._normalize_term(term)
         if not t:
             return []
-        doc = self.col.find_one({"term": t}, {"postings": 1})
-        return [int(x) for x in (doc.get("postings", []) if doc else [])]
+        if self.postings_cache is None:
+            return self._read_postings(t)
+        return list(self._cached_postings(t))
+
+    def query(self, expr: str) -> List[int]:
+        q = BooleanQuery(expr, self._normalize_term)
+        if self.postings_cache is None:
+            return q.evaluate(self._read_sorted_postings, self._document_frequencies)
+        return list(q.evaluate(self._cached_postings, self._document_frequencies_cached))
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        if self.postings_cache is None:
+            return {}
+        return {"terms": self.term_cache.stats(), "postings": self.postings_cache.stats()}
 
     def get_index_stats(self) -> Dict[str, int]:
-        terms = self.col.estimated_document_count()
+        doc = self.stats.find_one({"_id": _STATS_ID}) or {}
+        return {"terms": int(doc.get("terms", 0)), "total_postings": int(doc.get("total_postings", 0))}
+
+    def top_terms(self, limit: int, offset: int = 0) -> List[Tuple[str, int]]:
+        # Consulta cubierta por el índice (df desc, term): no ordena en memoria
+        cursor = (
+            self.col.find({}, {"_id": 0, "term": 1, "df": 1})
+            .sort([("df", DESCENDING), ("term", ASCENDING)])
+            .hint("df_rank")
+            .skip(int(offset))
+            .limit(int(limit))
+        )
+        return [(d["term"], int(d.get("df", 0))) for d in cursor]
+
+    def iter_postings(self) -> Iterator[Tuple[str, List[int]]]:
+        if self.postings_layout == LAYOUT_ARRAY:
+            for doc in self.col.find({}, {"term": 1, "postings": 1}).sort("term", ASCENDING):
+                if doc.get("postings"):
+                    yield doc["term"], sorted(int(x) for x in doc["postings"])
+            return
+        # Recorre los buckets en el orden de term_chunk_unique y los agrupa por término
+        cursor = self.chunks.find({}, {"term": 1, "chunk": 1, "data": 1}).sort(
+            [("term", ASCENDING), ("chunk", ASCENDING)]
+        )
+        for term, docs in itertools.groupby(cursor, key=lambda d: d["term"]):
+            postings: List[int] = []
+            for doc in docs:
+                postings.extend(PostingsCodec.decode_chunk(int(doc["chunk"]), bytes(doc["data"])))
+            if postings:
+                yield term, postings
+
+    def ensure_stats(self) -> bool:
+        """Recalcula df y contadores si vienen de una versión anterior. Devuelve si se recalcularon."""
+        if not self.stats_outdated:
+            return False
+        print("[INDEX] Recalculando df y estadísticas del índice invertido...")
+        self.rebuild_stats()
+        return True
+
+    def rebuild_stats(self) -> Dict[str, int]:
+        """Recalcula df y contadores globales recorriendo las postings (migración o reparación)."""
+        if self.postings_layout == LAYOUT_ARRAY:
+            self.col.update_many({}, [{"$set": {"df": {"$size": {"$ifNull": ["$postings", []]}}}}])
+        else:
+            self._rebuild_chunked_df()
+        self.col.delete_many({"df": {"$lte": 0}})
         agg = list(self.col.aggregate([
-            {"$project": {"n": {"$size": {"$ifNull": ["$postings", []]}}}},
-            {"$group": {"_id": None, "total": {"$sum": "$n"}}},
+            {"$group": {"_id": None, "terms": {"$sum": 1}, "total": {"$sum": {"$ifNull": ["$df", 0]}}}},
         ]))
-        return {"terms": int(terms), "total_postings": int(agg[0]["total"]) if agg else 0}
+        stats = {
+            "terms": int(agg[0]["terms"]) if agg else 0,
+            "total_postings": int(agg[0]["total"]) if agg else 0,
+        }
+        self.stats.replace_one({"_id": _STATS_ID}, {"_id": _STATS_ID, **stats, "version": _STATS_VERSION}, upsert=True)
+        self.stats_outdated = False
+        return stats
+
+    def _rebuild_chunked_df(self) -> None:
+        # Los buckets anteriores al campo n se decodifican para contarlos
+        dfs: Dict[str, int] = {}
+        for doc in self.chunks.find({}, {"term": 1, "chunk": 1, "data": 1, "n": 1}):
+            n = doc.get("n")
+            if n is None:
+                n = len(PostingsCodec.decode_chunk(int(doc["chunk"]), bytes(doc["data"])))
+            dfs[doc["term"]] = dfs.get(doc["term"], 0) + int(n)
+        self.col.update_many({}, {"$set": {"df": 0}})
+        ops = [UpdateOne({"term": term}, {"$set": {"df": df}}, upsert=True) for term, df in dfs.items()]
+        for i in range(0, len(ops), _CHUNK_FETCH_BATCH):
+            self.col.bulk_write(ops[i:i + _CHUNK_FETCH_BATCH], ordered=False)
 
     def reset_index(self) -> None:
         self.col.delete_many({})
+        self.chunks.delete_many({})
+        self.forward.delete_many({})
+        self.stats.replace_one(
+            {"_id": _STATS_ID},
+            {"_id": _STATS_ID, "terms": 0, "total_postings": 0, "version": _STATS_VERSION},
+            upsert=True,
+        )
+        self._bump_generation()
 
-    def _read_book_body_latest(self, book_id: int) -> str:
-        body_path = self._pick_latest(self.datalake_root.rglob(f"{book_id}.body.txt"))
-        if body_path and body_path.exists():
-            return body_path.read_text(encoding="utf-8", errors="ignore")
-        return ""
+    def _detect_layout(self) -> Optional[str]:
+        if self.chunks.find_one({}, {"_id": 1}) is not None:
+            return LAYOUT_CHUNKED
+        if self.col.find_one({"postings": {"$exists": True}}, {"_id": 1}) is not None:
+            return LAYOUT_ARRAY
+        return None
 
-    def _pick_latest(self, paths_iter) -> Optional[Path]:
-        candidates = sorted(paths_iter, key=self._sort_key, reverse=True)
-        return candidates[0] if candidates else None
+    def _bump_generation(self) -> None:
+        self.generation += 1
+        if self.postings_cache is not None:
+            self.postings_cache.bump_generation()
 
-    def _sort_key(self, p: Path) -> Tuple[str, str, str]:
-        parts = p.parts
-        date  = parts[-3] if len(parts) >= 3 else ""
-        shard = parts[-2] if len(parts) >= 2 else ""
-        return (date, shard, p.name)
+    def _normalize_term(self, term: str) -> Optional[str]:
+        if self.term_cache is None:
+            return self._pipeline_single_token(term)
+        t = self.term_cache.get(term)
+        if t is MISS:
+            t = self._pipeline_single_token(term)
+            self.term_cache.put(term, t)
+        return t
 
-    def _load_stopwords(self, path: Optional[str]) -> set:
-        try:
-            if path:
-                return {line.strip().lower() for line in open(path, "r", encoding="utf-8").read().splitlines() if
-                        line.strip()}
+    def _cached_postings(self, term: str) -> List[int]:
+        # La generación se toma antes de leer: si una escritura termina mientras tanto, put() la rechaza
+        generation = self.postings_cache.generation
+        postings = self.postings_cache.get(term)
+        if postings is MISS:
+            postings = self._read_sorted_postings(term)
+            self.postings_cache.put(term, postings, generation)
+        return postings
+
+    def _document_frequencies_cached(self, terms: List[str]) -> Dict[str, int]:
+        df, missing = {}, []
+        for t in terms:
+            postings = self.postings_cache.peek(t)
+            if postings is MISS:
+                missing.append(t)
             else:
-                import nltk
-                from nltk.corpus import stopwords
-                nltk.download("stopwords", quiet=True)
-                return set(stopwords.words("english"))
-        except Exception as e:
-            print(f"[WARN] No se pudieron cargar las stopwords ({e}), usando conjunto vacío.")
-            return set()
-
-    def _normalize(self, s: str) -> str:
-        s = s.lower()
-        s = unicodedata.normalize("NFKD", s)
-        s = "".join(ch for ch in s if not unicodedata.combining(ch))
-        s = re.sub(r"[^\w\s]", " ", s)
-        s = re.sub(r"\d+", " ", s)
-        s = re.sub(r"_", " ", s)
-        s = re.sub(r"\s+", " ", s).strip()
-        return s
-
-    def _tokenize(self, s: str) -> List[str]:
-        return [t for t in s.split(" ") if t.isalpha()]
-
-    def _remove_stop(self, tokens: Iterable[str], min_len: int = 3) -> List[str]:
-        if not self.stopwords:
-            return [t for t in tokens if len(t) >= min_len]
-        return [t for t in tokens if len(t) >= min_len and t not in self.stopwords]
-
-    def _stem(self, tokens: Iterable[str]) -> List[str]:
-        if not self.stemmer:
-            return list(tokens)
-        return [self.stemmer.stem(t) for t in tokens]
-
-    def _dedup(self, tokens: Iterable[str]) -> List[str]:
-        seen, out = set(), []
-        for t in tokens:
-            if t not in seen:
-                seen.add(t)
-                out.append(t)
+                df[t] = len(postings)
+        df.update(self._document_frequencies(missing))
+        return df
+
+    @METRICS.timed("mongo.call", op="read_postings")
+    def _read_postings(self, term: str) -> List[int]:
+        if self.postings_layout == LAYOUT_ARRAY:
+            doc = self.col.find_one({"term": term}, {"postings": 1})
+            return [int(x) for x in (doc.get("postings", []) if doc else [])]
+        out: List[int] = []
+        for doc in self.chunks.find({"term": term}, {"chunk": 1, "data": 1}).sort("chunk", ASCENDING):
+            out.extend(PostingsCodec.decode_chunk(int(doc["chunk"]), bytes(doc["data"])))
         return out
 
+    def _read_sorted_postings(self, term: str) -> List[int]:
+        postings = self._read_postings(term)
+        # $addToSet no garantiza orden en el layout array; los buckets ya salen ordenados
+        return sorted(postings) if self.postings_layout == LAYOUT_ARRAY else postings
+
+    def _document_frequencies(self, terms: List[str]) -> Dict[str, int]:
+        if not terms:
+            return {}
+        docs = self.col.find({"term": {"$in": terms}}, {"term": 1, "df": 1})
+        return {d["term"]: int(d.get("df", 0)) for d in docs}
+
+    def _apply_changes(self, additions: Dict[str, List[int]], removals: Dict[str, List[int]]) -> None:
+        if not additions and not removals:
+            return
+        try:
+            with METRICS.timer("mongo.apply_changes", layout=self.postings_layout):
+                if self.postings_layout == LAYOUT_CHUNKED:
+                    self._apply_changes_chunked(additions, removals)
+                else:
+                    self._apply_changes_array(additions, removals)
+        finally:
+            # Tras escribir, para que ninguna lectura previa a la escritura quede en caché
+            self._bump_generation()
+
+    def _apply_changes_array(self, additions: Dict[str, List[int]], removals: Dict[str, List[int]]) -> None:
+        # df se ajusta solo por los ids que de verdad entran o salen, comparando con las postings guardadas
+        present = self._present_postings(
+            sorted(set(additions) | set(removals)),
+            sorted({bid for ids in itertools.chain(additions.values(), removals.values()) for bid in ids}),
+        )
+        added: Dict[str, List[int]] = {}
+        removed: Dict[str, List[int]] = {}
+        for term, ids in additions.items():
+            new_ids = [b for b in ids if b not in present.get(term, ())]
+            if new_ids:
+                added[term] = new_ids
+        for term, ids in removals.items():
+            old_ids = [b for b in ids if b in present.get(term, ())]
+            if old_ids:
+                removed[term] = old_ids
+        additions, removals = added, removed
+        ops = [
+            UpdateOne({"term": term}, {"$addToSet": {"postings": {"$each": ids}}, "$inc": {"df": len(ids)}},
+                      upsert=True)
+            for term, ids in additions.items()
+        ]
+        ops += [
+            UpdateOne({"term": term}, {"$pull": {"postings": {"$in": ids}}, "$inc": {"df": -len(ids)}})
+            for term, ids in removals.items()
+        ]
+        if not ops:
+            return
+        new_terms = self.col.bulk_write(ops, ordered=False).upserted_count
+        dropped_terms = 0
+        if removals:
+            dropped_terms = self.col.delete_many({"term": {"$in": list(removals)}, "df": {"$lte": 0}}).deleted_count
+        self._inc_stats(
+            new_terms - dropped_terms,
+            sum(len(ids) for ids in additions.values()) - sum(len(ids) for ids in removals.values()),
+        )
+
+    def _present_postings(self, terms: List[str], book_ids: List[int]) -> Dict[str, set]:
+        # Qué ids del lote ya están en la postings de cada término, filtrado en el servidor
+        present: Dict[str, set] = {}
+        for i in range(0, len(terms), _CHUNK_FETCH_BATCH):
+            with METRICS.timer("mongo.call", op="present_postings"):
+                cursor = self.col.aggregate([
+                    {"$match": {"term": {"$in": terms[i:i + _CHUNK_FETCH_BATCH]}}},
+                    {"$project": {"_id": 0, "term": 1, "present": {"$filter": {
+                        "input": {"$ifNull": ["$postings", []]}, "as": "b", "cond": {"$in": ["$$b", book_ids]},
+                    }}}},
+                ])
+                for doc in cursor:
+                    if doc["present"]:
+                        present[doc["term"]] = {int(b) for b in doc["present"]}
+        return present
+
+    def _apply_changes_chunked(self, additions: Dict[str, List[int]], removals: Dict[str, List[int]]) -> None:
+        # Read-modify-write por bucket (term, chunk); asume un único escritor por índice.
+        added_by_key: Dict[Tuple[str, int], set] = {}
+        removed_by_key: Dict[Tuple[str, int], set] = {}
+        for changes, by_key in ((additions, added_by_key), (removals, removed_by_key)):
+            for term, ids in changes.items():
+                for bid in ids:
+                    by_key.setdefault((term, PostingsCodec.chunk_of(bid)), set()).add(bid)
+
+        keys = set(added_by_key) | set(removed_by_key)
+        terms = sorted({term for term, _ in keys})
+        chunk_ids = sorted({chunk for _, chunk in keys})
+        existing: Dict[Tuple[str, int], List[int]] = {}
+        for i in range(0, len(terms), _CHUNK_FETCH_BATCH):
+            cursor = self.chunks.find(
+                {"term": {"$in": terms[i:i + _CHUNK_FETCH_BATCH]}, "chunk": {"$in": chunk_ids}},
+                {"term": 1, "chunk": 1, "data": 1},
+            )
+            for doc in cursor:
+                key = (doc["term"], int(doc["chunk"]))
+                if key in keys:
+                    existing[key] = PostingsCodec.decode_chunk(key[1], bytes(doc["data"]))
+
+        chunk_ops, df_inc = [], {}
+        for term, chunk in keys:
+            old = existing.get((term, chunk), [])
+            updated = set(old)
+            updated |= added_by_key.get((term, chunk), set())
+            updated -= removed_by_key.get((term, chunk), set())
+            if updated == set(old):
+                continue
+            delta = len(updated) - len(old)
+            if updated:
+                ids = sorted(updated)
+                chunk_ops.append(UpdateOne(
+                    {"term": term, "chunk": chunk},
+                    {"$set": {"data": Binary(PostingsCodec.encode_chunk(chunk, ids)), "n": len(ids)}},
+                    upsert=True,
+                ))
+            else:
+                chunk_ops.append(DeleteOne({"term": term, "chunk": chunk}))
+            if delta:
+                df_inc[term] = df_inc.get(term, 0) + delta
+
+        if chunk_ops:
+            self.chunks.bulk_write(chunk_ops, ordered=False)
+        if df_inc:
+            new_terms = self.col.bulk_write([
+                UpdateOne({"term": term}, {"$inc": {"df": inc}}, upsert=True)
+                for term, inc in df_inc.items()
+            ], ordered=False).upserted_count
+            dropped_terms = 0
+            if any(inc < 0 for inc in df_inc.values()):
+                dropped_terms = self.col.delete_many(
+                    {"term": {"$in": list(df_inc)}, "df": {"$lte": 0}}
+                ).deleted_count
+            self._inc_stats(new_terms - dropped_terms, sum(df_inc.values()))
+
+    def _inc_stats(self, terms: int, postings: int) -> None:
+        if terms or postings:
+            self.stats.update_one(
+                {"_id": _STATS_ID}, {"$inc": {"terms": terms, "total_postings": postings}}, upsert=True
+            )
+
+    def _delete_unknown_book(self, book_id: int) -> bool:
+        # Libro indexado antes de existir el índice directo: hay que localizar sus postings
+        if self.postings_layout == LAYOUT_ARRAY:
+            terms = [d["term"] for d in self.col.find({"postings": book_id}, {"term": 1})]
+        else:
+            chunk = PostingsCodec.chunk_of(book_id)
+            terms = [
+                d["term"] for d in self.chunks.find({"chunk": chunk}, {"term": 1, "data": 1})
+                if book_id in PostingsCodec.decode_chunk(chunk, bytes(d["data"]))
+            ]
+        self._apply_changes({}, {term: [book_id] for term in terms})
+        return bool(terms)
+
+    def _latest_body_path(self, book_id: int) -> Optional[str]:
+        return self.manifest.latest_location(book_id, "body")
+
     def _pipeline_tokens(self, raw: str) -> List[str]:
-        norm = self._normalize(raw)
-        toks = self._tokenize(norm)
-        toks = self._remove_stop(toks)
-        toks = self._stem(toks)
-        toks = self._remove_stop(toks)
-        return self._dedup(toks)
+        return self.pipeline.pipeline_tokens(raw)
 
     def _pipeline_single_token(self, term: str) -> Optional[str]:
-        norm = self._normalize(term)
-        if not norm:
-            return None
-        toks = self._tokenize(norm)
-        if not toks:
-            return None
-        t = toks[0]
-        if t in self.stopwords or len(t) < 3:
-            return None
-        t = self.stemmer.stem(t) if self.stemmer else t
-        if t in self.stopwords or len(t) < 3:
-            return None
-        return t
+        return self.pipeline.pipeline_single_token(term)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from utils.DatalakeDetector import detect_datalake_root
+
+    parser = argparse.ArgumentParser(description="Recalcula df y las estadísticas del índice invertido en MongoDB.")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="inverted_db")
+    parser.add_argument("--collection", default="inverted_index")
+    parser.add_argument("--datalake", default=None, help="Raíz del datalake (por defecto, la detectada).")
+    args = parser.parse_args()
+
+    repo = InvertedIndexMongoDBRepository(args.mongo_uri, args.db, str(args.datalake or detect_datalake_root()),
+                                          index_collection=args.collection)
+    result = repo.rebuild_stats()
+    print(f"[INDEX] {result['terms']} términos, {result['total_postings']} postings")
@@ -0,0 +1,359 @@
+from __future__ import annotations
+
+import itertools
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from application.InvertedIndexRepository import InvertedIndexRepository
+from utils.BooleanQuery import BooleanQuery
+from utils.DatalakeManifest import DatalakeManifest
+from utils.DatalakePack import read_location
+from utils.Metrics import METRICS
+from utils.TextPipeline import TextPipeline, content_hash, tokenize_books_parallel
+
+_POSTING_BYTES = 64
+# SQLite limita el número de parámetros por sentencia (999 en versiones antiguas)
+_IN_BATCH = 500
+
+
+def _split_terms(joined: str) -> List[str]:
+    return joined.split("\n") if joined else []
+
+
+class InvertedIndexSQLiteRepository(InvertedIndexRepository):
+    """
+    Índice invertido embebido en SQLite.
+
+    Una fila por (term, book_id) en una tabla WITHOUT ROWID con esa clave
+    primaria: las postings de un término quedan contiguas y ordenadas en el
+    B-tree, y leerlas es un único recorrido de rango. Las escrituras se
+    agrupan (SPIMI) y se insertan con executemany dentro de una transacción.
+    La tabla forward guarda los términos y el hash de cada libro, de modo
+    que reindexar solo aplica la diferencia y los libros sin cambios se saltan.
+    Triggers sobre postings mantienen term_df (df por término, con índice
+    por df) y la fila única de stats, así que las estadísticas y el ranking
+    de términos no recorren la tabla de postings.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        datalake_root: str,
+        stopwords_path: Optional[str] = "stopwords.txt",
+        use_stemming: bool = True,
+        batch_max_books: int = 100,
+        batch_max_memory_mb: float = 256.0,
+        parallel_workers: int = 0,
+        parallel_chunksize: int = 4,
+        stem_cache_path: Optional[str] = None,
+        stem_cache_size: int = 200_000,
+        cache_size_mb: int = 64,
+        mmap_size_mb: int = 256,
+    ) -> None:
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.datalake_root = Path(datalake_root)
+        if not self.datalake_root.exists():
+            raise FileNotFoundError(f"No existe el datalake: {self.datalake_root}")
+        self.manifest = DatalakeManifest.open(self.datalake_root)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        self._conn.execute(f"PRAGMA cache_size=-{int(cache_size_mb) * 1024}")
+        self._conn.execute(f"PRAGMA mmap_size={int(mmap_size_mb) * 1024 * 1024}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term TEXT NOT NULL,"
+            " book_id INTEGER NOT NULL,"
+            " PRIMARY KEY (term, book_id)"
+            ") WITHOUT ROWID"
+        )
+        # Índice directo: términos indexados y hash del texto de cada libro
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS forward ("
+            " book_id INTEGER PRIMARY KEY,"
+            " hash TEXT,"
+            " terms TEXT NOT NULL"
+            ")"
+        )
+        self._create_stats_schema()
+
+        stopwords = TextPipeline.load_stopwords(stopwords_path) if stopwords_path else set()
+        self.pipeline = TextPipeline(stopwords, use_stemming, stem_cache_path, stem_cache_size)
+
+        self.parallel_workers = (os.cpu_count() or 1) if parallel_workers < 0 else int(parallel_workers)
+        self.parallel_chunksize = max(1, int(parallel_chunksize))
+        self.batch_max_books = max(1, int(batch_max_books))
+        self.batch_max_bytes = int(batch_max_memory_mb * 1024 * 1024)
+
+    def index_book(self, book_id: int) -> bool:
+        if book_id is None:
+            return False
+        self.index_books([book_id])
+        return True
+
+    def index_books(self, book_ids: Iterable[int]) -> int:
+        ids = (int(b) for b in book_ids if b is not None)
+        if self.parallel_workers > 0:
+            items = (
+                (bid, self._latest_body_path(bid), known)
+                for group in self._with_known_hashes(ids)
+                for bid, known in group
+            )
+            indexed = self._index_term_sets(
+                tokenize_books_parallel(self.pipeline, items, self.parallel_workers, self.parallel_chunksize)
+            )
+        else:
+            indexed = self._index_term_sets(self._serial_term_sets(ids))
+        self.pipeline.save_stem_cache()
+        return indexed
+
+    def delete_book(self, book_id: int) -> bool:
+        bid = int(book_id)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                row = self._conn.execute("SELECT terms FROM forward WHERE book_id = ?", (bid,)).fetchone()
+                if row is not None:
+                    cur = self._conn.executemany(
+                        "DELETE FROM postings WHERE term = ? AND book_id = ?",
+                        ((term, bid) for term in _split_terms(row[0])),
+                    )
+                    self._conn.execute("DELETE FROM forward WHERE book_id = ?", (bid,))
+                else:
+                    # Libro indexado antes de existir el índice directo: recorre la tabla
+                    cur = self._conn.execute("DELETE FROM postings WHERE book_id = ?", (bid,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row is not None or cur.rowcount > 0
+
+    def _serial_term_sets(self, book_ids: Iterable[int]) -> Iterator[Tuple[int, Optional[List[str]], Optional[str]]]:
+        for group in self._with_known_hashes(book_ids):
+            for bid, known in group:
+                body_path = self._latest_body_path(bid)
+                if not body_path:
+                    yield bid, None, None
+                    continue
+                with METRICS.timer("index.read_body", backend="sqlite"):
+                    text = read_location(body_path)
+                digest = content_hash(text)
+                if digest == known:
+                    yield bid, None, digest
+                else:
+                    yield bid, self.pipeline.pipeline_tokens(text) if text else [], digest
+
+    def _with_known_hashes(self, book_ids: Iterable[int]) -> Iterator[List[Tuple[int, Optional[str]]]]:
+        it = iter(book_ids)
+        while True:
+            group = list(itertools.islice(it, _IN_BATCH))
+            if not group:
+                return
+            marks = ",".join("?" * len(group))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT book_id, hash FROM forward WHERE book_id IN ({marks})", group
+                ).fetchall()
+            known = dict(rows)
+            yield [(b, known.get(b)) for b in group]
+
+    def _index_term_sets(self, term_sets: Iterator[Tuple[int, Optional[List[str]], Optional[str]]]) -> int:
+        # terms = None indica libro sin cambios (mismo hash) o sin cuerpo en el datalake
+        books: Dict[int, Tuple[set, str]] = {}
+        buffered_bytes = 0
+        indexed = 0
+        for bid, terms, digest in term_sets:
+            indexed += 1
+            if terms is None:
+                METRICS.inc("index.books", backend="sqlite", result="skipped")
+                continue
+            METRICS.inc("index.books", backend="sqlite", result="changed")
+            books[bid] = (set(terms), digest)
+            buffered_bytes += len(books[bid][0]) * _POSTING_BYTES
+            if len(books) >= self.batch_max_books or buffered_bytes >= self.batch_max_bytes:
+                self._flush_books(books)
+                books, buffered_bytes = {}, 0
+        if books:
+            self._flush_books(books)
+        return indexed
+
+    @METRICS.timed("index.flush", backend="sqlite")
+    def _flush_books(self, books: Dict[int, Tuple[set, str]]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                previous: Dict[int, set] = {}
+                ids = list(books)
+                for start in range(0, len(ids), _IN_BATCH):
+                    batch = ids[start:start + _IN_BATCH]
+                    marks = ",".join("?" * len(batch))
+                    for bid, terms in self._conn.execute(
+                        f"SELECT book_id, terms FROM forward WHERE book_id IN ({marks})", batch
+                    ):
+                        previous[bid] = set(_split_terms(terms))
+                added: List[Tuple[str, int]] = []
+                removed: List[Tuple[str, int]] = []
+                for bid, (terms, _) in books.items():
+                    old = previous.get(bid, set())
+                    added.extend((term, bid) for term in terms - old)
+                    removed.extend((term, bid) for term in old - terms)
+                # Insertar en orden de clave mantiene las escrituras localizadas en el B-tree
+                added.sort()
+                removed.sort()
+                self._conn.executemany("DELETE FROM postings WHERE term = ? AND book_id = ?", removed)
+                self._conn.executemany("INSERT OR IGNORE INTO postings (term, book_id) VALUES (?, ?)", added)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO forward (book_id, hash, terms) VALUES (?, ?, ?)",
+                    ((bid, digest, "\n".join(sorted(terms))) for bid, (terms, digest) in books.items()),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get_index_by_term(self, term: str) -> List[int]:
+        t = self.pipeline.pipeline_single_token(term)
+        if not t:
+            return []
+        return self._read_postings(t)
+
+    def query(self, expr: str) -> List[int]:
+        q = BooleanQuery(expr, self.pipeline.pipeline_single_token)
+        return q.evaluate(self._read_postings, self._document_frequencies)
+
+    def get_index_stats(self) -> Dict[str, int]:
+        with self._lock:
+            terms, total = self._conn.execute("SELECT terms, total_postings FROM stats WHERE id = 1").fetchone()
+        return {"terms": int(terms), "total_postings": int(total)}
+
+    def top_terms(self, limit: int, offset: int = 0) -> List[Tuple[str, int]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT term, df FROM term_df ORDER BY df DESC, term LIMIT ? OFFSET ?", (int(limit), int(offset))
+            ).fetchall()
+        return [(term, int(df)) for term, df in rows]
+
+    def iter_postings(self) -> Iterator[Tuple[str, List[int]]]:
+        # Por lotes de términos consecutivos, sin mantener el lock entre lotes
+        last = ""
+        while True:
+            with self._lock:
+                terms = [r[0] for r in self._conn.execute(
+                    "SELECT term FROM term_df WHERE term > ? ORDER BY term LIMIT ?", (last, _IN_BATCH)
+                )]
+                if not terms:
+                    return
+                rows = self._conn.execute(
+                    "SELECT term, book_id FROM postings WHERE term >= ? AND term <= ? ORDER BY term, book_id",
+                    (terms[0], terms[-1]),
+                ).fetchall()
+            for term, group in itertools.groupby(rows, key=lambda r: r[0]):
+                yield term, [r[1] for r in group]
+            last = terms[-1]
+
+    def storage_bytes(self) -> int:
+        with self._lock:
+            pages, page_size = (self._conn.execute("PRAGMA page_count").fetchone()[0],
+                                self._conn.execute("PRAGMA page_size").fetchone()[0])
+        return int(pages) * int(page_size)
+
+    def reset_index(self) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM postings")
+                self._conn.execute("DELETE FROM forward")
+                self._conn.execute("DELETE FROM term_df")
+                self._conn.execute("UPDATE stats SET terms = 0, total_postings = 0 WHERE id = 1")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _create_stats_schema(self) -> None:
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS term_df ("
+            " term TEXT PRIMARY KEY,"
+            " df INTEGER NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS term_df_rank ON term_df (df DESC, term)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stats ("
+            " id INTEGER PRIMARY KEY CHECK (id = 1),"
+            " terms INTEGER NOT NULL,"
+            " total_postings INTEGER NOT NULL"
+            ")"
+        )
+        # INSERT OR IGNORE no dispara el trigger cuando la fila ya existe
+        self._conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS postings_after_insert AFTER INSERT ON postings BEGIN"
+            " INSERT INTO term_df (term, df) VALUES (NEW.term, 1)"
+            "  ON CONFLICT (term) DO UPDATE SET df = df + 1;"
+            " UPDATE stats SET total_postings = total_postings + 1 WHERE id = 1;"
+            " END"
+        )
+        self._conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS postings_after_delete AFTER DELETE ON postings BEGIN"
+            " UPDATE term_df SET df = df - 1 WHERE term = OLD.term;"
+            " DELETE FROM term_df WHERE term = OLD.term AND df <= 0;"
+            " UPDATE stats SET total_postings = total_postings - 1 WHERE id = 1;"
+            " END"
+        )
+        self._conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS term_df_after_insert AFTER INSERT ON term_df BEGIN"
+            " UPDATE stats SET terms = terms + 1 WHERE id = 1;"
+            " END"
+        )
+        self._conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS term_df_after_delete AFTER DELETE ON term_df BEGIN"
+            " UPDATE stats SET terms = terms - 1 WHERE id = 1;"
+            " END"
+        )
+        if self._conn.execute("SELECT 1 FROM stats WHERE id = 1").fetchone() is None:
+            # Índice creado antes de existir term_df/stats: se siembran una sola vez
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM term_df")
+                self._conn.execute("INSERT INTO term_df (term, df) SELECT term, COUNT(*) FROM postings GROUP BY term")
+                self._conn.execute(
+                    "INSERT INTO stats (id, terms, total_postings)"
+                    " SELECT 1, (SELECT COUNT(*) FROM term_df), (SELECT COUNT(*) FROM postings)"
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _read_postings(self, term: str) -> List[int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT book_id FROM postings WHERE term = ? ORDER BY book_id", (term,)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def _document_frequencies(self, terms: List[str]) -> Dict[str, int]:
+        df: Dict[str, int] = {}
+        for start in range(0, len(terms), _IN_BATCH):
+            batch = terms[start:start + _IN_BATCH]
+            marks = ",".join("?" * len(batch))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT term, df FROM term_df WHERE term IN ({marks})", batch
+                ).fetchall()
+            df.update({term: int(n) for term, n in rows})
+        return df
+
+    def _latest_body_path(self, book_id: int) -> Optional[str]:
+        return self.manifest.latest_location(book_id, "body")
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import os
+import shutil
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from application.InvertedIndexReader import InvertedIndexReader
+from utils.BooleanQuery import BooleanQuery
+from utils.TextPipeline import TextPipeline
+
+TERMS_FILE = "terms.npy"
+TERM_OFFSETS_FILE = "term_offsets.npy"
+TERM_BYTES_FILE = "term_bytes.npy"
+OFFSETS_FILE = "offsets.npy"
+POSTINGS_FILE = "postings.npy"
+RANK_FILE = "rank.npy"
+# Nombre de la versión vigente dentro del directorio del snapshot
+CURRENT_FILE = "CURRENT"
+# Ancho máximo de terms.npy: un término largo no ensancha todas las filas
+TERM_PREFIX_BYTES = 16
+
+_EMPTY = np.empty(0, dtype=np.int32)
+
+
+def write_snapshot(snapshot_dir: str | Path, items: Iterable[Tuple[str, List[int]]]) -> int:
+    """
+    Escribe un snapshot CSR a partir de (término, ids ordenados) en orden de
+    término: terms.npy (prefijos UTF-8 ordenados, de ancho fijo, para la
+    búsqueda binaria), term_offsets.npy y term_bytes.npy (términos completos),
+    offsets.npy (int64, n_terms + 1), postings.npy (int32 contiguo) y
+    rank.npy (posiciones ordenadas por df descendente, para top_terms).
+
+    Cada exportación va a un subdirectorio nuevo y CURRENT pasa a apuntar a
+    él al final, así que un lector nunca mezcla ficheros de dos versiones.
+    Devuelve n_terms.
+    """
+    root = Path(snapshot_dir)
+    root.mkdir(parents=True, exist_ok=True)
+    terms: List[bytes] = []
+    term_offsets = array("q", [0])
+    offsets = array("q", [0])
+    postings = array("i")
+    for term, ids in items:
+        encoded = term.encode("utf-8")
+        # El orden de bytes UTF-8 coincide con el de los puntos de código
+        if terms and encoded <= terms[-1]:
+            raise ValueError(
+                f"Los términos deben llegar ordenados y sin repetir: '{term}' tras '{terms[-1].decode()}'"
+            )
+        if ids and ids[-1] > np.iinfo(np.int32).max:
+            raise ValueError(f"book_id fuera del rango int32: {ids[-1]}")
+        terms.append(encoded)
+        term_offsets.append(term_offsets[-1] + len(encoded))
+        postings.extend(ids)
+        offsets.append(len(postings))
+
+    offsets_arr = np.frombuffer(offsets, dtype=np.int64)
+    # argsort estable sobre términos ya ordenados: empata por término ascendente
+    rank = np.argsort(-np.diff(offsets_arr), kind="stable").astype(np.int32)
+    width = min(TERM_PREFIX_BYTES, max((len(t) for t in terms), default=1))
+    arrays = {
+        TERMS_FILE: np.array([t[:width] for t in terms], dtype=f"S{width}"),
+        TERM_OFFSETS_FILE: np.frombuffer(term_offsets, dtype=np.int64),
+        TERM_BYTES_FILE: np.frombuffer(b"".join(terms), dtype=np.uint8),
+        OFFSETS_FILE: offsets_arr,
+        POSTINGS_FILE: np.frombuffer(postings, dtype=np.int32),
+        RANK_FILE: rank,
+    }
+    versions = _versions(root)
+    target = root / f"v{(versions[-1] + 1 if versions else 1):06d}"
+    target.mkdir()
+    for name, arr in arrays.items():
+        np.save(target / name, arr)
+    tmp = root / f"{CURRENT_FILE}.tmp"
+    tmp.write_text(target.name, encoding="utf-8")
+    os.replace(tmp, root / CURRENT_FILE)
+    # La versión anterior se conserva para los lectores que aún la tengan abierta
+    for v in versions[:-1]:
+        shutil.rmtree(root / f"v{v:06d}", ignore_errors=True)
+    return len(terms)
+
+
+def current_snapshot_dir(snapshot_dir: str | Path) -> Path:
+    """Subdirectorio de la versión vigente del snapshot."""
+    root = Path(snapshot_dir)
+    try:
+        name = (root / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"No existe el snapshot: {root}") from None
+    return root / name
+
+
+def _versions(root: Path) -> List[int]:
+    return sorted(int(p.name[1:]) for p in root.glob("v*") if p.is_dir() and p.name[1:].isdigit())
+
+
+class InvertedIndexSnapshotRepository(InvertedIndexReader):
+    """
+    Índice invertido de solo lectura en memoria (o mmap) con layout CSR: los
+    postings del término i son postings[offsets[i]:offsets[i + 1]].
+
+    Se genera con export() desde cualquier InvertedIndexRepository y no
+    necesita ningún servidor en el camino de lectura: una búsqueda es una
+    búsqueda binaria sobre terms más un slice, y AND/OR/NOT se resuelven con
+    np.intersect1d, np.union1d y np.setdiff1d. Solo implementa el puerto de
+    lectura: para cambiarlo se indexa en el origen y se vuelve a exportar. Con mmap_mode="r" los
+    ficheros .npy se mapean sin copiarse a memoria.
+
+    La normalización de términos debe coincidir con la del índice de origen
+    (mismas stopwords y stemming).
+    """
+
+    def __init__(
+        self,
+        snapshot_dir: str,
+        stopwords_path: Optional[str] = "stopwords.txt",
+        use_stemming: bool = True,
+        mmap_mode: Optional[str] = "r",
+    ) -> None:
+        self.snapshot_dir = Path(snapshot_dir)
+        self.version_dir = current_snapshot_dir(self.snapshot_dir)
+        load = lambda name: np.load(self.version_dir / name, mmap_mode=mmap_mode)
+        self.terms = load(TERMS_FILE)
+        self.term_offsets = load(TERM_OFFSETS_FILE)
+        self.term_bytes = load(TERM_BYTES_FILE)
+        self.offsets = load(OFFSETS_FILE)
+        self.postings = load(POSTINGS_FILE)
+        self.rank = load(RANK_FILE)
+        self._prefix_len = self.terms.dtype.itemsize
+
+        stopwords = TextPipeline.load_stopwords(stopwords_path) if stopwords_path else set()
+        self.pipeline = TextPipeline(stopwords, use_stemming)
+
+    @classmethod
+    def export(cls, source: InvertedIndexReader, snapshot_dir: str, **kwargs) -> "InvertedIndexSnapshotRepository":
+        write_snapshot(snapshot_dir, source.iter_postings())
+        return cls(snapshot_dir, **kwargs)
+
+    # --- lectura --------------------------------------------------------
+
+    def get_index_by_term(self, term: str) -> List[int]:
+        t = self.pipeline.pipeline_single_token(term)
+        if not t:
+            return []
+        return self.postings_array(t).tolist()
+
+    def postings_array(self, term: str) -> np.ndarray:
+        """Postings de un término ya normalizado, como vista int32 sin copia."""
+        i = self._find(term)
+        if i < 0:
+            return _EMPTY
+        return self.postings[self.offsets[i]:self.offsets[i + 1]]
+
+    def query(self, expr: str) -> List[int]:
+        q = BooleanQuery(expr, self.pipeline.pipeline_single_token)
+        result = q.evaluate(
+            self.postings_array,
+            self._document_frequencies,
+            intersect=lambda a, b: np.intersect1d(a, b, assume_unique=True),
+            union=_union_many,
+            difference=lambda a, b: np.setdiff1d(a, b, assume_unique=True),
+        )
+        return np.asarray(result, dtype=np.int32).tolist()
+
+    def get_index_stats(self) -> Dict[str, int]:
+        return {"terms": int(len(self.terms)), "total_postings": int(self.offsets[-1])}
+
+    def top_terms(self, limit: int, offset: int = 0) -> List[Tuple[str, int]]:
+        idx = self.rank[offset:offset + limit]
+        dfs = self.offsets[idx + 1] - self.offsets[idx]
+        return [(self._term(int(i)).decode("utf-8"), df) for i, df in zip(idx, dfs.tolist())]
+
+    def iter_postings(self) -> Iterator[Tuple[str, List[int]]]:
+        for i in range(len(self.terms)):
+            yield self._term(i).decode("utf-8"), self.postings[self.offsets[i]:self.offsets[i + 1]].tolist()
+
+    def storage_bytes(self) -> int:
+        arrays = (self.terms, self.term_offsets, self.term_bytes, self.offsets, self.postings, self.rank)
+        return sum(arr.nbytes for arr in arrays)
+
+    # --- internos -------------------------------------------------------
+
+    def _term(self, i: int) -> bytes:
+        return self.term_bytes[self.term_offsets[i]:self.term_offsets[i + 1]].tobytes()
+
+    def _find(self, term: str) -> int:
+        key = term.encode("utf-8")
+        prefix = key[:self._prefix_len]
+        lo = int(np.searchsorted(self.terms, prefix, side="left"))
+        if len(key) < self._prefix_len:
+            # Más corto que el prefijo: la fila solo coincide si es el término completo
+            return lo if lo < len(self.terms) and self.terms[lo] == prefix else -1
+        # Términos que comparten el prefijo recortado: se comparan completos dentro del rango
+        hi = int(np.searchsorted(self.terms, prefix, side="right"))
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.terms) and self._term(lo) == key:
+            return lo
+        return -1
+
+    def _document_frequencies(self, terms: List[str]) -> Dict[str, int]:
+        df = {}
+        for t in terms:
+            i = self._find(t)
+            if i >= 0:
+                df[t] = int(self.offsets[i + 1] - self.offsets[i])
+        return df
+
+
+def _union_many(arrays: Iterable[np.ndarray]) -> np.ndarray:
+    non_empty = [a for a in arrays if len(a)]
+    if not non_empty:
+        return _EMPTY
+    if len(non_empty) == 2:
+        return np.union1d(*non_empty)
+    return np.unique(np.concatenate(non_empty))
@@ -1,8 +1,19 @@
 import hashlib
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
 from application.MetadataRepository import MetadataRepository
-from domain.book import Book
+from domain.book import Book, BookPage
 from pymongo import MongoClient, ASCENDING
 from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+_DUPLICATE_KEY = 11000
+# Proyección con solo campos indexados: las consultas por autor y por título quedan cubiertas
+_BOOK_PROJECTION = {"_id": 0, "book_id": 1, "title": 1, "author": 1, "language": 1}
+_FULL_PROJECTION = {**_BOOK_PROJECTION, "release_date": 1, "credits": 1}
+
 
 class MetadataMongoDBRepository(MetadataRepository):
     def __init__(self, client: MongoClient, db_name: str = "books", collection: str = "metadata"):
@@ -10,13 +21,120 @@ class MetadataMongoDBRepository(MetadataRepository):
         self.client = client
         self.col: Collection = client[db_name][collection]
         self.col.create_index([("raw_text_hash", ASCENDING)], unique=True)
+        self.col.create_index([("book_id", ASCENDING)], unique=True, name="book_id_unique")
+        self.col.create_index(
+            [("author", ASCENDING), ("language", ASCENDING), ("book_id", ASCENDING), ("title", ASCENDING)],
+            name="author_language_covering",
+        )
+        self.col.create_index(
+            [("title", ASCENDING), ("book_id", ASCENDING), ("author", ASCENDING), ("language", ASCENDING)],
+            name="title_prefix_covering",
+        )
 
     def save_metadata(self, book: Book) -> str:
+        result = self.col.insert_one(self._to_doc(book))
+        return str(result.inserted_id)
+
+    def save_metadata_many(self, books: List[Book], batch_size: int = 1000) -> List[Optional[str]]:
+        """
+        Inserta en lotes desordenados. Devuelve un _id por libro, en el mismo
+        orden, o None si ese libro no se pudo insertar (sin book_id, o duplicado).
+        """
+        ids: List[Optional[str]] = []
+        for start in range(0, len(books), batch_size):
+            batch_ids: List[Optional[str]] = []
+            docs, positions = [], []
+            for book in books[start:start + batch_size]:
+                batch_ids.append(None)
+                try:
+                    docs.append(self._to_doc(book))
+                except ValueError as e:
+                    print(f"[WARN] No se guardó el libro {book.title!r}: {e}")
+                    continue
+                positions.append(len(batch_ids) - 1)
+            failed = {}
+            if docs:
+                try:
+                    self.col.insert_many(docs, ordered=False)
+                except BulkWriteError as e:
+                    for err in e.details.get("writeErrors", []):
+                        failed[err["index"]] = err
+            for i, (doc, pos) in enumerate(zip(docs, positions)):
+                err = failed.get(i)
+                if err is None:
+                    # insert_many asigna el _id en el propio documento antes de enviarlo
+                    batch_ids[pos] = str(doc["_id"])
+                    continue
+                reason = "duplicado" if err.get("code") == _DUPLICATE_KEY else err.get("errmsg", "")
+                print(f"[WARN] No se guardó el libro {doc['book_id']}: {reason}")
+            ids.extend(batch_ids)
+        return ids
+
+    def get_metadata(self, book_id: int) -> Optional[Book]:
+        doc = self.col.find_one({"book_id": int(book_id)}, _FULL_PROJECTION)
+        return self._to_book(doc) if doc else None
+
+    def get_metadata_many(self, book_ids: List[int]) -> List[Book]:
+        ids = [int(b) for b in book_ids]
+        found = {d["book_id"]: d for d in self.col.find({"book_id": {"$in": ids}}, _FULL_PROJECTION)}
+        return [self._to_book(found[b]) for b in ids if b in found]
+
+    def find_by_author(self, author: str, language: Optional[str] = None,
+                       cursor: Optional[str] = None, page_size: int = 50) -> BookPage:
+        query: Dict[str, Any] = {"author": author}
+        if language is not None:
+            query["language"] = language
+            sort_keys = ("book_id",)
+        else:
+            # Sin idioma fijado, el orden (language, book_id) es el que sigue el índice
+            sort_keys = ("language", "book_id")
+        return self._page(query, sort_keys, cursor, page_size, "author_language_covering")
+
+    def search_title_prefix(self, prefix: str, cursor: Optional[str] = None, page_size: int = 50) -> BookPage:
+        # Regex anclada y sensible a mayúsculas: Mongo la resuelve como rango sobre el índice
+        query = {"title": {"$regex": f"^{re.escape(prefix)}"}}
+        return self._page(query, ("title", "book_id"), cursor, page_size, "title_prefix_covering")
+
+    def _page(self, query: Dict[str, Any], sort_keys: Tuple[str, ...], cursor: Optional[str],
+              page_size: int, hint: str) -> BookPage:
+        # Paginación por keyset: el cursor guarda la clave de orden del último libro devuelto.
+        # null ordena antes que cualquier valor y {"$gt": None} no encuentra nada, así que
+        # "mayor que null" es "distinto de null"
+        if cursor:
+            last = json.loads(cursor)
+            after = []
+            for i, key in enumerate(sort_keys):
+                cond = {k: last[k] for k in sort_keys[:i]}
+                cond[key] = {"$ne": None} if last[key] is None else {"$gt": last[key]}
+                after.append(cond)
+            query = {"$and": [query, {"$or": after}]}
+        docs = list(
+            self.col.find(query, _BOOK_PROJECTION)
+            .sort([(k, ASCENDING) for k in sort_keys])
+            .hint(hint)
+            .limit(page_size + 1)
+        )
+        next_cursor = None
+        if len(docs) > page_size:
+            docs = docs[:page_size]
+            next_cursor = json.dumps({k: docs[-1].get(k) for k in sort_keys})
+        return BookPage(items=[self._to_book(d) for d in docs], next_cursor=next_cursor)
+
+    @staticmethod
+    def _to_book(doc: Dict[str, Any]) -> Book:
+        return Book(
+            book_id=doc.get("book_id"),
+            title=doc.get("title"),
+            author=doc.get("author"),
+            language=doc.get("language"),
+            release_date=doc.get("release_date"),
+            credits=doc.get("credits"),
+        )
+
+    @staticmethod
+    def _to_doc(book: Book) -> dict:
         if not book.book_id:
             raise ValueError("book_id es obligatorio para guardar en MongoDB.")
         doc = book.to_dict()
         doc["raw_text_hash"] = hashlib.sha256(str(book.book_id).encode()).hexdigest()
-        self.col.insert_one(doc)
-
-        doc = self.col.find_one({"book_id": book.book_id}, {"_id": 1})
-        return str(doc["_id"]) if doc else ""
+        return doc
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, List, Optional, Sequence, Tuple
+
+from application.MetadataRepository import MetadataRepository
+from domain.book import Book, BookPage
+
+# Las páginas por autor o título leen solo _COLUMNS, cubiertas por los índices
+_COLUMNS = "book_id, title, author, language"
+_ALL_COLUMNS = f"{_COLUMNS}, release_date, credits"
+# SQLite limita el número de parámetros por sentencia (999 en versiones antiguas)
+_IN_BATCH = 500
+
+
+class MetadataSQLiteRepository(MetadataRepository):
+    """
+    Metadatos en SQLite (WAL). book_id es la clave primaria (rowid), y los
+    índices (author, language, book_id, title) y (title, book_id, author,
+    language) cubren las consultas por autor y por prefijo de título.
+    """
+
+    def __init__(self, path: str, table: str = "metadata", cache_size_mb: int = 64) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        self._conn.execute(f"PRAGMA cache_size=-{int(cache_size_mb) * 1024}")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " book_id INTEGER PRIMARY KEY,"
+            " title TEXT,"
+            " author TEXT,"
+            " language TEXT,"
+            " release_date TEXT,"
+            " credits TEXT,"
+            " raw_text_hash TEXT NOT NULL UNIQUE"
+            ")"
+        )
+        existing = {r[1] for r in self._conn.execute(f"PRAGMA table_info({table})")}
+        for column in ("release_date", "credits"):
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT")
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_author_language_covering"
+            f" ON {table} (author, language, book_id, title)"
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_title_prefix_covering"
+            f" ON {table} (title, book_id, author, language)"
+        )
+
+    def save_metadata(self, book: Book) -> str:
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO {self.table} ({_ALL_COLUMNS}, raw_text_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._to_row(book),
+            )
+        return str(book.book_id)
+
+    def save_metadata_many(self, books: List[Book], batch_size: int = 1000) -> List[Optional[str]]:
+        """
+        Inserta en lotes, un executemany por transacción. Devuelve el id de
+        cada libro, en el mismo orden, o None si no tiene book_id o ya existía.
+        """
+        ids: List[Optional[str]] = []
+        for start in range(0, len(books), batch_size):
+            rows: List[Optional[Tuple[Any, ...]]] = []
+            for book in books[start:start + batch_size]:
+                try:
+                    rows.append(self._to_row(book))
+                except ValueError as e:
+                    print(f"[WARN] No se guardó el libro {book.title!r}: {e}")
+                    rows.append(None)
+            valid = [r for r in rows if r is not None]
+            with self._lock:
+                self._conn.execute("BEGIN")
+                try:
+                    existing = self._existing_ids([r[0] for r in valid])
+                    fresh, seen = [], set()
+                    for row in valid:
+                        if row[0] in existing or row[0] in seen:
+                            continue
+                        seen.add(row[0])
+                        fresh.append(row)
+                    self._conn.executemany(
+                        f"INSERT INTO {self.table} ({_ALL_COLUMNS}, raw_text_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        fresh,
+                    )
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            inserted = {row[0] for row in fresh}
+            for row in rows:
+                if row is None:
+                    ids.append(None)
+                    continue
+                bid = row[0]
+                if bid in inserted:
+                    ids.append(str(bid))
+                    inserted.discard(bid)
+                else:
+                    ids.append(None)
+                    print(f"[WARN] No se guardó el libro {bid}: duplicado")
+        return ids
+
+    def get_metadata(self, book_id: int) -> Optional[Book]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_ALL_COLUMNS} FROM {self.table} WHERE book_id = ?", (int(book_id),)
+            ).fetchone()
+        return self._to_book(row) if row else None
+
+    def get_metadata_many(self, book_ids: List[int]) -> List[Book]:
+        ids = [int(b) for b in book_ids]
+        found = {}
+        for start in range(0, len(ids), _IN_BATCH):
+            batch = ids[start:start + _IN_BATCH]
+            marks = ",".join("?" * len(batch))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT {_ALL_COLUMNS} FROM {self.table} WHERE book_id IN ({marks})", batch
+                ).fetchall()
+            found.update({r[0]: r for r in rows})
+        return [self._to_book(found[b]) for b in ids if b in found]
+
+    def find_by_author(self, author: str, language: Optional[str] = None,
+                       cursor: Optional[str] = None, page_size: int = 50) -> BookPage:
+        if language is not None:
+            where, params, sort_keys = "author = ? AND language = ?", [author, language], ("book_id",)
+        else:
+            where, params, sort_keys = "author = ?", [author], ("language", "book_id")
+        return self._page(where, params, sort_keys, cursor, page_size)
+
+    def search_title_prefix(self, prefix: str, cursor: Optional[str] = None, page_size: int = 50) -> BookPage:
+        # Rango [prefix, siguiente prefijo) sobre el índice de título, sensible a mayúsculas
+        if prefix:
+            upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+            where, params = "title >= ? AND title < ?", [prefix, upper]
+        else:
+            where, params = "title IS NOT NULL", []
+        return self._page(where, params, ("title", "book_id"), cursor, page_size)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _page(self, where: str, params: List[Any], sort_keys: Tuple[str, ...], cursor: Optional[str],
+              page_size: int) -> BookPage:
+        if cursor:
+            after, after_params = self._after(sort_keys, json.loads(cursor))
+            where += f" AND {after}"
+            params = params + after_params
+        sql = (f"SELECT {_COLUMNS} FROM {self.table} WHERE {where}"
+               f" ORDER BY {', '.join(sort_keys)} LIMIT ?")
+        with self._lock:
+            rows = self._conn.execute(sql, params + [page_size + 1]).fetchall()
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last_book = self._to_book(rows[-1]).to_dict()
+            next_cursor = json.dumps({k: last_book.get(k) for k in sort_keys})
+        return BookPage(items=[self._to_book(r) for r in rows], next_cursor=next_cursor)
+
+    @staticmethod
+    def _after(sort_keys: Tuple[str, ...], last: dict) -> Tuple[str, List[Any]]:
+        # Paginación por keyset con row values, (a, b) > (?, ?), que recorren el índice desde el cursor.
+        # Con NULL en el cursor la comparación da NULL: se expande a mano sabiendo que NULL ordena primero
+        values = [last[k] for k in sort_keys]
+        if all(v is not None for v in values):
+            return f"({', '.join(sort_keys)}) > ({', '.join('?' * len(sort_keys))})", values
+        branches, params = [], []
+        for i, key in enumerate(sort_keys):
+            conds = []
+            for prev in sort_keys[:i]:
+                conds.append(f"{prev} IS ?")
+                params.append(last[prev])
+            if last[key] is None:
+                conds.append(f"{key} IS NOT NULL")
+            else:
+                conds.append(f"{key} > ?")
+                params.append(last[key])
+            branches.append(" AND ".join(conds))
+        return "((" + ") OR (".join(branches) + "))", params
+
+    def _existing_ids(self, ids: Sequence[int]) -> set:
+        found = set()
+        for start in range(0, len(ids), _IN_BATCH):
+            batch = list(ids[start:start + _IN_BATCH])
+            marks = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT book_id FROM {self.table} WHERE book_id IN ({marks})", batch
+            ).fetchall()
+            found.update(r[0] for r in rows)
+        return found
+
+    @staticmethod
+    def _to_book(row: Sequence[Any]) -> Book:
+        # row sigue el orden de _ALL_COLUMNS, o solo el de _COLUMNS en las páginas
+        return Book(*row)
+
+    @staticmethod
+    def _to_row(book: Book) -> Tuple[Any, ...]:
+        if not book.book_id:
+            raise ValueError("book_id es obligatorio para guardar en SQLite.")
+        return (
+            int(book.book_id),
+            book.title,
+            book.author,
+            book.language,
+            book.release_date,
+            book.credits,
+            hashlib.sha256(str(book.book_id).encode()).hexdigest(),
+        )
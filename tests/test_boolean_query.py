@@ -0,0 +1,135 @@
+import random
+
+import pytest
+
+from utils.BooleanQuery import BooleanQuery, difference_sorted, intersect_galloping, union_many
+
+TERMS = ["alpha", "beta", "gamma", "delta", "omega"]
+UNIVERSE = range(300)
+
+
+def _identity(token):
+    return token
+
+
+def _make_index(rng):
+    index = {}
+    for term in TERMS:
+        density = rng.choice([0.02, 0.1, 0.4, 0.9])
+        index[term] = sorted(x for x in UNIVERSE if rng.random() < density)
+    return index
+
+
+def _evaluate(expr, index, normalize=_identity):
+    q = BooleanQuery(expr, normalize)
+    df = lambda terms: {t: len(index[t]) for t in terms if index.get(t)}
+    return q.evaluate(lambda t: index.get(t, []), df)
+
+
+# Árboles aleatorios: NOT solo aparece dentro de un AND con algún hijo positivo,
+# que es la única forma que admite el evaluador.
+def _random_tree(rng, depth):
+    if depth == 0 or rng.random() < 0.3:
+        return ("term", rng.choice(TERMS))
+    op = rng.choice(["and", "or"])
+    children = [_random_tree(rng, depth - 1) for _ in range(rng.randint(2, 3))]
+    if op == "and" and rng.random() < 0.5:
+        children.append(("not", _random_tree(rng, depth - 1)))
+    return (op, children)
+
+
+def _expected(node, index):
+    kind = node[0]
+    if kind == "term":
+        return set(index[node[1]])
+    if kind == "or":
+        return set().union(*(_expected(c, index) for c in node[1]))
+    positive = [_expected(c, index) for c in node[1] if c[0] != "not"]
+    negative = [_expected(c[1], index) for c in node[1] if c[0] == "not"]
+    return set.intersection(*positive).difference(*negative)
+
+
+_PRECEDENCE = {"or": 1, "and": 2, "not": 3, "term": 4}
+
+
+def _render(node, rng, parent=0):
+    # Solo se ponen paréntesis cuando la precedencia lo exige, y el AND
+    # implícito (términos seguidos) se alterna con el explícito
+    kind = node[0]
+    if kind == "term":
+        text = node[1]
+    elif kind == "not":
+        text = "NOT " + _render(node[1], rng, _PRECEDENCE["not"])
+    else:
+        parts = [_render(c, rng, _PRECEDENCE[kind] + 1) for c in node[1]]
+        if kind == "or":
+            text = " OR ".join(parts)
+        else:
+            text = parts[0]
+            for part in parts[1:]:
+                text += (" AND " if part.startswith("NOT") or rng.random() < 0.7 else " ") + part
+    if _PRECEDENCE[kind] < parent:
+        text = f"({text})"
+    return text
+
+
+def test_random_queries_match_brute_force_sets():
+    rng = random.Random(2024)
+    for _ in range(50):
+        index = _make_index(rng)
+        for _ in range(40):
+            tree = _random_tree(rng, 3)
+            expr = _render(tree, rng)
+            assert _evaluate(expr, index) == sorted(_expected(tree, index)), expr
+
+
+@pytest.mark.parametrize("expr, expected", [
+    ("a OR b AND c", {1, 2, 3, 5}),
+    ("(a OR b) AND c", {3, 5}),
+    ("a b", {1}),
+    ("a AND NOT b", {2, 3}),
+    ("NOT b AND a", {2, 3}),
+    ("c AND NOT (a OR b)", set()),
+    ("a OR b AND NOT c", {1, 2, 3, 4}),
+])
+def test_precedence_not_over_and_over_or(expr, expected):
+    index = {"a": [1, 2, 3], "b": [1, 4, 5], "c": [3, 5]}
+    assert _evaluate(expr, index) == sorted(expected)
+
+
+@pytest.mark.parametrize("expr", ["a OR NOT b", "NOT a", "NOT a AND NOT b", "(NOT a) OR b", "a AND NOT NOT b"])
+def test_negation_without_positive_sibling_raises(expr):
+    with pytest.raises(ValueError):
+        _evaluate(expr, {"a": [1, 2], "b": [2, 3]})
+
+
+@pytest.mark.parametrize("expr", ["(a AND b", "a AND", "a OR", ")", "a )", "AND a", "()"])
+def test_malformed_queries_raise(expr):
+    with pytest.raises(ValueError):
+        BooleanQuery(expr, _identity)
+
+
+def test_terms_dropped_by_normalization_are_ignored():
+    index = {"a": [1, 2, 3], "b": [2, 3]}
+    drop_the = lambda t: None if t == "the" else t
+    assert _evaluate("a AND the", index, drop_the) == [1, 2, 3]
+    assert _evaluate("the OR b", index, drop_the) == [2, 3]
+    assert _evaluate("the", index, drop_the) == []
+
+
+def test_unknown_terms_give_empty_intersections():
+    index = {"a": [1, 2, 3]}
+    assert _evaluate("a AND missing", index) == []
+    assert _evaluate("a OR missing", index) == [1, 2, 3]
+    assert _evaluate("a AND NOT missing", index) == [1, 2, 3]
+
+
+def test_set_operations_match_python_sets():
+    rng = random.Random(11)
+    for _ in range(500):
+        a = sorted(rng.sample(range(5000), rng.randint(0, 300)))
+        b = sorted(rng.sample(range(5000), rng.choice([0, 1, 5, 50, 2000])))
+        assert intersect_galloping(a, b) == sorted(set(a) & set(b))
+        assert intersect_galloping(b, a) == sorted(set(a) & set(b))
+        assert difference_sorted(a, b) == sorted(set(a) - set(b))
+        assert union_many([a, b, []]) == sorted(set(a) | set(b))
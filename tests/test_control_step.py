@@ -0,0 +1,38 @@
+import pytest
+
+pytest.importorskip("apscheduler")
+
+from control.ControlStateStore import ControlStateStore, METADATA_SAVED  # noqa: E402
+from control.main import control_pipeline_step  # noqa: E402
+
+
+class _RecordingIndex:
+    def __init__(self):
+        self.indexed = []
+
+    def index_book(self, book_id):
+        self.indexed.append(book_id)
+        return True
+
+
+class _RecordingBookService:
+    def __init__(self):
+        self.saved = []
+
+    def ensure_metadata(self, book_id):
+        self.saved.append(book_id)
+        return True
+
+
+def test_steps_reuse_the_repositories_they_are_given(tmp_path):
+    state = ControlStateStore(tmp_path / "state.sqlite")
+    state.mark_downloaded(1)
+    state.mark_downloaded(2)
+    index, books = _RecordingIndex(), _RecordingBookService()
+
+    control_pipeline_step(state, None, index, books)
+    control_pipeline_step(state, None, index, books)
+
+    assert sorted(index.indexed) == [1, 2]
+    assert sorted(books.saved) == [1, 2]
+    assert state.status(1) == state.status(2) == METADATA_SAVED
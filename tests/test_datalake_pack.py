@@ -0,0 +1,47 @@
+import pytest
+
+import application.bookService as book_service
+from application.bookService import END_MARKER, START_MARKER, split_stream_to_datalake
+from utils.DatalakeManifest import DatalakeManifest
+from utils.DatalakePack import PACK_NAME, RecordWriter, append_records, iter_index, read_record
+
+HEADER = "Title: Streaming\nAuthor: Somebody"
+BODY = "\n".join(f"line {i} of a long body" for i in range(5000))
+TEXT = f"  {HEADER}\n{START_MARKER} STREAMING ***\n\n{BODY}\n\n{END_MARKER} STREAMING ***\nfooter"
+
+
+def _chunks(text, size):
+    return (text[i:i + size] for i in range(0, len(text), size))
+
+
+@pytest.mark.parametrize("codec", ["none", "zlib"])
+def test_record_writer_round_trips_written_chunks(tmp_path, codec):
+    pack = tmp_path / PACK_NAME
+    with RecordWriter(7, "body", codec) as body, RecordWriter(7, "header", codec) as header:
+        for chunk in _chunks(BODY, 1000):
+            body.write(chunk)
+        header.write(HEADER)
+        written = append_records(pack, [body, header])
+    assert [(bid, kind) for bid, kind, _, _ in written] == [(7, "body"), (7, "header")]
+    assert list(iter_index(pack)) == written
+    assert read_record(pack, *written[0][2:]) == BODY
+    assert read_record(pack, *written[1][2:]) == HEADER
+
+
+@pytest.mark.parametrize("chunk_size", [7, 4096])
+def test_packed_stream_matches_loose_files(tmp_path, monkeypatch, chunk_size):
+    loose, packed = tmp_path / "loose", tmp_path / "packed"
+    assert split_stream_to_datalake(1, _chunks(TEXT, chunk_size), loose)
+    monkeypatch.setattr(book_service, "DATALAKE_FORMAT", "pack")
+    assert split_stream_to_datalake(1, _chunks(TEXT, chunk_size), packed)
+
+    for kind in ("header", "body"):
+        assert DatalakeManifest.open(packed).read_text(1, kind) == DatalakeManifest.open(loose).read_text(1, kind)
+    assert DatalakeManifest.open(packed).read_text(1, "body").endswith(BODY)
+    assert not [p for p in packed.rglob("*") if p.is_file() and p.name.endswith(".tmp")]
+
+
+def test_incomplete_stream_is_not_packed(tmp_path, monkeypatch):
+    monkeypatch.setattr(book_service, "DATALAKE_FORMAT", "pack")
+    assert not split_stream_to_datalake(2, _chunks(TEXT[:len(TEXT) // 2], 512), tmp_path)
+    assert not list(tmp_path.rglob(PACK_NAME))
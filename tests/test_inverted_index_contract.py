@@ -0,0 +1,136 @@
+import pytest
+
+from utils.DatalakeManifest import DatalakeManifest
+
+BODIES = {
+    1: "apple banana cherry",
+    2: "banana cherry date",
+    3: "cherry date elder",
+}
+
+
+def _write_book(root, hour, book_id, body):
+    target = root / "20240101" / hour
+    target.mkdir(parents=True, exist_ok=True)
+    header_path = target / f"{book_id}.header.txt"
+    body_path = target / f"{book_id}.body.txt"
+    header_path.write_text(f"Title: Book {book_id}", encoding="utf-8")
+    body_path.write_text(body, encoding="utf-8")
+    return header_path, body_path
+
+
+@pytest.fixture
+def datalake(tmp_path):
+    root = tmp_path / "datalake"
+    for book_id, body in BODIES.items():
+        _write_book(root, "00", book_id, body)
+    DatalakeManifest.open(root)
+    return root
+
+
+def _sqlite_repo(tmp_path, datalake):
+    from infrastructure.InvertedIndexSQLiteRepository import InvertedIndexSQLiteRepository
+    return InvertedIndexSQLiteRepository(
+        str(tmp_path / "index.sqlite"), str(datalake), stopwords_path=None, use_stemming=False,
+    )
+
+
+def _file_repo(tmp_path, datalake):
+    from infrastructure.InvertedIndexFileRepository import InvertedIndexFileRepository
+    return InvertedIndexFileRepository(
+        str(tmp_path / "index"), str(datalake), stopwords_path=None, use_stemming=False,
+        background_merge=False,
+    )
+
+
+def _mongo_repo(layout):
+    def make(tmp_path, datalake):
+        mongomock = pytest.importorskip("mongomock")
+        from infrastructure.InvertedIndexMongoDBRepository import InvertedIndexMongoDBRepository
+        return InvertedIndexMongoDBRepository(
+            "", "db", str(datalake), stopwords_path=None, use_stemming=False,
+            postings_layout=layout, client=mongomock.MongoClient(),
+        )
+    return make
+
+
+BACKENDS = {
+    "sqlite": _sqlite_repo,
+    "file": _file_repo,
+    "mongomock-array": _mongo_repo("array"),
+    "mongomock-chunked": _mongo_repo("chunked"),
+}
+
+
+@pytest.fixture(params=list(BACKENDS))
+def repo(request, tmp_path, datalake):
+    pytest.importorskip("nltk")
+    repo = BACKENDS[request.param](tmp_path, datalake)
+    yield repo
+    close = getattr(repo, "close", None)
+    if close is not None:
+        close()
+
+
+def _expected_postings(bodies):
+    index = {}
+    for book_id, body in bodies.items():
+        for term in set(body.split()):
+            index.setdefault(term, []).append(book_id)
+    return {term: sorted(ids) for term, ids in index.items()}
+
+
+def _assert_consistent(repo, bodies):
+    expected = _expected_postings(bodies)
+    assert dict(repo.iter_postings()) == expected
+    assert [t for t, _ in repo.iter_postings()] == sorted(expected)
+    ranked = sorted(((t, len(ids)) for t, ids in expected.items()), key=lambda kv: (-kv[1], kv[0]))
+    assert repo.top_terms(len(ranked) + 5) == ranked
+    assert repo.get_index_stats() == {
+        "terms": len(expected),
+        "total_postings": sum(len(ids) for ids in expected.values()),
+    }
+
+
+def test_index_books_and_lookups(repo):
+    assert repo.index_books(list(BODIES)) == 3
+    assert repo.get_index_by_term("cherry") == [1, 2, 3]
+    assert repo.get_index_by_term("Banana") == [1, 2]
+    assert repo.get_index_by_term("missing") == []
+    assert repo.query("banana AND NOT apple") == [2]
+    assert repo.query("apple OR elder") == [1, 3]
+    assert repo.query("(apple OR date) AND cherry") == [1, 2, 3]
+    _assert_consistent(repo, BODIES)
+
+
+def test_top_terms_pagination(repo):
+    repo.index_books(list(BODIES))
+    assert repo.top_terms(1) == [("cherry", 3)]
+    assert repo.top_terms(2, offset=1) == [("banana", 2), ("date", 2)]
+    assert repo.top_terms(10, offset=3) == [("apple", 1), ("elder", 1)]
+    assert repo.top_terms(10, offset=10) == []
+
+
+def test_reindexing_is_idempotent(repo):
+    repo.index_books(list(BODIES))
+    repo.index_books(list(BODIES))
+    _assert_consistent(repo, BODIES)
+
+
+def test_delete_book(repo):
+    repo.index_books(list(BODIES))
+    assert repo.delete_book(1) is True
+    assert repo.get_index_by_term("apple") == []
+    assert repo.get_index_by_term("banana") == [2]
+    assert repo.delete_book(99) is False
+    _assert_consistent(repo, {2: BODIES[2], 3: BODIES[3]})
+
+
+def test_changed_book_replaces_its_terms(repo, datalake):
+    repo.index_books(list(BODIES))
+    header_path, body_path = _write_book(datalake, "01", 2, "banana fig")
+    DatalakeManifest.open(datalake).record(2, header_path, body_path)
+    repo.index_books([2])
+    assert repo.get_index_by_term("date") == [3]
+    assert repo.get_index_by_term("fig") == [2]
+    _assert_consistent(repo, {**BODIES, 2: "banana fig"})
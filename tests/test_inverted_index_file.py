@@ -0,0 +1,54 @@
+import pytest
+
+from tests.test_inverted_index_contract import BODIES, _assert_consistent, _write_book, datalake  # noqa: F401
+from utils.DatalakeManifest import DatalakeManifest
+
+
+def _open(tmp_path, datalake):
+    pytest.importorskip("nltk")
+    from infrastructure.InvertedIndexFileRepository import InvertedIndexFileRepository
+    # Un segmento por libro y fusión síncrona cuando hay cuatro
+    return InvertedIndexFileRepository(
+        str(tmp_path / "index"), str(datalake), stopwords_path=None, use_stemming=False,
+        batch_max_books=1, merge_factor=4, background_merge=False,
+    )
+
+
+def test_merge_drops_tombstones_it_has_applied(tmp_path, datalake):
+    repo = _open(tmp_path, datalake)
+    repo.index_books(list(BODIES))
+    assert len(repo.segments) == 3
+
+    repo.delete_book(1)
+    assert set(repo._tombstones) == {1}
+    _assert_consistent(repo, {2: BODIES[2], 3: BODIES[3]})
+
+    # Reindexar un libro cambiado añade otra lápida y el cuarto segmento dispara la fusión
+    header_path, body_path = _write_book(datalake, "01", 2, "banana fig")
+    DatalakeManifest.open(datalake).record(2, header_path, body_path)
+    repo.index_books([2])
+    assert len(repo.segments) == 1
+    assert repo._tombstones == {}
+    expected = {2: "banana fig", 3: BODIES[3]}
+    _assert_consistent(repo, expected)
+    repo.close()
+
+    reopened = _open(tmp_path, datalake)
+    assert reopened._tombstones == {}
+    _assert_consistent(reopened, expected)
+    assert reopened.delete_book(1) is False
+    reopened.close()
+
+
+def test_tombstone_survives_until_older_segments_are_merged(tmp_path, datalake):
+    repo = _open(tmp_path, datalake)
+    repo.index_books([1, 2])
+    repo.delete_book(1)
+    repo.index_books([3])
+    assert len(repo.segments) == 3 and set(repo._tombstones) == {1}
+    repo.close()
+
+    reopened = _open(tmp_path, datalake)
+    assert set(reopened._tombstones) == {1}
+    _assert_consistent(reopened, {2: BODIES[2], 3: BODIES[3]})
+    reopened.close()
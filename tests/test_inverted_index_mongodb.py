@@ -0,0 +1,76 @@
+import pytest
+
+from tests.test_inverted_index_contract import BODIES, _assert_consistent, _mongo_repo, _write_book, datalake  # noqa: F401
+from utils.DatalakeManifest import DatalakeManifest
+
+
+@pytest.fixture(params=["array", "chunked"])
+def repo(request, tmp_path, datalake):
+    pytest.importorskip("nltk")
+    return _mongo_repo(request.param)(tmp_path, datalake)
+
+
+def test_missing_forward_doc_does_not_inflate_df(repo):
+    repo.index_books(list(BODIES))
+    repo.forward.delete_many({})
+    repo.index_books(list(BODIES))
+    _assert_consistent(repo, BODIES)
+
+
+def test_crash_between_postings_and_forward_is_repaired(repo, datalake):
+    repo.index_books(list(BODIES))
+    header_path, body_path = _write_book(datalake, "01", 2, "banana fig")
+    DatalakeManifest.open(datalake).record(2, header_path, body_path)
+
+    apply = repo._apply_changes
+
+    def apply_then_crash(additions, removals):
+        apply(additions, removals)
+        raise RuntimeError("caída simulada")
+
+    repo._apply_changes = apply_then_crash
+    with pytest.raises(RuntimeError):
+        repo.index_books([2])
+    repo._apply_changes = apply
+
+    # El libro vuelve a cambiar antes de reindexar: lo escrito a medias no debe quedar
+    header_path, body_path = _write_book(datalake, "02", 2, "banana grape")
+    DatalakeManifest.open(datalake).record(2, header_path, body_path)
+    repo.index_books([2])
+    assert repo.get_index_by_term("fig") == []
+    _assert_consistent(repo, {**BODIES, 2: "banana grape"})
+
+
+def test_pending_book_is_not_skipped_as_unchanged(repo):
+    repo.index_books(list(BODIES))
+    repo.forward.update_one({"book_id": 1}, {"$set": {"pending": ["apple"]}, "$unset": {"hash": ""}})
+    repo.col.update_one({"term": "banana"}, {"$pull": {"postings": 1}})
+    repo.chunks.delete_many({"term": "banana"})
+    repo.index_books([1])
+    assert 1 in repo.get_index_by_term("banana")
+
+
+def test_stats_from_an_older_version_are_rebuilt_by_ensure_stats(repo, datalake):
+    repo.index_books(list(BODIES))
+    # Contadores y df inflados como los dejaba la versión anterior, sin campo version
+    repo.col.update_many({}, {"$inc": {"df": 2}})
+    repo.stats.replace_one({"_id": "global"}, {"_id": "global", "terms": 99, "total_postings": 99})
+    repo.chunks.update_many({}, {"$unset": {"n": ""}})
+    reopened = type(repo)(
+        "", "db", str(datalake), stopwords_path=None, use_stemming=False,
+        postings_layout=repo.postings_layout, client=repo.col.database.client,
+    )
+    # Abrir no recorre el índice: solo lo detecta
+    assert reopened.stats_outdated
+    assert reopened.get_index_stats() == {"terms": 99, "total_postings": 99}
+    assert reopened.ensure_stats() is True
+    assert reopened.ensure_stats() is False
+    _assert_consistent(reopened, BODIES)
+
+
+def test_rebuild_stats_drops_terms_without_postings(repo):
+    repo.index_books(list(BODIES))
+    repo.col.insert_one({"term": "ghost", "df": 3, "postings": []})
+    assert repo.rebuild_stats() == {"terms": 5, "total_postings": 9}
+    assert repo.get_index_by_term("ghost") == []
+    _assert_consistent(repo, BODIES)
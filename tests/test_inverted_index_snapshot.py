@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from application.InvertedIndexReader import InvertedIndexReader
+from application.InvertedIndexRepository import InvertedIndexRepository
+from infrastructure.InvertedIndexSnapshotRepository import (
+    CURRENT_FILE,
+    TERM_PREFIX_BYTES,
+    InvertedIndexSnapshotRepository,
+    current_snapshot_dir,
+    write_snapshot,
+)
+
+LONG = "x" * TERM_PREFIX_BYTES
+
+INDEX = {
+    "a": [1],
+    "apple": [1, 2, 3],
+    "banana": [2],
+    LONG: [4],
+    LONG + "a": [5, 6],
+    LONG + "ab": [7],
+    LONG + "b": [1, 8],
+    "zürich": [9],
+    "été": [3, 9],
+}
+
+
+def _open(path):
+    pytest.importorskip("nltk")
+    return InvertedIndexSnapshotRepository(str(path), stopwords_path=None, use_stemming=False)
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    write_snapshot(tmp_path, sorted(INDEX.items()))
+    return _open(tmp_path)
+
+
+def test_lookups_with_long_and_non_ascii_terms(snapshot):
+    for term, ids in INDEX.items():
+        assert snapshot.postings_array(term).tolist() == ids, term
+    for missing in ["", "ap", "applex", "x", LONG[:-1], LONG + "c", LONG + "aa", "été2", "zz"]:
+        assert snapshot.postings_array(missing).tolist() == [], missing
+
+
+def test_terms_are_stored_with_a_clipped_width(snapshot):
+    assert snapshot.terms.dtype == np.dtype(f"S{TERM_PREFIX_BYTES}")
+    assert dict(snapshot.iter_postings()) == INDEX
+    assert [t for t, _ in snapshot.iter_postings()] == sorted(INDEX)
+    assert snapshot.top_terms(3) == [("apple", 3), (LONG + "a", 2), (LONG + "b", 2)]
+    assert snapshot.get_index_stats() == {"terms": len(INDEX), "total_postings": sum(map(len, INDEX.values()))}
+
+
+def test_short_vocabulary_uses_its_own_width(tmp_path):
+    write_snapshot(tmp_path, [("ab", [1]), ("abc", [2])])
+    snapshot = _open(tmp_path)
+    assert snapshot.terms.dtype == np.dtype("S3")
+    assert snapshot.postings_array("ab").tolist() == [1]
+    assert snapshot.postings_array("abc").tolist() == [2]
+    assert snapshot.postings_array("abcd").tolist() == []
+
+
+def test_reexport_switches_version_and_keeps_open_readers(tmp_path, snapshot):
+    first = snapshot.version_dir
+    write_snapshot(tmp_path, [("apple", [5])])
+    assert current_snapshot_dir(tmp_path) != first
+    assert snapshot.postings_array("apple").tolist() == [1, 2, 3]
+    assert _open(tmp_path).postings_array("apple").tolist() == [5]
+
+    write_snapshot(tmp_path, [("apple", [6])])
+    # Solo se conservan la versión vigente y la anterior
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_dir()) == ["v000002", "v000003"]
+    assert (tmp_path / CURRENT_FILE).read_text() == "v000003"
+
+
+def test_snapshot_only_implements_the_read_port(snapshot):
+    assert isinstance(snapshot, InvertedIndexReader)
+    assert not isinstance(snapshot, InvertedIndexRepository)
+    assert not hasattr(snapshot, "index_book") and not hasattr(snapshot, "reset_index")
+
+
+def test_missing_snapshot_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        _open(tmp_path / "nothing")
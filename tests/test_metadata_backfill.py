@@ -0,0 +1,18 @@
+from benchmark.synthetic_corpus import generate_corpus
+from control.metadata_backfill import backfill_metadata
+from infrastructure.MetadataSQLiteRepository import MetadataSQLiteRepository
+from utils.DatalakeManifest import DatalakeManifest
+
+
+def test_backfill_saves_headers_and_leaves_the_shared_manifest_open(tmp_path):
+    root = tmp_path / "datalake"
+    generate_corpus(root, 5)
+    repo = MetadataSQLiteRepository(str(tmp_path / "metadata.sqlite"))
+
+    stats = backfill_metadata(repo, root, workers=1, batch_size=2)
+    assert stats["saved"] == 5 and stats["failed"] == 0
+    assert {b.book_id for b in repo.get_metadata_many([1, 2, 3, 4, 5])} == {1, 2, 3, 4, 5}
+
+    manifest = DatalakeManifest.open(root)
+    assert manifest.latest_location(1, "body") is not None
+    assert backfill_metadata(repo, root, workers=1)["skipped"] == 5
@@ -0,0 +1,53 @@
+import pytest
+
+from domain.book import Book
+
+
+def _mongo_repo(tmp_path):
+    mongomock = pytest.importorskip("mongomock")
+    from infrastructure.MetadataMongoDBRepository import MetadataMongoDBRepository
+    return MetadataMongoDBRepository(mongomock.MongoClient())
+
+
+def _sqlite_repo(tmp_path):
+    from infrastructure.MetadataSQLiteRepository import MetadataSQLiteRepository
+    return MetadataSQLiteRepository(str(tmp_path / "metadata.sqlite"))
+
+
+@pytest.fixture(params=["sqlite", "mongomock"])
+def repo(request, tmp_path):
+    return {"sqlite": _sqlite_repo, "mongomock": _mongo_repo}[request.param](tmp_path)
+
+
+def _follow(page_fn, page_size):
+    seen, cursor = [], None
+    while True:
+        page = page_fn(cursor, page_size)
+        seen.extend(b.book_id for b in page.items)
+        if page.next_cursor is None:
+            return seen
+        cursor = page.next_cursor
+
+
+@pytest.mark.parametrize("page_size", [1, 3, 4, 20])
+def test_author_pages_cross_books_without_language(repo, page_size):
+    books = [Book(i, f"T{i}", "Ann", None if i % 2 else "English") for i in range(1, 11)]
+    books.append(Book(11, "Other", "Bob", "English"))
+    repo.save_metadata_many(books)
+    seen = _follow(lambda c, n: repo.find_by_author("Ann", cursor=c, page_size=n), page_size)
+    # language null ordena primero
+    assert seen == [1, 3, 5, 7, 9, 2, 4, 6, 8, 10]
+
+
+def test_author_pages_with_fixed_language(repo):
+    repo.save_metadata_many([Book(i, f"T{i}", "Ann", "French" if i % 3 else None) for i in range(1, 13)])
+    seen = _follow(lambda c, n: repo.find_by_author("Ann", language="French", cursor=c, page_size=n), 2)
+    assert seen == [i for i in range(1, 13) if i % 3]
+
+
+@pytest.mark.parametrize("page_size", [1, 2, 5])
+def test_title_prefix_pages_sort_by_title_then_id(repo, page_size):
+    titles = {1: "Alpha", 2: "Alps", 3: "Alpha", 4: None, 5: "Beta", 6: "Alp"}
+    repo.save_metadata_many([Book(i, t, "Ann", "English") for i, t in titles.items()])
+    seen = _follow(lambda c, n: repo.search_title_prefix("Alp", cursor=c, page_size=n), page_size)
+    assert seen == [6, 1, 3, 2]
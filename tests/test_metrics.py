@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+from utils.Metrics import Metrics
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def metrics():
+    m = Metrics(enabled=True, trace_memory=True)
+    yield m
+    m.disable()
+
+
+def _peak(metrics, name):
+    return next(t["mem_peak_bytes"] for t in metrics.snapshot()["timers"] if t["name"] == name)
+
+
+def test_nested_stage_keeps_parent_peak(metrics):
+    with metrics.timer("outer"):
+        block = bytearray(8 * MB)
+        del block
+        with metrics.timer("inner"):
+            pass
+    assert _peak(metrics, "outer") >= 8 * MB
+    assert _peak(metrics, "inner") < 8 * MB
+
+
+def test_stage_in_another_thread_keeps_peak_of_open_stage(metrics):
+    allocated, entered = threading.Event(), threading.Event()
+
+    def other():
+        allocated.wait()
+        with metrics.timer("other"):
+            pass
+        entered.set()
+
+    t = threading.Thread(target=other)
+    t.start()
+    with metrics.timer("main"):
+        block = bytearray(8 * MB)
+        del block
+        # El otro hilo reinicia el pico global mientras esta etapa sigue abierta
+        allocated.set()
+        entered.wait()
+    t.join()
+    assert _peak(metrics, "main") >= 8 * MB
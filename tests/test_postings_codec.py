@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from utils.PostingsCodec import PostingsCodec
+
+SPAN = PostingsCodec.CHUNK_SPAN
+
+
+@pytest.mark.parametrize("ids", [
+    [],
+    [0],
+    [0, 1, 2],
+    [127, 128, 16383, 16384, 2 ** 21, 2 ** 31 - 1],
+])
+def test_varint_deltas_round_trip(ids):
+    data = PostingsCodec.encode_varint_deltas(ids)
+    assert PostingsCodec.decode_varint_deltas(data) == ids
+
+
+def test_varint_deltas_with_base_and_start():
+    ids = [1000, 1001, 5000]
+    data = b"\xff" + PostingsCodec.encode_varint_deltas(ids, base=999)
+    assert PostingsCodec.decode_varint_deltas(data, base=999, start=1) == ids
+
+
+@pytest.mark.parametrize("doc_id, chunk", [
+    (0, 0), (SPAN - 1, 0), (SPAN, 1), (2 * SPAN - 1, 1), (70000, 70000 // SPAN),
+])
+def test_chunk_of_bucket_edges(doc_id, chunk):
+    assert PostingsCodec.chunk_of(doc_id) == chunk
+
+
+@pytest.mark.parametrize("chunk", [0, 1, 17])
+@pytest.mark.parametrize("offsets", [
+    [0],
+    [SPAN - 1],
+    [0, SPAN - 1],
+    [0, 1, 2, 3, 4095],
+])
+def test_sparse_chunk_round_trip_at_bucket_edges(chunk, offsets):
+    ids = [chunk * SPAN + o for o in offsets]
+    data = PostingsCodec.encode_chunk(chunk, ids)
+    assert data[0] == PostingsCodec._ARRAY
+    assert PostingsCodec.decode_chunk(chunk, data) == ids
+
+
+@pytest.mark.parametrize("chunk", [0, 3])
+def test_dense_chunk_uses_bitmap_and_round_trips(chunk):
+    base = chunk * SPAN
+    ids = [base + o for o in range(0, SPAN, 2)] + [base + SPAN - 1]
+    data = PostingsCodec.encode_chunk(chunk, ids)
+    assert data[0] == PostingsCodec._BITMAP
+    assert len(data) == 1 + SPAN // 8
+    assert PostingsCodec.decode_chunk(chunk, data) == ids
+
+
+def test_full_chunk_round_trip():
+    ids = list(range(2 * SPAN, 3 * SPAN))
+    assert PostingsCodec.decode_chunk(2, PostingsCodec.encode_chunk(2, ids)) == ids
+
+
+def test_container_switches_at_bitmap_size():
+    # Con deltas de 1 cada id ocupa un byte: el array deja de compensar en SPAN / 8 ids
+    below = list(range(SPAN // 8 - 1))
+    at = list(range(SPAN // 8))
+    assert PostingsCodec.encode_chunk(0, below)[0] == PostingsCodec._ARRAY
+    assert PostingsCodec.encode_chunk(0, at)[0] == PostingsCodec._BITMAP
+    assert PostingsCodec.decode_chunk(0, PostingsCodec.encode_chunk(0, at)) == at
+
+
+def test_empty_chunk_decodes_to_nothing():
+    assert PostingsCodec.decode_chunk(5, b"") == []
+    assert PostingsCodec.decode_chunk(5, PostingsCodec.encode_chunk(5, [])) == []
+
+
+def test_random_chunks_round_trip():
+    rng = random.Random(7)
+    for _ in range(200):
+        chunk = rng.randrange(0, 50)
+        k = rng.choice([1, 5, 50, 400, 600, 2000, SPAN])
+        ids = sorted(rng.sample(range(chunk * SPAN, (chunk + 1) * SPAN), k))
+        assert PostingsCodec.decode_chunk(chunk, PostingsCodec.encode_chunk(chunk, ids)) == ids
@@ -0,0 +1,56 @@
+import pytest
+
+from utils.QueryCache import MISS, QueryCache
+
+
+def test_put_with_stale_generation_is_rejected():
+    cache = QueryCache(10, None)
+    generation = cache.generation
+    cache.bump_generation()
+    assert cache.put("k", [1], generation) is False
+    assert cache.get("k") is MISS
+    assert cache.put("k", [1, 2], cache.generation) is True
+    assert cache.get("k") == [1, 2]
+
+
+def test_bump_generation_invalidates_entries():
+    cache = QueryCache(10, None)
+    cache.put("k", [1])
+    cache.bump_generation()
+    assert cache.get("k") is MISS
+
+
+def test_lru_and_ttl():
+    now = [0.0]
+    cache = QueryCache(2, 5.0, clock=lambda: now[0])
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.peek("b") is MISS and cache.get("a") == 1
+    now[0] = 10.0
+    assert cache.get("a") is MISS
+
+
+def test_mongo_read_racing_a_write_is_not_cached(tmp_path):
+    mongomock = pytest.importorskip("mongomock")
+    pytest.importorskip("nltk")
+    from infrastructure.InvertedIndexMongoDBRepository import InvertedIndexMongoDBRepository
+
+    repo = InvertedIndexMongoDBRepository(
+        "", "db", str(tmp_path), stopwords_path=None, use_stemming=False,
+        cache_size=10, client=mongomock.MongoClient(),
+    )
+    repo._apply_changes({"foo": [1]}, {})
+    read = repo._read_sorted_postings
+
+    def read_then_write(term):
+        # La escritura termina después de la lectura pero antes de que se rellene la caché
+        postings = read(term)
+        repo._apply_changes({"foo": [2]}, {})
+        return postings
+
+    repo._read_sorted_postings = read_then_write
+    assert repo.get_index_by_term("foo") == [1]
+    repo._read_sorted_postings = read
+    assert repo.get_index_by_term("foo") == [1, 2]
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import re
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Nodos del árbol: ("term", str) | ("and", [nodos]) | ("or", [nodos]) | ("not", nodo)
+Node = Tuple
+
+_RX_QUERY_TOKEN = re.compile(r"\(|\)|[^\s()]+")
+_OPERATORS = {"AND", "OR", "NOT"}
+
+
+class BooleanQuery:
+    """
+    Consultas booleanas sobre un índice invertido: AND, OR, NOT y paréntesis.
+
+    Precedencia NOT > AND > OR; dos términos seguidos sin operador se tratan
+    como AND. Los operadores deben escribirse en mayúsculas. Los términos se
+    normalizan con la misma pipeline que el índice; los que desaparecen
+    (stopwords, demasiado cortos) se ignoran.
+
+    La evaluación es independiente del backend: recibe una función que
+    devuelve la postings list ordenada de un término normalizado y otra que
+    devuelve su document frequency, para intersecar primero las listas más
+    cortas. Las operaciones de conjuntos se pueden sustituir (p. ej. por las
+    de NumPy) si fetch devuelve otro tipo de secuencia ordenada.
+    """
+
+    def __init__(self, expr: str, normalize: Callable[[str], Optional[str]]) -> None:
+        self._tokens = _RX_QUERY_TOKEN.findall(expr or "")
+        self._pos = 0
+        self._normalize = normalize
+        self.root: Optional[Node] = self._parse_or() if self._tokens else None
+        if self._pos != len(self._tokens):
+            raise ValueError(f"Consulta mal formada cerca de '{self._tokens[self._pos]}'")
+
+    def terms(self) -> List[str]:
+        out: Dict[str, None] = {}
+        self._collect_terms(self.root, out)
+        return list(out)
+
+    def evaluate(
+        self,
+        fetch: Callable[[str], List[int]],
+        document_frequencies: Callable[[List[str]], Dict[str, int]],
+        intersect: Optional[Callable[[List[int], List[int]], List[int]]] = None,
+        union: Optional[Callable[[Iterable[List[int]]], List[int]]] = None,
+        difference: Optional[Callable[[List[int], List[int]], List[int]]] = None,
+    ) -> List[int]:
+        if self.root is None:
+            return []
+        self._intersect = intersect or intersect_galloping
+        self._union = union or union_many
+        self._difference = difference or difference_sorted
+        df = document_frequencies(self.terms())
+        positive, negative = self._split_not(self.root)
+        if not positive and negative:
+            raise ValueError("Una consulta no puede contener solo términos negados (NOT).")
+        return self._eval(self.root, fetch, df)
+
+    # --- parser ---------------------------------------------------------
+
+    def _peek(self) -> Optional[str]:
+        return self._tokens[self._pos] if self._pos < len(self._tokens) else None
+
+    def _parse_or(self) -> Optional[Node]:
+        children = [self._parse_and()]
+        while self._peek() == "OR":
+            self._pos += 1
+            children.append(self._parse_and())
+        return self._combine("or", children)
+
+    def _parse_and(self) -> Optional[Node]:
+        children = [self._parse_not()]
+        while True:
+            tok = self._peek()
+            if tok == "AND":
+                self._pos += 1
+            elif tok is None or tok in (")", "OR"):
+                break
+            children.append(self._parse_not())
+        return self._combine("and", children)
+
+    def _parse_not(self) -> Optional[Node]:
+        if self._peek() == "NOT":
+            self._pos += 1
+            child = self._parse_not()
+            return ("not", child) if child is not None else None
+        return self._parse_atom()
+
+    def _parse_atom(self) -> Optional[Node]:
+        tok = self._peek()
+        if tok is None or tok in _OPERATORS or tok == ")":
+            raise ValueError(f"Se esperaba un término en la consulta, se encontró '{tok}'")
+        self._pos += 1
+        if tok == "(":
+            node = self._parse_or()
+            if self._peek() != ")":
+                raise ValueError("Falta un paréntesis de cierre en la consulta.")
+            self._pos += 1
+            return node
+        term = self._normalize(tok)
+        return ("term", term) if term else None
+
+    @staticmethod
+    def _combine(op: str, children: List[Optional[Node]]) -> Optional[Node]:
+        kept = [c for c in children if c is not None]
+        if not kept:
+            return None
+        return kept[0] if len(kept) == 1 else (op, kept)
+
+    def _collect_terms(self, node: Optional[Node], out: Dict[str, None]) -> None:
+        if node is None:
+            return
+        if node[0] == "term":
+            out[node[1]] = None
+        elif node[0] == "not":
+            self._collect_terms(node[1], out)
+        else:
+            for child in node[1]:
+                self._collect_terms(child, out)
+
+    # --- evaluación -----------------------------------------------------
+
+    @staticmethod
+    def _split_not(node: Node) -> Tuple[List[Node], List[Node]]:
+        children = node[1] if node[0] == "and" else [node]
+        positive = [c for c in children if c[0] != "not"]
+        negative = [c[1] for c in children if c[0] == "not"]
+        return positive, negative
+
+    def _estimate(self, node: Node, df: Dict[str, int]) -> int:
+        kind = node[0]
+        if kind == "term":
+            return df.get(node[1], 0)
+        if kind == "or":
+            return sum(self._estimate(c, df) for c in node[1])
+        if kind == "and":
+            positive, _ = self._split_not(node)
+            return min((self._estimate(c, df) for c in positive), default=0)
+        return 0
+
+    def _eval(self, node: Node, fetch: Callable[[str], List[int]], df: Dict[str, int]) -> List[int]:
+        kind = node[0]
+        if kind == "term":
+            return fetch(node[1]) if df.get(node[1], 0) else []
+        if kind == "or":
+            return self._union(self._eval(c, fetch, df) for c in node[1])
+        if kind == "not":
+            raise ValueError("NOT solo puede usarse junto a términos positivos (a AND NOT b).")
+
+        positive, negative = self._split_not(node)
+        if not positive:
+            raise ValueError("NOT solo puede usarse junto a términos positivos (a AND NOT b).")
+        result: Optional[List[int]] = None
+        for child in sorted(positive, key=lambda c: self._estimate(c, df)):
+            postings = self._eval(child, fetch, df)
+            result = postings if result is None else self._intersect(result, postings)
+            if len(result) == 0:
+                return []
+        for child in negative:
+            excluded = self._eval(child, fetch, df)
+            if len(excluded):
+                result = self._difference(result, excluded)
+                if len(result) == 0:
+                    return []
+        return result
+
+
+def intersect_galloping(a: List[int], b: List[int]) -> List[int]:
+    """Intersección de listas ordenadas; recorre la corta y galopa sobre la larga."""
+    if len(a) > len(b):
+        a, b = b, a
+    out: List[int] = []
+    lo, n = 0, len(b)
+    for x in a:
+        step, hi = 1, lo
+        while hi < n and b[hi] < x:
+            lo = hi
+            hi += step
+            step <<= 1
+        lo = bisect_left(b, x, lo, min(hi + 1, n))
+        if lo >= n:
+            break
+        if b[lo] == x:
+            out.append(x)
+            lo += 1
+    return out
+
+
+def difference_sorted(a: List[int], b: List[int]) -> List[int]:
+    excluded = set(b)
+    return [x for x in a if x not in excluded]
+
+
+def union_many(lists: Iterable[List[int]]) -> List[int]:
+    merged = set()
+    for postings in lists:
+        merged.update(postings)
+    return sorted(merged)
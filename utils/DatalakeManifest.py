@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.DatalakePack import PACK_NAME, iter_index, location_exists, make_locator, read_location
+
+
+class DatalakeManifest:
+    """
+    Manifiesto persistente (SQLite) del datalake: book_id -> ruta más reciente
+    de su cabecera y de su cuerpo dentro de datalake/YYYYMMDD/HH/.
+
+    Evita recorrer todo el árbol con rglob en cada búsqueda. Se mantiene desde
+    create_datalake y puede reconstruirse a partir de un escaneo con rebuild().
+    Las rutas se guardan relativas a la raíz del datalake. Un libro
+    empaquetado (utils/DatalakePack) se guarda como "<pack>#<offset>:<longitud>";
+    latest_location()/read_text() sirven para ambos formatos.
+    """
+
+    FILE_NAME = "manifest.sqlite"
+    KINDS = ("header", "body")
+
+    _instances: Dict[Path, "DatalakeManifest"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, datalake_root: str | Path) -> None:
+        self.root = Path(datalake_root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.path = self.root / self.FILE_NAME
+        is_new = not self.path.exists()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " book_id INTEGER NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " path TEXT NOT NULL,"
+            " version TEXT NOT NULL,"
+            " PRIMARY KEY (book_id, kind)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.commit()
+        if is_new:
+            self.rebuild()
+
+    @classmethod
+    def open(cls, datalake_root: str | Path) -> "DatalakeManifest":
+        key = Path(datalake_root).resolve()
+        with cls._instances_lock:
+            manifest = cls._instances.get(key)
+            if manifest is None:
+                manifest = cls(key)
+                cls._instances[key] = manifest
+            return manifest
+
+    def record(self, book_id: int, header_path: str | Path, body_path: str | Path) -> None:
+        self._upsert([
+            self._row(int(book_id), "header", Path(header_path)),
+            self._row(int(book_id), "body", Path(body_path)),
+        ])
+
+    def record_many(self, entries: Iterable[Tuple[int, str | Path, str | Path]]) -> None:
+        """Registra (book_id, cabecera, cuerpo) en una sola transacción."""
+        rows = []
+        for book_id, header_path, body_path in entries:
+            rows.append(self._row(int(book_id), "header", Path(header_path)))
+            rows.append(self._row(int(book_id), "body", Path(body_path)))
+        self._upsert(rows)
+
+    def record_packed(self, entries: Iterable[Tuple[int, str, str | Path, int, int]]) -> None:
+        """Registra (book_id, tipo, ruta del pack, offset, longitud) de registros empaquetados."""
+        self._upsert([self._packed_row(int(bid), kind, Path(pack), off, n) for bid, kind, pack, off, n in entries])
+
+    def latest_location(self, book_id: int, kind: str) -> Optional[str]:
+        """Ruta del fichero suelto o localizador del registro empaquetado; None si no existe."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path FROM files WHERE book_id = ? AND kind = ?", (int(book_id), kind)
+            ).fetchone()
+        if not row:
+            return None
+        location = str(self.root / row[0])
+        return location if location_exists(location) else None
+
+    def read_text(self, book_id: int, kind: str) -> Optional[str]:
+        location = self.latest_location(book_id, kind)
+        return read_location(location) if location else None
+
+    def lookup(self, book_id: int) -> Dict[str, Optional[str]]:
+        matches: Dict[str, Optional[str]] = {kind: None for kind in self.KINDS}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, path FROM files WHERE book_id = ?", (int(book_id),)
+            ).fetchall()
+        for kind, rel in rows:
+            matches[kind] = str(self.root / rel)
+        return matches
+
+    def latest_path(self, book_id: int, kind: str) -> Optional[Path]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path FROM files WHERE book_id = ? AND kind = ?", (int(book_id), kind)
+            ).fetchone()
+        return self.root / row[0] if row else None
+
+    def book_ids(self, kind: str = "body") -> List[int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT book_id FROM files WHERE kind = ? ORDER BY book_id", (kind,)
+            ).fetchall()
+        return [int(r[0]) for r in rows]
+
+    def locations(self, kind: str = "header") -> List[Tuple[int, str]]:
+        """(book_id, ruta o localizador) de la última versión de cada libro, ordenado por book_id."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT book_id, path FROM files WHERE kind = ? ORDER BY book_id", (kind,)
+            ).fetchall()
+        return [(int(bid), str(self.root / rel)) for bid, rel in rows]
+
+    def rebuild(self) -> int:
+        rows = []
+        for p in self.root.rglob("*.txt"):
+            name = p.name.split(".")
+            if len(name) != 3 or name[1] not in self.KINDS:
+                continue
+            try:
+                rows.append(self._row(int(name[0]), name[1], p))
+            except ValueError:
+                continue
+        # Después de los sueltos: con la misma versión, el registro empaquetado prevalece
+        for pack in sorted(self.root.rglob(PACK_NAME)):
+            rows.extend(self._packed_row(bid, kind, pack, off, n) for bid, kind, off, n in iter_index(pack))
+        with self._lock:
+            self._conn.execute("DELETE FROM files")
+            self._conn.commit()
+        self._upsert(rows)
+        return len({r[0] for r in rows})
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _row(self, book_id: int, kind: str, path: Path) -> Tuple[int, str, str, str]:
+        rel = Path(path).resolve().relative_to(self.root)
+        parts = rel.parts
+        # Misma prioridad que _pick_latest: (fecha, hora, nombre)
+        version = "/".join(parts[-3:]) if len(parts) >= 3 else "/".join(parts)
+        return book_id, kind, rel.as_posix(), version
+
+    def _packed_row(self, book_id: int, kind: str, pack: Path, offset: int, length: int) -> Tuple[int, str, str, str]:
+        rel = pack.resolve().relative_to(self.root)
+        # Misma versión que tendría el fichero suelto de esa hora
+        version = "/".join(rel.parts[-3:-1] + (f"{book_id}.{kind}.txt",))
+        return book_id, kind, make_locator(rel, offset, length), version
+
+    def _upsert(self, rows: Iterable[Tuple[int, str, str, str]]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO files (book_id, kind, path, version) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(book_id, kind) DO UPDATE SET path = excluded.path, version = excluded.version "
+                "WHERE excluded.version >= files.version",
+                rows,
+            )
+            self._conn.commit()
+
+
+if __name__ == "__main__":
+    import sys
+    from utils.DatalakeDetector import detect_datalake_root
+
+    root = sys.argv[1] if len(sys.argv) > 1 else detect_datalake_root()
+    n = DatalakeManifest.open(root).rebuild()
+    print(f"[MANIFEST] {n} libros registrados en {Path(root).resolve() / DatalakeManifest.FILE_NAME}")
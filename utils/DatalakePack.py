@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstd es opcional; sin él se usa zlib
+    zstandard = None
+
+PACK_NAME = "books.pack"
+INDEX_SUFFIX = ".idx"
+# Localizador de un registro empaquetado: "<ruta del pack>#<offset>:<longitud>"
+LOCATOR_SEP = "#"
+
+CODEC_NONE, CODEC_ZLIB, CODEC_ZSTD = 0, 1, 2
+CODECS = {"none": CODEC_NONE, "zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+KIND_CODES = {"header": 0, "body": 1}
+KIND_NAMES = {v: k for k, v in KIND_CODES.items()}
+
+_MAGIC = b"DLPR"
+# magic, book_id, tipo, códec, longitud sin comprimir, longitud del payload, crc32 del texto
+_RECORD = struct.Struct("<4sQBBIII")
+# book_id, tipo, offset del registro, longitud total del registro
+_INDEX_ENTRY = struct.Struct("<QBQI")
+
+_pack_locks: Dict[Path, threading.Lock] = {}
+_pack_locks_guard = threading.Lock()
+
+
+def codec_id(name: str) -> int:
+    if name not in CODECS:
+        raise ValueError(f"Códec desconocido: {name}")
+    if CODECS[name] == CODEC_ZSTD and zstandard is None:
+        print("[DATALAKE][WARN] zstandard no está instalado, se usa zlib.")
+        return CODEC_ZLIB
+    return CODECS[name]
+
+
+def append_books(pack_path: str | Path, records: List[Tuple[int, str, str]],
+                 codec: str = "zlib") -> List[Tuple[int, str, int, int]]:
+    """
+    Añade (book_id, tipo, texto) al final del pack y de su índice de offsets.
+    Devuelve (book_id, tipo, offset, longitud) de cada registro escrito.
+    """
+    pack_path = Path(pack_path)
+    pack_path.parent.mkdir(parents=True, exist_ok=True)
+    cid = codec_id(codec)
+    blobs = [(bid, kind, _encode_record(bid, kind, text, cid)) for bid, kind, text in records]
+    written = []
+    with _lock_for(pack_path):
+        with open(pack_path, "ab") as pack, open(f"{pack_path}{INDEX_SUFFIX}", "ab") as idx:
+            offset = pack.seek(0, os.SEEK_END)
+            for bid, kind, blob in blobs:
+                pack.write(blob)
+                written.append((bid, kind, offset, len(blob)))
+                offset += len(blob)
+            # El pack se vuelca antes que el índice, que se escribe al final
+            pack.flush()
+            idx.write(b"".join(_INDEX_ENTRY.pack(bid, KIND_CODES[kind], off, n) for bid, kind, off, n in written))
+    return written
+
+
+class RecordWriter:
+    """
+    Registro de un libro que se comprime a medida que llega el texto: el
+    payload comprimido se acumula en un fichero temporal, así que la memoria
+    no depende del tamaño del libro. append_records lo copia después al pack.
+    """
+
+    def __init__(self, book_id: int, kind: str, codec: str = "zlib") -> None:
+        self.book_id = int(book_id)
+        self.kind = kind
+        self.cid = codec_id(codec)
+        self.raw_len = 0
+        self.crc = 0
+        self._spool = tempfile.TemporaryFile()
+        if self.cid == CODEC_ZLIB:
+            self._compressor = zlib.compressobj(6)
+        elif self.cid == CODEC_ZSTD:
+            self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        else:
+            self._compressor = None
+        self._finished = False
+
+    def write(self, text: str) -> None:
+        raw = text.encode("utf-8")
+        self.raw_len += len(raw)
+        self.crc = zlib.crc32(raw, self.crc)
+        self._spool.write(self._compressor.compress(raw) if self._compressor else raw)
+
+    def finish(self) -> int:
+        """Cierra el compresor y devuelve la longitud del payload."""
+        if not self._finished:
+            if self._compressor is not None:
+                self._spool.write(self._compressor.flush())
+            self._finished = True
+        return self._spool.tell()
+
+    def copy_to(self, f) -> int:
+        """Escribe cabecera y payload en f; devuelve la longitud total del registro."""
+        payload_len = self.finish()
+        f.write(_RECORD.pack(_MAGIC, self.book_id, KIND_CODES[self.kind], self.cid,
+                             self.raw_len, payload_len, self.crc))
+        self._spool.seek(0)
+        shutil.copyfileobj(self._spool, f)
+        return _RECORD.size + payload_len
+
+    def close(self) -> None:
+        self._spool.close()
+
+    def __enter__(self) -> "RecordWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def append_records(pack_path: str | Path, writers: Sequence[RecordWriter]) -> List[Tuple[int, str, int, int]]:
+    """Como append_books, pero con registros ya comprimidos por RecordWriter."""
+    pack_path = Path(pack_path)
+    pack_path.parent.mkdir(parents=True, exist_ok=True)
+    for w in writers:
+        w.finish()
+    written = []
+    with _lock_for(pack_path):
+        with open(pack_path, "ab") as pack, open(f"{pack_path}{INDEX_SUFFIX}", "ab") as idx:
+            offset = pack.seek(0, os.SEEK_END)
+            for w in writers:
+                n = w.copy_to(pack)
+                written.append((w.book_id, w.kind, offset, n))
+                offset += n
+            pack.flush()
+            idx.write(b"".join(_INDEX_ENTRY.pack(bid, KIND_CODES[kind], off, n) for bid, kind, off, n in written))
+    return written
+
+
+def read_record(pack_path: str | Path, offset: int, length: int) -> str:
+    with open(pack_path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    magic, _, _, cid, raw_len, payload_len, crc = _RECORD.unpack_from(data, 0)
+    if magic != _MAGIC or _RECORD.size + payload_len != len(data):
+        raise ValueError(f"Registro no válido en {pack_path}@{offset}")
+    raw = _decompress(cid, data[_RECORD.size:], raw_len)
+    if zlib.crc32(raw) != crc:
+        raise ValueError(f"CRC incorrecto en {pack_path}@{offset}")
+    return raw.decode("utf-8", errors="ignore")
+
+
+def iter_index(pack_path: str | Path) -> Iterator[Tuple[int, str, int, int]]:
+    """(book_id, tipo, offset, longitud) en orden de escritura; recorre el pack si falta el índice."""
+    idx_path = Path(f"{pack_path}{INDEX_SUFFIX}")
+    if idx_path.exists():
+        # Se ignoran una entrada final cortada y las que apuntan más allá del final del pack
+        size = Path(pack_path).stat().st_size
+        data = idx_path.read_bytes()
+        usable = len(data) - len(data) % _INDEX_ENTRY.size
+        for bid, kind, off, n in _INDEX_ENTRY.iter_unpack(data[:usable]):
+            if off + n <= size:
+                yield bid, KIND_NAMES[kind], off, n
+        return
+    with open(pack_path, "rb") as f:
+        offset = 0
+        while True:
+            head = f.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                return
+            magic, bid, kind, _, _, payload_len, _ = _RECORD.unpack(head)
+            if magic != _MAGIC:
+                return
+            f.seek(payload_len, os.SEEK_CUR)
+            yield bid, KIND_NAMES[kind], offset, _RECORD.size + payload_len
+            offset += _RECORD.size + payload_len
+
+
+def make_locator(pack_path: str | Path, offset: int, length: int) -> str:
+    return f"{Path(pack_path).as_posix()}{LOCATOR_SEP}{offset}:{length}"
+
+
+def parse_locator(location: str) -> Optional[Tuple[str, int, int]]:
+    """(ruta del pack, offset, longitud) o None si location es la ruta de un fichero suelto."""
+    path, sep, span = location.rpartition(LOCATOR_SEP)
+    if not sep or not path.endswith(PACK_NAME):
+        return None
+    offset, _, length = span.partition(":")
+    if not offset.isdigit() or not length.isdigit():
+        return None
+    return path, int(offset), int(length)
+
+
+def read_location(location: str) -> str:
+    """Lee el texto de un libro, esté en un fichero suelto o empaquetado."""
+    packed = parse_locator(location)
+    if packed is not None:
+        return read_record(*packed)
+    return Path(location).read_text(encoding="utf-8", errors="ignore")
+
+
+def location_exists(location: str) -> bool:
+    packed = parse_locator(location)
+    return Path(packed[0] if packed else location).exists()
+
+
+def _encode_record(book_id: int, kind: str, text: str, cid: int) -> bytes:
+    raw = text.encode("utf-8")
+    if cid == CODEC_ZLIB:
+        payload = zlib.compress(raw, 6)
+    elif cid == CODEC_ZSTD:
+        payload = zstandard.ZstdCompressor(level=3).compress(raw)
+    else:
+        payload = raw
+    return _RECORD.pack(_MAGIC, int(book_id), KIND_CODES[kind], cid, len(raw), len(payload), zlib.crc32(raw)) + payload
+
+
+def _decompress(cid: int, payload: bytes, raw_len: int) -> bytes:
+    if cid == CODEC_ZLIB:
+        return zlib.decompress(payload)
+    if cid == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Este pack usa zstd: instala el paquete zstandard para leerlo.")
+        return zstandard.ZstdDecompressor().decompress(payload, max_output_size=raw_len)
+    return payload
+
+
+def _lock_for(pack_path: Path) -> threading.Lock:
+    key = pack_path.resolve()
+    with _pack_locks_guard:
+        lock = _pack_locks.get(key)
+        if lock is None:
+            lock = _pack_locks[key] = threading.Lock()
+        return lock
+
+
+def pack_loose_files(datalake_root: str | Path, codec: str = "zlib", keep_loose: bool = False,
+                     batch_size: int = 256) -> int:
+    """
+    Migra un datalake de ficheros sueltos: empaqueta los *.header.txt/*.body.txt
+    de cada directorio de hora en su books.pack y los registra en el manifiesto.
+    Devuelve el número de registros empaquetados.
+    """
+    from utils.DatalakeManifest import DatalakeManifest
+
+    manifest = DatalakeManifest.open(datalake_root)
+    hour_dirs = sorted({p.parent for p in manifest.root.rglob("*.txt")})
+    packed = 0
+    for hour_dir in hour_dirs:
+        pack = hour_dir / PACK_NAME
+        already = {(bid, kind) for bid, kind, _, _ in iter_index(pack)} if pack.exists() else set()
+        loose = []
+        for p in sorted(hour_dir.glob("*.txt")):
+            name = p.name.split(".")
+            if len(name) == 3 and name[1] in KIND_CODES and name[0].isdigit():
+                loose.append((int(name[0]), name[1], p))
+        for i in range(0, len(loose), batch_size):
+            batch = [item for item in loose[i:i + batch_size] if item[:2] not in already]
+            records = [(bid, kind, p.read_text(encoding="utf-8", errors="ignore")) for bid, kind, p in batch]
+            written = append_books(pack, records, codec) if records else []
+            manifest.record_packed((bid, kind, pack, off, n) for bid, kind, off, n in written)
+            packed += len(written)
+            if not keep_loose:
+                for _, _, p in loose[i:i + batch_size]:
+                    p.unlink()
+        print(f"[DATALAKE] {hour_dir}: {len(loose)} ficheros -> {pack.name}")
+    return packed
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Empaqueta un datalake de ficheros sueltos en books.pack por hora.")
+    parser.add_argument("datalake_root")
+    parser.add_argument("--codec", choices=sorted(CODECS), default="zlib")
+    parser.add_argument("--keep-loose", action="store_true", help="No borra los ficheros sueltos tras empaquetarlos")
+    args = parser.parse_args()
+    n = pack_loose_files(args.datalake_root, args.codec, args.keep_loose)
+    print(f"[DATALAKE] {n} registros empaquetados")
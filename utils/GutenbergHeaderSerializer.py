@@ -1,26 +1,40 @@
 from __future__ import annotations
 from pathlib import Path
 import re
-from typing import Optional
+from typing import Any, Dict, Optional
 
 from domain.book import Book
 
 
 class GutenbergHeaderSerializer:
     """
-    Extrae metadatos básicos (book_id, title, author, language) de un texto
-    de cabecera de Project Gutenberg.
+    Extrae metadatos (book_id, title, author, language, release_date,
+    credits) de un texto de cabecera de Project Gutenberg, con una sola
+    pasada para todos los campos.
 
     Admite patrones como:
       - 'Release date: ... [eBook #8388]'
       - 'Release Date: ... [EBook #12345]'
       - 'Project Gutenberg eBook of ... [EBook #12345]' (fallback)
+
+    Los valores que continúan en líneas sangradas (títulos o créditos largos)
+    se unen con un espacio. Sin línea 'Credits:', se usa 'Produced by ...'.
     """
 
-    # Campos típicos en líneas separadas
-    _RX_TITLE = re.compile(r"^Title:\s*(.+)$", re.IGNORECASE)
-    _RX_AUTHOR = re.compile(r"^Author:\s*(.+)$", re.IGNORECASE)
-    _RX_LANGUAGE = re.compile(r"^Language:\s*(.+)$", re.IGNORECASE)
+    # Campos típicos en líneas separadas ("Clave: valor" o "Produced by ..."), con sus
+    # líneas de continuación sangradas; una sola expresión recorre toda la cabecera
+    _RX_FIELD = re.compile(
+        r"^[ \t]*(?:(title|author|language|release date|credits)[ \t]*:|(produced[ \t]+by)\b:?)"
+        r"[ \t]*(.*(?:\n[ \t]+\S.*)*)",
+        re.IGNORECASE | re.MULTILINE,
+    )
+    _FIELDS = {
+        "title": "title",
+        "author": "author",
+        "language": "language",
+        "release date": "release_date",
+        "credits": "credits",
+    }
 
     # book_id en corchetes del tipo [eBook #8388] (robusto a mayúsculas/minúsculas y a 'e-book')
     _RX_EBOOK_ID = re.compile(
@@ -34,13 +48,29 @@ class GutenbergHeaderSerializer:
         re.IGNORECASE | re.DOTALL,
     )
 
-    @staticmethod
-    def _extract_first_line_value(text: str, rx: re.Pattern) -> Optional[str]:
-        for line in text.splitlines():
-            m = rx.match(line.strip())
-            if m:
-                return m.group(1).strip() or None
-        return None
+    @classmethod
+    def parse_fields(cls, text: str) -> Dict[str, Any]:
+        fields: Dict[str, Any] = {}
+        produced_by = None
+        for key, produced, value in cls._RX_FIELD.findall(text):
+            field = cls._FIELDS[key.lower()] if key else None
+            if field == "release_date":
+                # "April 1, 1998 [eBook #1342]" + "Most recently updated: ..." -> "April 1, 1998"
+                value = value.split("\n", 1)[0].split("[", 1)[0]
+            if "\n" in value:
+                value = " ".join(filter(None, (part.strip() for part in value.split("\n"))))
+            else:
+                value = value.strip()
+            if produced:
+                produced_by = produced_by or value or None
+                continue
+            # Si el campo se repite, gana la primera aparición
+            if not fields.get(field):
+                fields[field] = value or None
+        if not fields.get("credits"):
+            fields["credits"] = produced_by
+        fields["book_id"] = cls._extract_book_id(text)
+        return fields
 
     @classmethod
     def _extract_book_id(cls, text: str) -> Optional[int]:
@@ -56,19 +86,18 @@ class GutenbergHeaderSerializer:
 
     @classmethod
     def from_text(cls, text: str) -> Book:
-        title = cls._extract_first_line_value(text, cls._RX_TITLE)
-        author = cls._extract_first_line_value(text, cls._RX_AUTHOR)
-        language = cls._extract_first_line_value(text, cls._RX_LANGUAGE)
-        book_id = cls._extract_book_id(text)
+        fields = cls.parse_fields(text)
         return Book(
-            book_id=book_id,
-            title=title,
-            author=author,
-            language=language,
+            book_id=fields["book_id"],
+            title=fields.get("title"),
+            author=fields.get("author"),
+            language=fields.get("language"),
+            release_date=fields.get("release_date"),
+            credits=fields.get("credits"),
         )
 
     @classmethod
     def from_file(cls, path: str | Path) -> Book:
         p = Path(path)
         text = p.read_text(encoding="utf-8", errors="ignore")
-        return cls.from_text(text)
\ No newline at end of file
+        return cls.from_text(text)
@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Límites superiores (segundos) de los buckets del histograma exportado a Prometheus
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+_LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("metrics", "key", "t0", "mem_start", "mem_peak")
+
+    def __init__(self, metrics: "Metrics", key: _LabelKey) -> None:
+        self.metrics = metrics
+        self.key = key
+
+    def __enter__(self) -> "_Timer":
+        if self.metrics.trace_memory:
+            self.metrics._memory_enter(self)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        elapsed = time.perf_counter() - self.t0
+        peak = self.metrics._memory_exit(self) if self.metrics.trace_memory else None
+        self.metrics._observe(self.key, elapsed, peak)
+
+
+class _Histogram:
+    __slots__ = ("count", "total", "max", "buckets", "mem_peak")
+
+    def __init__(self, n_buckets: int) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * n_buckets
+        self.mem_peak = 0
+
+
+class Metrics:
+    """
+    Temporizadores y contadores por etapa (lectura del cuerpo, tokenización,
+    escrituras en la base de datos, descargas...).
+
+    Desactivado, timer() devuelve un contexto vacío compartido y inc() retorna
+    al comprobar `enabled`, así que instrumentar el código apenas cuesta. Con
+    trace_memory se arranca tracemalloc y cada temporizador registra además
+    el pico de memoria Python asignada durante su etapa (que es caro: solo
+    para diagnóstico). tracemalloc mide todo el proceso, así que con varios
+    hilos el pico de una etapa incluye lo que asignan los demás mientras
+    está abierta. Exporta en formato de texto de Prometheus o como líneas
+    JSON.
+
+    Cada proceso tiene su propio registro: con parallel_workers > 0 la
+    tokenización ocurre en los workers y no aparece aquí.
+    """
+
+    def __init__(self, enabled: bool = False, trace_memory: bool = False, prefix: str = "bigdata",
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.enabled = False
+        self.trace_memory = False
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # Etapas abiertas de todos los hilos, porque el pico de tracemalloc es del proceso
+        self._open: List[_Timer] = []
+        self._histograms: Dict[_LabelKey, _Histogram] = {}
+        self._counters: Dict[_LabelKey, float] = {}
+        if enabled:
+            self.enable(trace_memory)
+
+    @classmethod
+    def from_env(cls) -> "Metrics":
+        # METRICS=1 activa la instrumentación; METRICS_TRACE_MEMORY=1 añade tracemalloc
+        return cls(enabled=os.environ.get("METRICS", "") == "1",
+                   trace_memory=os.environ.get("METRICS_TRACE_MEMORY", "") == "1")
+
+    def enable(self, trace_memory: bool = False) -> None:
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.trace_memory = trace_memory
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+        if self.trace_memory:
+            self.trace_memory = False
+            tracemalloc.stop()
+
+    def timer(self, name: str, **labels: str):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, _key(name, labels))
+
+    def timed(self, name: str, **labels: str) -> Callable:
+        """Decorador equivalente a envolver la función en timer(name)."""
+        def decorator(fn: Callable) -> Callable:
+            key = _key(name, labels)
+
+            @wraps(fn)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with _Timer(self, key):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            timers = [
+                {"name": name, "labels": dict(labels), "count": h.count, "sum_s": h.total, "max_s": h.max,
+                 **({"mem_peak_bytes": h.mem_peak} if self.trace_memory else {})}
+                for (name, labels), h in sorted(self._histograms.items())
+            ]
+            counters = [
+                {"name": name, "labels": dict(labels), "value": v}
+                for (name, labels), v in sorted(self._counters.items())
+            ]
+        return {"ts": time.time(), "timers": timers, "counters": counters}
+
+    def to_prometheus(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            seen = set()
+            for (name, labels), h in sorted(self._histograms.items()):
+                metric = f"{self.prefix}_{_sanitize(name)}_seconds"
+                if metric not in seen:
+                    seen.add(metric)
+                    lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, n in zip(self.buckets, h.buckets):
+                    cumulative += n
+                    lines.append(f"{metric}_bucket{_labels(labels, le=_fmt(bound))} {cumulative}")
+                lines.append(f"{metric}_bucket{_labels(labels, le='+Inf')} {h.count}")
+                lines.append(f"{metric}_sum{_labels(labels)} {h.total!r}")
+                lines.append(f"{metric}_count{_labels(labels)} {h.count}")
+            if self.trace_memory:
+                for (name, labels), h in sorted(self._histograms.items()):
+                    metric = f"{self.prefix}_{_sanitize(name)}_memory_peak_bytes"
+                    if metric not in seen:
+                        seen.add(metric)
+                        lines.append(f"# TYPE {metric} gauge")
+                    lines.append(f"{metric}{_labels(labels)} {h.mem_peak}")
+            for (name, labels), value in sorted(self._counters.items()):
+                metric = f"{self.prefix}_{_sanitize(name)}_total"
+                if metric not in seen:
+                    seen.add(metric)
+                    lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric}{_labels(labels)} {value!r}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str | Path) -> None:
+        # Reemplazo atómico, apto para el textfile collector de node_exporter
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(self.to_prometheus(), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def append_jsonl(self, path: str | Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.snapshot()) + "\n")
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def _observe(self, key: _LabelKey, elapsed: float, mem_peak: Optional[int]) -> None:
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = _Histogram(len(self.buckets))
+            h.count += 1
+            h.total += elapsed
+            if elapsed > h.max:
+                h.max = elapsed
+            for i, bound in enumerate(self.buckets):
+                if elapsed <= bound:
+                    h.buckets[i] += 1
+                    break
+            if mem_peak is not None and mem_peak > h.mem_peak:
+                h.mem_peak = mem_peak
+
+    def _memory_enter(self, timer: _Timer) -> None:
+        # reset_peak es global: antes de reiniciarlo se pasa el pico actual a las etapas abiertas
+        with self._lock:
+            current, peak = tracemalloc.get_traced_memory()
+            for open_timer in self._open:
+                open_timer.mem_peak = max(open_timer.mem_peak, peak)
+            tracemalloc.reset_peak()
+            timer.mem_start = current
+            timer.mem_peak = current
+            self._open.append(timer)
+
+    def _memory_exit(self, timer: _Timer) -> int:
+        with self._lock:
+            peak = max(timer.mem_peak, tracemalloc.get_traced_memory()[1])
+            self._open = [t for t in self._open if t is not timer]
+            for open_timer in self._open:
+                open_timer.mem_peak = max(open_timer.mem_peak, peak)
+        return max(0, peak - timer.mem_start)
+
+
+def _key(name: str, labels: Dict[str, str]) -> _LabelKey:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _sanitize(name: str) -> str:
+    return "".join(ch if ch.isalnum() or ch == "_" else "_" for ch in name)
+
+
+def _fmt(bound: float) -> str:
+    return repr(float(bound))
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...], **extra: str) -> str:
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    body = ",".join(f'{_sanitize(k)}="{_escape(v)}"' for k, v in items)
+    return "{" + body + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# Registro global del proceso, configurado con las variables de entorno METRICS y METRICS_TRACE_MEMORY
+METRICS = Metrics.from_env()
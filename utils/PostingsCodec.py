@@ -0,0 +1,83 @@
+from __future__ import annotations
+from typing import Iterable, List
+
+
+class PostingsCodec:
+    """
+    Codifica listas de doc IDs por buckets de rango fijo (CHUNK_SPAN ids por bucket).
+
+    Cada bucket se guarda como un byte de tipo seguido de:
+      - ARRAY:  deltas respecto a la base del bucket codificados en varint.
+      - BITMAP: un bit por doc ID del rango (CHUNK_SPAN / 8 bytes).
+    Se elige el contenedor más pequeño, como en los bitmaps Roaring.
+    """
+
+    CHUNK_SPAN = 4096
+    _ARRAY = 0
+    _BITMAP = 1
+    _BITMAP_BYTES = CHUNK_SPAN // 8
+
+    @classmethod
+    def chunk_of(cls, doc_id: int) -> int:
+        return doc_id // cls.CHUNK_SPAN
+
+    @staticmethod
+    def encode_varint_deltas(ids: Iterable[int], base: int = 0) -> bytes:
+        out = bytearray()
+        prev = base
+        for x in ids:
+            delta = x - prev
+            prev = x
+            while delta >= 0x80:
+                out.append((delta & 0x7F) | 0x80)
+                delta >>= 7
+            out.append(delta)
+        return bytes(out)
+
+    @staticmethod
+    def decode_varint_deltas(data: bytes, base: int = 0, start: int = 0) -> List[int]:
+        out = []
+        prev = base
+        value = shift = 0
+        for i in range(start, len(data)):
+            b = data[i]
+            value |= (b & 0x7F) << shift
+            if b & 0x80:
+                shift += 7
+                continue
+            prev += value
+            out.append(prev)
+            value = shift = 0
+        return out
+
+    @classmethod
+    def encode_chunk(cls, chunk: int, ids: List[int]) -> bytes:
+        """`ids` deben estar ordenados, sin duplicados y dentro del rango del bucket."""
+        base = chunk * cls.CHUNK_SPAN
+        # La base es base-1 para que el primer delta nunca sea negativo ni ambiguo.
+        array = cls.encode_varint_deltas(ids, base - 1)
+        if len(array) < cls._BITMAP_BYTES:
+            return bytes([cls._ARRAY]) + array
+        bitmap = bytearray(cls._BITMAP_BYTES)
+        for x in ids:
+            off = x - base
+            bitmap[off >> 3] |= 1 << (off & 7)
+        return bytes([cls._BITMAP]) + bytes(bitmap)
+
+    @classmethod
+    def decode_chunk(cls, chunk: int, data: bytes) -> List[int]:
+        if not data:
+            return []
+        base = chunk * cls.CHUNK_SPAN
+        if data[0] == cls._ARRAY:
+            return cls.decode_varint_deltas(data, base - 1, start=1)
+        out = []
+        for i in range(1, len(data)):
+            byte = data[i]
+            if not byte:
+                continue
+            off = base + ((i - 1) << 3)
+            for bit in range(8):
+                if byte & (1 << bit):
+                    out.append(off + bit)
+        return out
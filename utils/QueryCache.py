@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+MISS = object()
+
+
+class QueryCache:
+    """
+    Caché LRU acotada por número de entradas y con TTL opcional.
+
+    Cada entrada se guarda junto a la generación del índice en la que se
+    calculó; bump_generation() invalida de golpe todo lo anterior (lo llaman
+    las operaciones de escritura del repositorio al terminar de escribir).
+    Quien lee del índice para rellenar la caché debe tomar `generation` antes
+    de leer y pasarla a put(): si hubo una escritura entretanto, el valor se
+    descarta. Es segura entre hilos.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        ttl_seconds: Optional[float] = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds if ttl_seconds and ttl_seconds > 0 else None
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, Tuple[Any, float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISS
+            value, stored_at, generation = entry
+            if generation != self.generation or (
+                self.ttl_seconds is not None and self._clock() - stored_at > self.ttl_seconds
+            ):
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISS
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key: Hashable) -> Any:
+        # Consulta sin tocar estadísticas ni el orden LRU
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[2] != self.generation:
+                return MISS
+            if self.ttl_seconds is not None and self._clock() - entry[1] > self.ttl_seconds:
+                return MISS
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, generation: Optional[int] = None) -> bool:
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+            self._data[key] = (value, self._clock(), self.generation)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def bump_generation(self) -> int:
+        with self._lock:
+            self.generation += 1
+            self.invalidations += len(self._data)
+            self._data.clear()
+            return self.generation
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "generation": self.generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
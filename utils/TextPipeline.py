@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Iterable, Iterator, Tuple
+
+from nltk.stem import PorterStemmer
+
+from utils.DatalakePack import read_location
+from utils.Metrics import METRICS
+
+# Tramos de caracteres de palabra que no son dígitos ni '_': equivale a los
+# pasos sub(r"[^\w\s]") + sub(r"\d+") + sub("_") + split del normalizador original.
+_RX_WORD = re.compile(r"[^\W\d_]+")
+_RX_ASCII_WORD = re.compile(r"[a-z]+")
+
+
+class TextPipeline:
+    """
+    Normalización, tokenización, filtrado de stopwords y stemming de texto.
+
+    No guarda conexiones ni recursos externos, de modo que puede enviarse a
+    procesos worker (ProcessPoolExecutor) para tokenizar libros en paralelo.
+    Los stems se memorizan en una caché acotada que puede persistirse en disco
+    (stem_cache_path) y reutilizarse entre ejecuciones.
+    """
+
+    def __init__(
+        self,
+        stopwords: Optional[Iterable[str]] = None,
+        use_stemming: bool = True,
+        stem_cache_path: Optional[str] = None,
+        stem_cache_size: int = 200_000,
+    ) -> None:
+        self.stopwords = set(stopwords) if stopwords else set()
+        self.use_stemming = use_stemming
+        self.stemmer = PorterStemmer() if use_stemming else None
+        self.stem_cache_path = Path(stem_cache_path) if stem_cache_path else None
+        self.stem_cache_size = max(0, int(stem_cache_size))
+        self._stem_cache: Dict[str, str] = self._load_stem_cache()
+        self._stem_cache_dirty = False
+        # Solo en workers: stems añadidos desde el último take_new_stems()
+        self._new_stems: Optional[Dict[str, str]] = None
+
+    @staticmethod
+    def load_stopwords(path: Optional[str]) -> set:
+        try:
+            if path:
+                return {line.strip().lower() for line in open(path, "r", encoding="utf-8").read().splitlines() if
+                        line.strip()}
+            else:
+                import nltk
+                from nltk.corpus import stopwords
+                nltk.download("stopwords", quiet=True)
+                return set(stopwords.words("english"))
+        except Exception as e:
+            print(f"[WARN] No se pudieron cargar las stopwords ({e}), usando conjunto vacío.")
+            return set()
+
+    def tokenize(self, s: str) -> List[str]:
+        if s.isascii():
+            return _RX_ASCII_WORD.findall(s.lower())
+        s = unicodedata.normalize("NFKD", s.lower())
+        s = "".join(ch for ch in s if not unicodedata.combining(ch))
+        return [t for t in _RX_WORD.findall(s) if t.isalpha()]
+
+    def stem_token(self, token: str) -> str:
+        if not self.stemmer:
+            return token
+        stem = self._stem_cache.get(token)
+        if stem is None:
+            stem = self.stemmer.stem(token)
+            self._remember_stem(token, stem)
+            if self._new_stems is not None:
+                self._new_stems[token] = stem
+        return stem
+
+    def merge_stems(self, stems: Dict[str, str]) -> None:
+        """Incorpora stems calculados en otro proceso para que save_stem_cache() los persista."""
+        if not self.stemmer:
+            return
+        for token, stem in stems.items():
+            if token not in self._stem_cache:
+                self._remember_stem(token, stem)
+
+    def take_new_stems(self) -> Dict[str, str]:
+        new, self._new_stems = self._new_stems or {}, {}
+        return new
+
+    def _remember_stem(self, token: str, stem: str) -> None:
+        if not self.stem_cache_size:
+            return
+        if len(self._stem_cache) >= self.stem_cache_size:
+            # FIFO: se descarta la entrada más antigua (orden de inserción del dict)
+            del self._stem_cache[next(iter(self._stem_cache))]
+        self._stem_cache[token] = stem
+        self._stem_cache_dirty = True
+
+    def term_for(self, token: str) -> Optional[str]:
+        if len(token) < 3 or token in self.stopwords:
+            return None
+        t = self.stem_token(token)
+        if len(t) < 3 or t in self.stopwords:
+            return None
+        return t
+
+    def pipeline_tokens(self, raw: str) -> List[str]:
+        # Mismo token -> mismo término, así que basta con procesar los tokens únicos
+        # en orden de primera aparición para conservar el orden del resultado.
+        with METRICS.timer("text.tokenize"):
+            tokens = self.tokenize(raw)
+            unique = dict.fromkeys(tokens)
+        terms: Dict[str, None] = {}
+        with METRICS.timer("text.filter_stem"):
+            for tok in unique:
+                t = self.term_for(tok)
+                if t is not None:
+                    terms[t] = None
+        METRICS.inc("text.tokens", len(tokens))
+        METRICS.inc("text.terms", len(terms))
+        return list(terms)
+
+    def pipeline_single_token(self, term: str) -> Optional[str]:
+        toks = self.tokenize(term)
+        if not toks:
+            return None
+        return self.term_for(toks[0])
+
+    def save_stem_cache(self) -> None:
+        if not self.stem_cache_path or not self._stem_cache_dirty:
+            return
+        self.stem_cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.stem_cache_path.with_suffix(self.stem_cache_path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._stem_cache, f, ensure_ascii=False)
+        os.replace(tmp, self.stem_cache_path)
+        self._stem_cache_dirty = False
+
+    def _load_stem_cache(self) -> Dict[str, str]:
+        if not self.stemmer or not self.stem_cache_path or not self.stem_cache_path.exists():
+            return {}
+        try:
+            data = json.loads(self.stem_cache_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"[WARN] No se pudo cargar la caché de stems ({e}), se empieza vacía.")
+            return {}
+        items = list(data.items())
+        if self.stem_cache_size:
+            items = items[-self.stem_cache_size:]
+        else:
+            items = []
+        return dict(items)
+
+
+_worker_pipeline: Optional[TextPipeline] = None
+
+
+def init_tokenizer_worker(stopwords: set, use_stemming: bool,
+                          stem_cache_path: Optional[Path], stem_cache_size: int) -> None:
+    global _worker_pipeline
+    _worker_pipeline = TextPipeline(stopwords, use_stemming, stem_cache_path, stem_cache_size)
+    _worker_pipeline._new_stems = {}
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def tokenize_book_worker(item: Tuple) -> Tuple[int, Optional[List[str]], Optional[str]]:
+    """
+    item = (book_id, ubicación del cuerpo[, hash conocido]). Devuelve (book_id,
+    términos, hash del texto); términos es None si no hay cuerpo o si el
+    hash coincide con el conocido (libro sin cambios).
+    """
+    bid, path = item[0], item[1]
+    known = item[2] if len(item) > 2 else None
+    if not path:
+        return bid, None, None
+    text = read_location(path)
+    digest = content_hash(text)
+    if digest == known:
+        return bid, None, digest
+    return bid, _worker_pipeline.pipeline_tokens(text) if text else [], digest
+
+
+def _tokenize_book_reporting_stems(item: Tuple) -> Tuple[Tuple[int, Optional[List[str]], Optional[str]], Dict[str, str]]:
+    return tokenize_book_worker(item), _worker_pipeline.take_new_stems()
+
+
+def tokenize_books_parallel(
+    pipeline: TextPipeline, items: Iterable[Tuple], workers: int, chunksize: int = 4
+) -> Iterator[Tuple[int, Optional[List[str]], Optional[str]]]:
+    """
+    Aplica tokenize_book_worker a items en un pool de procesos configurado como
+    `pipeline`, conservando el orden. Cada resultado trae los stems nuevos de
+    su worker, que se fusionan en `pipeline`: tras consumir el iterador,
+    pipeline.save_stem_cache() persiste también lo aprendido en paralelo.
+    """
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_tokenizer_worker,
+        initargs=(pipeline.stopwords, pipeline.use_stemming, pipeline.stem_cache_path, pipeline.stem_cache_size),
+    ) as pool:
+        for result, stems in pool.map(_tokenize_book_reporting_stems, items, chunksize=chunksize):
+            if stems:
+                pipeline.merge_stems(stems)
+            yield result